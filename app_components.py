@@ -1,6 +1,7 @@
 """
 contains all classes needed to run the app
 """
+import re
 from time import sleep
 from datetime import datetime
 from threading import Lock, Thread, Event
@@ -125,6 +126,166 @@ class TextAudioUI:
 #-------------------------------
 # Command and Input Processing Classes and Functions
 
+_OUTPUT_REF_PATTERN = re.compile(r'(\[FUNC\]|\[\s*[-+]?\d+\s*\])')    # '[FUNC]' or an input requirement value reference ('[#]')
+
+# compiled input requirement matchers (see `Command._compile_req()`)
+# each one checks a requirement against a `word_tools.TokenizedInput`, skipping the input items at the `used` positions,
+# and returns `(value, positions of the matched items)` if the requirement is found in the input, otherwise `None`
+# (a found falsy value, like a `0` number, still counts as not met, the same as everywhere else requirement values are checked)
+# `get_trigger_words()` returns words of which at least one must be in the input for the requirement to be met,
+# or `None` if it can be met without any particular word (ex: by a number), for indexing commands by their keywords
+
+class _WordMatcher:
+    __slots__ = ('word',)
+
+    def __init__(self, word:str):
+        self.word = word
+
+    def match(self, tokens:word_tools.TokenizedInput, used:set):
+        for i in tokens.positions.get(self.word, ()):
+            if i not in used:
+                return self.word, (i,)
+        return None
+
+    def get_trigger_words(self) -> frozenset|None:
+        return frozenset((self.word,))
+
+class _PhraseMatcher:
+    """a multi-word STR requirement (ex: 'shut down'), which must be in the input as consecutive words.
+    Uses the command's `word_tools.PhraseMatcher` of all its phrases, which only goes over the input once"""
+    __slots__ = ('phrase', 'phrase_matcher')
+
+    def __init__(self, phrase:str, phrase_matcher:word_tools.PhraseMatcher):
+        self.phrase = phrase
+        self.phrase_matcher = phrase_matcher
+
+    def match(self, tokens:word_tools.TokenizedInput, used:set):
+        for start, end, phrase in tokens.find_phrases(self.phrase_matcher):
+            if phrase == self.phrase and used.isdisjoint(range(start, end)):
+                return self.phrase, tuple(range(start, end))
+        return None
+
+    def get_trigger_words(self) -> frozenset|None:
+        return frozenset(self.phrase.lower().split()[:1])      # every word must be in the input, so the first one will do
+
+class _NumberMatcher:
+    __slots__ = ()
+
+    def match(self, tokens:word_tools.TokenizedInput, used:set):
+        for i in tokens.number_positions:
+            if i not in used:                       # only the first number counts
+                return tokens.items[i], (i,)
+        return None
+
+    def get_trigger_words(self) -> frozenset|None:
+        return None
+
+class _OpenMatcher:
+    __slots__ = ()
+
+    def match(self, tokens:word_tools.TokenizedInput, used:set):
+        return ('OPEN', ())                         # this will be processed outside of the matcher, so just return 'OPEN' as value
+
+    def get_trigger_words(self) -> frozenset|None:
+        return None
+
+class _NeverMatcher:
+    __slots__ = ()
+
+    def match(self, tokens:word_tools.TokenizedInput, used:set):
+        return None                                 # for 'TIME', which can't be matched yet
+
+    def get_trigger_words(self) -> frozenset|None:
+        return frozenset()
+
+class _AnyWordMatcher:
+    """an ANY requirement of only single words, which is rejected with one set check if none of its words are in the input"""
+    __slots__ = ('words', 'word_set')
+
+    def __init__(self, words:tuple):
+        self.words = words
+        self.word_set = frozenset(words)
+
+    def match(self, tokens:word_tools.TokenizedInput, used:set):
+        if self.word_set.isdisjoint(tokens.positions):
+            return None
+        for word in self.words:                     # the first word (in requirement order) which is in the input
+            for i in tokens.positions.get(word, ()):
+                if i not in used and word:
+                    return word, (i,)
+        return None
+
+    def get_trigger_words(self) -> frozenset|None:
+        return self.word_set
+
+class _AllWordMatcher:
+    """an ALL requirement of only single words, which is rejected with one set check if any of its words aren't in the input"""
+    __slots__ = ('words', 'word_set')
+
+    def __init__(self, words:tuple):
+        self.words = words
+        self.word_set = frozenset(words)
+
+    def match(self, tokens:word_tools.TokenizedInput, used:set):
+        if not self.word_set <= tokens.positions.keys():
+            return None
+        positions = []
+        for word in self.words:
+            i = next((i for i in tokens.positions[word] if i not in used), None)
+            if i is None or not word:
+                return None
+            positions.append(i)
+        return self.words, tuple(positions)
+
+    def get_trigger_words(self) -> frozenset|None:
+        return frozenset(self.words[:1])            # every word must be in the input, so any one of them will do
+
+class _AnyMatcher:
+    __slots__ = ('matchers',)
+
+    def __init__(self, matchers:tuple):
+        self.matchers = matchers
+
+    def match(self, tokens:word_tools.TokenizedInput, used:set):
+        for matcher in self.matchers:
+            result = matcher.match(tokens, used)
+            if result and result[0]:
+                return result                       # the first sub requirement which is met
+        return None
+
+    def get_trigger_words(self) -> frozenset|None:
+        words = set()
+        for matcher in self.matchers:
+            sub_words = matcher.get_trigger_words()
+            if sub_words is None:
+                return None
+            words.update(sub_words)
+        return frozenset(words)
+
+class _AllMatcher:
+    __slots__ = ('matchers',)
+
+    def __init__(self, matchers:tuple):
+        self.matchers = matchers
+
+    def match(self, tokens:word_tools.TokenizedInput, used:set):
+        values, positions = [], []
+        for matcher in self.matchers:
+            result = matcher.match(tokens, used)
+            if not (result and result[0]):
+                return None
+            values.append(result[0])
+            positions.extend(result[1])
+        return tuple(values), tuple(positions)
+
+    def get_trigger_words(self) -> frozenset|None:
+        # every sub requirement must be met, so the one with the fewest trigger words is the most selective
+        if not self.matchers:
+            return frozenset()
+        sub_words = [words for words in (matcher.get_trigger_words() for matcher in self.matchers) if words is not None]
+        return min(sub_words, key=len) if sub_words else None
+
+
 class Command:
     """
     A class to create command objects
@@ -145,6 +306,7 @@ class Command:
         The items will also be treated differently depending on their content:
         
         * a string of a single word - the input must contain this word
+        * a string of several words (ex: 'shut down') - the input must contain these words, one after the other
         * a string with value 'NUMBER' - the input must contain any number words (ex: 'one', 'twenty six', etc.)
         * a string with value 'TIME' - same as NUMBER, but with the addition of time words ('minute', 'day', etc.)
         * a string with value 'OPEN' - can be anything! an open ended message, rather than a specific limited requirement. This will always be checked for last, after all other requirements have been found.
@@ -193,6 +355,17 @@ class Command:
 
         self.keyword_input_vocab, self.all_input_vocab = self._get_input_req_words(input)
 
+        # the requirements, arg references and output message are compiled once here, so matching input and running the command
+        # doesn't need to walk the requirement tuples or parse the references again
+        # multi-word requirements (ex: 'shut down') are all found with one phrase matcher, which runs once per input
+        phrases = self._get_req_phrases(self.input)
+        self._phrase_matcher = word_tools.PhraseMatcher({phrase: (phrase,) for phrase in phrases}) if phrases else None
+        self._matchers = tuple(self._compile_req(req, self._phrase_matcher) for req in self.input)
+        # words of which at least one must be in the input for the keyword requirement to be met (`None` if it doesn't need any), see `CommandIndex`
+        self.keyword_trigger_words = self._matchers[0].get_trigger_words() if self._matchers else None
+        self._arg_refs = tuple(self._get_ref_index(arg) for arg in args)
+        self._output_parts = self._compile_output(output)
+
     #------
     # methods for getting/converting input-requirement data
 
@@ -204,7 +377,7 @@ class Command:
             val = None
             for i, sub_r in enumerate(req):                             # check through the multi-item requirement,
                 if isinstance(sub_r, set):                              # and if it contains a set,
-                    val = req.pop(i)[0]                                 # remove the set and isolate the value within it (with [0] index)
+                    val = next(iter(req.pop(i)))                        # remove the set and isolate the value within it
                     break                                               # break for loop once set is found (there should only ever be one set! any other's will be ignored)
             # further convert any nested requirements, then return these as overall content
             cont = tuple(Command._get_req_data(sub_r) for sub_r in req if not isinstance(sub_r, set))
@@ -217,7 +390,7 @@ class Command:
             cont, val = process_multi_req(list(req))
             return ('ANY', cont, val)
         elif isinstance(req, list):                                     # lists represent ALL type
-            cont, val = process_multi_req(req)
+            cont, val = process_multi_req(list(req))
             return ('ALL', cont, val)
         else:                                                           # single string type
             return ('STR', req, None)
@@ -250,54 +423,91 @@ class Command:
         # remove duplicate words (by turning into set), and join into single string
         return ' '.join(set(keywords)), ' '.join(set(words))
 
-    #------
-    # methods for checking user input against input requirements
+    @staticmethod
+    def _is_phrase(req_content) -> bool:
+        """check if a STR requirement is a phrase of several words"""
+        return isinstance(req_content, str) and len(req_content.split()) > 1
 
     @staticmethod
-    # this is used solely for get_req_value methods below
-    def _get_input_req_value(req_type:str, req_content:str|tuple|list, u_in_items:list[str|int|float]):
-        """Get the value of a single input requirement based its type and content, if it is matched in list of user input items"""
+    def _get_req_phrases(reqs:tuple) -> list[str]:
+        """get every multi-word STR requirement, including nested ones"""
+        phrases = []
+        for req_type, req_content, _ in reqs:
+            if req_type == 'STR' and Command._is_phrase(req_content):
+                phrases.append(req_content)
+            elif req_type in ('ANY', 'ALL'):
+                phrases.extend(Command._get_req_phrases(req_content))
+        return phrases
 
+    @staticmethod
+    def _compile_req(req:tuple, phrase_matcher:word_tools.PhraseMatcher=None):
+        """convert a `(type, content, value)` requirement into a matcher object (nested requirements become nested matchers).
+        ANY and ALL requirements of only single words become word set matchers"""
+        req_type, req_content, _ = req
         if req_type == 'STR':
-            return req_content if req_content in u_in_items else None
+            if Command._is_phrase(req_content):
+                return _PhraseMatcher(req_content, phrase_matcher)
+            return _WordMatcher(req_content)
         elif req_type == 'NUMBER':
-            nums = tuple(x for x in u_in_items if (isinstance(x, int) or isinstance(x, float)))
-            return nums[0] if nums else None        # only return the first instance of a number
-        #elif req_type == 'TIME':
-        #    times = tuple(x for x in u_in_items if isinstance(x, ,,,))
-        #    return times[0] if times else None     # only return the first instance of a time
+            return _NumberMatcher()
         elif req_type == 'OPEN':
-            return 'OPEN'                           # this will be processed outside of this method, so just return 'OPEN' as value
-        elif req_type == 'ANY':
-            for sub_req in req_content:
-                sub_val = Command._get_input_req_value(sub_req[0], sub_req[1], u_in_items)  # sub_req[0] and sub_req[1] is type and content respectively
-                if sub_val:
-                    return sub_val                  # return the first sub requirement which is met
-        elif req_type == 'ALL':
-            sub_vals = tuple(Command._get_input_req_value(sub_req[0], sub_req[1], u_in_items) for sub_req in req_content)
-            return sub_vals if all(sub_vals) else None
-
-    def get_keyword_req_value(self, user_input:str) -> tuple:
+            return _OpenMatcher()
+        elif req_type in ('ANY', 'ALL'):
+            if all(sub_req[0] == 'STR' and not Command._is_phrase(sub_req[1]) for sub_req in req_content):
+                words = tuple(sub_req[1] for sub_req in req_content)
+                return _AnyWordMatcher(words) if req_type == 'ANY' else _AllWordMatcher(words)
+            matchers = tuple(Command._compile_req(sub_req, phrase_matcher) for sub_req in req_content)
+            return _AnyMatcher(matchers) if req_type == 'ANY' else _AllMatcher(matchers)
+        return _NeverMatcher()                      # 'TIME' (not supported yet)
+
+    @staticmethod
+    def _get_ref_index(x) -> int|None:
+        """get the index number from a string referencing one of the input requirement values ('[#]'), or `None` if it isn't one"""
+        if isinstance(x, str) and x.startswith('[') and x.endswith(']'):
+            try:
+                return int(x[1:-1])
+            except ValueError:
+                pass
+        return None
+
+    @staticmethod
+    def _compile_output(output:str) -> tuple:
+        """split the output message into its literal text, '[FUNC]' references (`None`), and input requirement value references (index number)"""
+        parts = []
+        for part in _OUTPUT_REF_PATTERN.split(output):               # the split keeps the references, since the pattern is a group
+            if part == '[FUNC]':
+                parts.append(None)
+            elif _OUTPUT_REF_PATTERN.fullmatch(part):
+                parts.append(int(part[1:-1]))
+            elif part:
+                parts.append(part)
+        return tuple(parts)
+
+    #------
+    # methods for checking user input against input requirements
+
+    @staticmethod
+    def _get_input_tokens(user_input:str|word_tools.TokenizedInput) -> word_tools.TokenizedInput:
+        if isinstance(user_input, word_tools.TokenizedInput):
+            return user_input
+        return word_tools.tokenize_input(user_input)                # index all words, numbers, times in user input (cached per message)
+
+    def get_keyword_req_value(self, user_input:str|word_tools.TokenizedInput) -> tuple:
         """returns a tuple of values for command's keyword input requirement, based on user input"""
-        user_input_items = word_tools.get_words_only(user_input)            # get a list with all words or numbers in user input
-        keyword_req = self.input[0]                                         # keyword req is first item (input[0])
-        return self._get_input_req_value(keyword_req[0], keyword_req[1], user_input_items)   # [0] is req type, [1] is content
+        result = self._matchers[0].match(self._get_input_tokens(user_input), frozenset())   # keyword req is first item (input[0])
+        return result[0] if result else None
 
-    def get_all_req_values(self, user_input:str) -> list:
+    def get_all_req_values(self, user_input:str|word_tools.TokenizedInput) -> list:
         """returns a tuple of values for all command's input requirements, based on user input"""
-        user_input_items = word_tools.get_words_only(user_input)            # get a list with all words, numbers, times in user input
+        tokens = self._get_input_tokens(user_input)
+        used = set()                                                        # positions of input items already matched by a requirement
         req_values = []
 
-        for req in self.input:
-            value = self._get_input_req_value(req[0], req[1], user_input_items) # get value of req based on user input items
-            # `sub_req[0]` and `sub_req[1]` is type and content respectively
-            if value:                                                       # if a value is returned (a user input item which met the requirement),
-                if req[0] in ('STR', 'NUMBER', 'TIME', 'ANY'):              # and it's any type except 'ALL' or 'OPEN', then remove the matched item from user_input_items
-                    user_input_items.remove(value)
-                elif req[0] == 'ALL':                                       # otherwise if type is `ALL` (several items must've been matched), 
-                    for sub_val in value:                                   # then remove each item from user_input_items
-                        user_input_items.remove(sub_val)
-
+        for req, matcher in zip(self.input, self._matchers):
+            result = matcher.match(tokens, used)                            # get value of req based on the input items that are left
+            value = result[0] if result else None
+            if value:                                                       # if a value is returned (user input items which met the requirement),
+                used.update(result[1])                                      # then the matched items can't be used by any other requirement
                 value = req[2] if req[2] else value                         # if a value (req[2]) was manually set in the requirement, then use that value instead
 
             req_values.append(value)                                        # add value to req_values (regardless if it was a match or not)
@@ -311,26 +521,79 @@ class Command:
 
         return req_values
 
+    #------
+    # methods for running the command
+
+    def get_args(self, input_req_values:tuple) -> tuple:
+        """get the args to pass to the function, with the input requirement value references ('[#]') replaced by the values"""
+        args = []
+        for arg, index in zip(self.args, self._arg_refs):
+            if index is not None and -len(input_req_values) <= index < len(input_req_values):
+                arg = input_req_values[index]
+            args.append(arg)
+        return tuple(args)
+
+    def get_output(self, input_req_values:tuple, func_result) -> str:
+        """get the output message, with '[FUNC]' replaced by the function result and any '[#]' replaced by the input requirement values"""
+        parts = []
+        for part in self._output_parts:
+            if part is None:
+                part = func_result
+            elif isinstance(part, int):
+                part = input_req_values[part] if -len(input_req_values) <= part < len(input_req_values) else f'[{part}]'
+            parts.append(str(part))
+        return ''.join(parts)
+
+
+class CommandIndex:
+    """
+    An inverted index from keyword to the commands whose keyword requirement (their first input requirement) needs it,
+    so only commands whose keyword requirement can be met by an input need to be checked against it.
+    Commands with a keyword requirement which doesn't need any particular word (ex: 'NUMBER') are always candidates.
+    """
+    def __init__(self, commands:list[Command]):
+        self._commands = {}                             # {keyword: [commands]}
+        self._unindexed = []                            # commands which are candidates for every input
+        self._order = {}                                # {id(command): position in `commands`}, so candidates keep their priority
+        for i, command in enumerate(commands):
+            self._order[id(command)] = i
+            keywords = command.keyword_trigger_words
+            if keywords is None:
+                self._unindexed.append(command)
+            for keyword in keywords or ():
+                self._commands.setdefault(keyword, []).append(command)
+
+    def get_candidates(self, input_tokens:word_tools.TokenizedInput) -> list[Command]:
+        """get the commands whose keyword requirement could be met by the input, in the order the commands were given"""
+        candidates = {id(command): command for command in self._unindexed}
+        for item in input_tokens.positions:
+            for command in self._commands.get(item, ()):
+                candidates[id(command)] = command
+        return [candidates[key] for key in sorted(candidates, key=self._order.__getitem__)]
+
 
 #-------------------------------
 # Core helper classes
 
 class _VoiceInputCommandProcessor:
-    def __init__(self, UI:TextAudioUI, commands:list[Command], wakewords:str):
+    def __init__(self, UI:TextAudioUI, commands:list[Command], command_index:CommandIndex, wakewords:str):
         self._UI = UI
         self._transcriber = stt.Transcriber()
         self._wake_timer = time_tools.Timer(5, self._wake_stop)         # keeps track of wakfulness in real time
         
         self._wakewords = wakewords
         self.commands = commands
+        self._command_index = command_index                             # commands by keyword, so only commands with a matched keyword are checked
         self._all_command_keywords = self._generate_command_keywords()  # all command keywords - used for transcriber vocabulary
         
         self._current_input = []                                        # all of the current input for a single cycle
         self._current_command = None                                    # the name of command whose keywords have been matched
+        self._current_input_text = None                                 # (current_command, joined text of current input), until the input or its transcriptions change
 
     #---------
 
     def _add_to_current_input(self, input_audio:bytes):
+        self._current_input_text = None
         self._current_input.append(
             {
                 'audio':    input_audio,
@@ -343,6 +606,7 @@ class _VoiceInputCommandProcessor:
         """resets current input cycle"""
         self._current_input.clear()
         self._current_command = None
+        self._current_input_text = None
     
     #---------
     # methods for wake word functionality
@@ -389,6 +653,7 @@ class _VoiceInputCommandProcessor:
             if not self._current_command and not phrase['text1']:
                 text = self._transcriber.transcribe(phrase['audio'], self._all_command_keywords)
                 phrase['text1'] = text if text else '_'
+                self._current_input_text = None
             # but if a command has been found, then transcribe it using the current_command's input requirements as vocabulary
             elif self._current_command and not phrase['text2']:
                 if 'OPEN' in (req[0] for req in self._current_command.input):   # this checks if current command contains any input requirements with the type ([0]) 'OPEN'
@@ -396,13 +661,22 @@ class _VoiceInputCommandProcessor:
                 else:
                     text = self._transcriber.transcribe(phrase['audio'], self._current_command.all_input_vocab)
                 phrase['text2'] = text if text else '_'
+                self._current_input_text = None
 
     #---------
     # general accessible functions
 
     def get_current_input_text(self) -> str:
-        t_key = 'text2' if self._current_command else 'text1'
-        return ' '.join(phrase[t_key] + ',' for phrase in self._current_input if phrase[t_key])
+        # the text depends on whether a command was found yet, so that's kept along with it
+        if self._current_input_text is None or self._current_input_text[0] is not self._current_command:
+            t_key = 'text2' if self._current_command else 'text1'
+            text = ' '.join(phrase[t_key] + ',' for phrase in self._current_input if phrase[t_key])
+            self._current_input_text = (self._current_command, text)
+        return self._current_input_text[1]
+
+    def get_current_input_tokens(self) -> word_tools.TokenizedInput:
+        """get the current input text's tokens, which are shared with every command checking it"""
+        return word_tools.tokenize_input(self.get_current_input_text())
 
     
     def check_input_get_command_and_values(self, input_audio:bytes) -> tuple[Command, tuple]:
@@ -411,19 +685,20 @@ class _VoiceInputCommandProcessor:
         """
         self._add_to_current_input(input_audio)         # add input to current audio
         self._transcribe_current_input_audio()          # transcribe ALL current audio (either with just keywords, or with current_command vocab)
-        input_text = self.get_current_input_text()
+        input_tokens = self.get_current_input_tokens()  # tokenized once, and then checked against every candidate command
         
         com, req_vals = None, None
 
         def check_all_reqs(command:Command):
-            input_req_values = command.get_all_req_values(input_text)
+            input_req_values = command.get_all_req_values(input_tokens)
             if all(input_req_values):
                 self._wake_stop()                       # turn off wake timer, so no new audio phrase input can be accepted again without using the wakeword + reset input cycle values
                 return command, input_req_values
+            return None, None                           # keep waiting for more input within the wake timeout
 
         if not self._current_command:                   # first check if current_input text matches a command's keyword input requirements
-            for command in self.commands:
-                if command.get_keyword_req_value(input_text):
+            for command in self._command_index.get_candidates(input_tokens):
+                if command.get_keyword_req_value(input_tokens):
                     self._current_command = command     # set current_command to the command whose keyword requirement was matched
                     com, req_vals = check_all_reqs(command)     # then check current_command's requirements
                     break
@@ -445,9 +720,10 @@ class AppCore:
         self._active = False
         self._commands = commands 
         self._prep_commands()
+        self._command_index = CommandIndex(self._commands)              # built once, and shared with the voice input processor
 
         self._UI = TextAudioUI()
-        self._vox_proc = _VoiceInputCommandProcessor(self._UI, self._commands, 'computer')
+        self._vox_proc = _VoiceInputCommandProcessor(self._UI, self._commands, self._command_index, 'computer')
 
     #---------
     # methods for internal command actions
@@ -477,8 +753,9 @@ class AppCore:
 #NOTE >>> THIS CURRENT WON'T WORK IF NUMBERS ARE TYPED, etc. - must be adjusted to handle pure text input, not voice transcription text
     def _get_command_from_text_input(self, user_input:str) -> tuple[Command, tuple]:
         """return a command and its input requirement values if user_input matches all of a command's input requirements"""
-        for command in self._commands:
-            input_req_values = command.get_all_req_values(user_input)
+        input_tokens = word_tools.tokenize_input(user_input)              # tokenized once, and then checked against every candidate command
+        for command in self._command_index.get_candidates(input_tokens):
+            input_req_values = command.get_all_req_values(input_tokens)
             if all(input_req_values):
                 return command, input_req_values
         return None, None
@@ -491,35 +768,11 @@ class AppCore:
 
     def _generate_command_action(self, command:Command, input_req_values:tuple):
         """generates and returns a command action from the provided input-requirement-values"""
-        
-        def convert_arg_ref_to_val(x):
-            """convert any string representing an index of one of the input requirement values into the value itself.
-            should always look like: '[#]', where '#' is the index number"""
-            try:
-                assert x.startswith('[') and x.endswith(']')        # make sure that the string starts and ends with sqaure brackets
-                return input_req_values[int(x[1:-1])]               # get to the string inbetween the sqaure brackets and convert it to an integer, then use that to index input_req_values for the corresponding value           
-            except:
-                return x
-
-        def convert_mes_ref_to_val(mes:str, func_result) -> str:
-            """convert any reffernces in the output string into the actual req values"""
-            mes = mes.replace('[FUNC]', str(func_result))           # first convert any function result reffernces ('[FUNC]') to the actual function result
-            while True:                                             # then convert any input_req_value refferences ('[n]') into actual values
-                try:
-                    ia = mes.index('[')                             # find index of first left sqaure bracket
-                    ib = mes.index(']')                             # find index of first right sqaure bracket
-                    mes = mes.replace(mes[ia:ib+1], input_req_values[int(mes[ia+1:ib])])
-                    # ^ replace the index refference substring (both sqaure brackets and everything inbetween),
-                    # with the corresponding value at the input_req_values index (the number in between the sqaure brackets)
-                except:
-                    break
-            return mes
-            
-        # generate the action function
+        # generate the action function (the arg and output references were already parsed when the command was created)
         def action():
-            result = command.func(*(convert_arg_ref_to_val(arg) for arg in command.args)) if command.args else command.func()
+            result = command.func(*command.get_args(input_req_values)) if command.args else command.func()
             if command.output:
-                self._UI.nl_print(convert_mes_ref_to_val(command.output, result))
+                self._UI.nl_print(command.get_output(input_req_values, result))
 
         return action
     
@@ -1,4 +1,6 @@
+from collections import deque
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 #------------------------
 # Word maps
@@ -137,18 +139,70 @@ def get_keywords_str(*keys:str, all:bool=False):
         #keywords += ' '
     return keywords
 
+class PhraseMatcher:
+    """
+    An Aho-Corasick automaton over words, which finds every occurrence of any of its phrases (single or multi-word)
+    in a list of words with one pass over them, no matter how many phrases there are.
+    Phrases only match whole words, so 'app' isn't found in 'happy', and 'shut down' is found in 'shut down the app'.
+    Made from a `{key: (phrases,)}` map (like `KEYWORD_MAP`), and each match gives the key of the phrase which was found
+    """
+    def __init__(self, phrase_map:dict[str, tuple[str]]):
+        self._goto = [{}]                           # [{word: next state}] by state (state 0 is the start)
+        self._fail = [0]                            # [state to fall back to when the next word doesn't continue a phrase] by state
+        self._out = [()]                            # [((key, number of words), ...) of the phrases which end at the state] by state
+        for key, phrases in phrase_map.items():
+            for phrase in phrases:
+                words = phrase.lower().split()
+                if not words:
+                    continue
+                state = 0
+                for word in words:
+                    next_state = self._goto[state].get(word)
+                    if next_state is None:
+                        next_state = self._goto[state][word] = len(self._goto)
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._out.append(())
+                    state = next_state
+                if (key, len(words)) not in self._out[state]:   # a phrase listed twice is only found once
+                    self._out[state] += ((key, len(words)),)
+        # the failure state of each state is the longest phrase start that its words end with, found breadth first (shortest first)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(word, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]     # phrases which end inside this one
+
+    def find(self, words:list|tuple) -> list[tuple[int, int, str]]:
+        """get `(start index, end index, key)` of every phrase found in the words, in the order they end in"""
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+        state = 0
+        for i, word in enumerate(words):
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for key, length in out[state]:
+                matches.append((i + 1 - length, i + 1, key))
+        return matches
+
+    def find_keys(self, words:list|tuple) -> set[str]:
+        """get the keys of every phrase found in the words"""
+        return {key for _, _, key in self.find(words)}
+
+KEYWORD_MATCHER = PhraseMatcher(KEYWORD_MAP)
+
 # check if the specified keywords are present in text
 def match_keywords(keyword_keys:tuple, text:str):
     assert isinstance(keyword_keys, tuple)
-    match_count = 0
-    for key in keyword_keys:
-        keywords = KEYWORD_MAP.get(key)
-        for word in keywords:
-            if word in text.lower():
-                match_count += 1
-                break
+    found_keys = KEYWORD_MATCHER.find_keys(tokenize_input(text).items)     # every keyword group found in one pass over the words
     # only return True if each keyword group gets at least one match
-    if match_count >= len(keyword_keys):
+    if all(key in found_keys for key in keyword_keys):
         return True
 
 #------------------------
@@ -338,4 +392,40 @@ def get_words_only(message:str) -> list[str|int|float]:
     message_split = [remove_punctuation(w).lower() for w in message.split()]    # remove the punctuation and make all letter characters lowercase
     words_nums = convert_number_words(message_split)        # convert all number words into numbers (ints/floats)
     #words_nums_times = convert_time_words(words_nums)       # convert all time-related words/numbers into times ()
-    return words_nums #words_nums_times
\ No newline at end of file
+    return words_nums #words_nums_times
+
+TOKENIZE_CACHE_SIZE = 256                           # number of recent messages `tokenize_input()` keeps the tokens of
+
+class TokenizedInput:
+    """
+    The words and numbers of a user input message (from `get_words_only()`), indexed so input requirements
+    can be checked with dict lookups instead of scanning the whole list for every requirement.
+    Get one with `tokenize_input()`, which shares them between every command checking the same message, so they must not be changed
+    """
+    __slots__ = ('items', 'positions', 'number_positions', '_phrase_matches')
+
+    def __init__(self, items:list[str|int|float]):
+        self.items = tuple(items)
+        self._phrase_matches = {}                   # {PhraseMatcher: its matches in items}
+        self.positions = {}                         # {item: [index of each occurrence in items]} (equal numbers, like 1 and 1.0, share one entry)
+        self.number_positions = []                  # index of each number in items
+        for i, item in enumerate(self.items):
+            self.positions.setdefault(item, []).append(i)
+            if isinstance(item, (int, float)):
+                self.number_positions.append(i)
+
+    @classmethod
+    def from_text(cls, message:str) -> 'TokenizedInput':
+        return cls(get_words_only(message))
+
+    def find_phrases(self, matcher:PhraseMatcher) -> list[tuple[int, int, str]]:
+        """get the phrase matches of a `PhraseMatcher` in the items (see `PhraseMatcher.find()`), which are only found once per matcher"""
+        matches = self._phrase_matches.get(matcher)
+        if matches is None:
+            matches = self._phrase_matches[matcher] = matcher.find(self.items)
+        return matches
+
+@lru_cache(maxsize=TOKENIZE_CACHE_SIZE)
+def tokenize_input(message:str) -> TokenizedInput:
+    """get the tokenized input of a message, which is only worked out once for the same message (while it's one of the recent ones)"""
+    return TokenizedInput.from_text(message)
@@ -0,0 +1,127 @@
+"""
+asyncio facade for the node store.
+
+`AsyncNodes` wraps a `nodes.ReadWriteNodes` with awaitable methods,
+which run the blocking file I/O in a bounded thread pool instead of in the event loop:
+
+```
+nodes = AsyncNodes()
+id = await nodes.create_node('shopping list', content='eggs, milk')
+node = (await nodes.get_node(id))[id]
+async for score, id, node in nodes.iter_search_nodes('eggs'):
+    ...
+```
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+from itertools import islice
+from .nodes import ReadWriteNodes
+
+#-------------------------------
+
+class AsyncNodes:
+    """
+    Awaitable create/get/edit/delete/search of nodes, with every call run in a thread pool of up to `max_workers` threads.
+
+    Reads are coalesced: `get_node()` calls made at the same time (in the same event loop step) for nodes of the same shard
+    are read together in one thread pool job, and calls for a node that's already being read wait for that same read.
+    """
+    def __init__(self, nodes:ReadWriteNodes=None, max_workers:int=4):
+        self.nodes = nodes if nodes is not None else ReadWriteNodes()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='AsyncNodes')
+        self._reads = {}                # {node id: [futures of the calls waiting for the read in progress]}
+        self._queued_reads = {}         # {shard month: {node id: [futures]}} for reads which will start in the next event loop step
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """write any held writes (see `ReadWriteNodes.close()`), and shut down the thread pool"""
+        await self._run(self.nodes.close)
+        self._executor.shutdown(wait=True)
+
+    #---------
+    # helper methods
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _read_nodes(self, ids:list) -> dict:
+        nodes = {}
+        for id in ids:
+            nodes.update(self.nodes.get_node(id))
+        return nodes
+
+    def _start_shard_read(self, loop, shard:str):
+        """read every queued node of a shard in one thread pool job, and give each waiting call its own copy of its node"""
+        queued = self._queued_reads.pop(shard)
+        job = loop.run_in_executor(self._executor, self._read_nodes, list(queued))
+
+        def finish(job):
+            for id, futures in queued.items():
+                if self._reads.get(id) is futures:
+                    del self._reads[id]
+                for future in futures:
+                    if future.done():       # the call was cancelled
+                        continue
+                    if job.exception():
+                        future.set_exception(job.exception())
+                    else:
+                        # copied before any call gets its node, so changing one can't change the others
+                        future.set_result(deepcopy(job.result()[id]))
+
+        job.add_done_callback(finish)
+
+    def _forget_read(self, id:str):
+        """make later reads of a node start over, instead of waiting for a read from before it was written to"""
+        self._reads.pop(id, None)
+
+    #---------
+    # node methods
+
+    async def create_node(self, name:str, node_type:str='text', content:str='') -> str:
+        return await self._run(self.nodes.create_node, name, node_type, content)
+
+    async def get_node(self, id:str) -> dict:
+        loop = asyncio.get_running_loop()
+        futures = self._reads.get(id)
+        if futures is None:
+            futures = self._reads[id] = []
+            shard = id[:6]                  # ids start with their creation month, which is the shard (or shard parts) they're in
+            if shard not in self._queued_reads:
+                self._queued_reads[shard] = {}
+                loop.call_soon(self._start_shard_read, loop, shard)
+            self._queued_reads[shard][id] = futures
+        # every call waits on its own future, so a cancelled call doesn't cancel the read for everyone else
+        future = loop.create_future()
+        futures.append(future)
+        return {id: await future}
+
+    async def edit_node(self, id:str, content:dict):
+        self._forget_read(id)
+        await self._run(self.nodes.edit_node, id, content)
+
+    async def delete_node(self, id:str):
+        self._forget_read(id)
+        await self._run(self.nodes.delete_node, id)
+
+    async def search_nodes(self, search:str, limit:int=None) -> list[tuple[float, str, dict]]:
+        return await self._run(self.nodes.search_nodes, search, limit)
+
+    async def iter_search_nodes(self, search:str, chunk_size:int=16):
+        """async generator which yields `(score, id, node)` tuples from most to least relevant.
+        Matches are read `chunk_size` at a time in the thread pool, so stopping early skips reading the rest of them"""
+        results = self.nodes.iter_search_nodes(search)
+        while True:
+            chunk = await self._run(list, islice(results, chunk_size))
+            if not chunk:
+                return
+            for result in chunk:
+                yield result
+
+    async def flush(self) -> dict:
+        return await self._run(self.nodes.flush)
@@ -0,0 +1,206 @@
+"""
+benchmarks for the node store, run on a synthetic corpus of notes in a temporary storage folder.
+
+The corpus has realistic names and text content (words are picked with a Zipf-like distribution, like in real text),
+and a link graph where most nodes have a `supe` link to an older node, and some have `side` links.
+It's spread over monthly shard files, the same as years of notes would be.
+
+For each corpus size, the create, get, edit, delete and search operations are timed one call at a time,
+giving the throughput and p50/p99 latency of each, along with the time to open the store and the peak memory use
+(of the whole process, and with `--trace-memory`, of the Python allocations during the benchmark).
+Each size is run in a new process, so the process's peak memory is only that size's.
+Results are printed (or saved) as JSON, so runs can be compared with each other or between backends.
+
+`python -m program_scripts.node_benchmark --sizes 10000 100000 --ops 1000 --output results.json`
+"""
+import argparse
+import json
+import random
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import accumulate
+from multiprocessing import get_context
+from os import path
+from shutil import rmtree
+from time import perf_counter
+from .nodes import ReadWriteNodes, SHARD_FORMAT_EXTENSIONS
+from .sqlite_nodes import SQLiteNodes
+try:
+    import resource                 # only on unix
+except ImportError:
+    resource = None
+
+_VOCABULARY_SIZE = 5000
+_SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'shi', 'po', 'fe', 'da', 'gu', 'ven', 'tor', 'al', 'es', 'in', 'or', 'um')
+
+#-------------------------------
+# corpus generation
+
+def make_vocabulary(size:int=_VOCABULARY_SIZE, seed:int=0) -> list[str]:
+    """make `size` distinct made up words, from most to least common"""
+    rng = random.Random(seed)
+    words = {}
+    while len(words) < size:
+        words[''.join(rng.choices(_SYLLABLES, k=rng.randint(1, 4)))] = None
+    return list(words)
+
+def generate_corpus(count:int, months:int=12, seed:int=0):
+    """generator which yields `(id, node)` for `count` synthetic nodes, with ids spread over the last `months` months
+    (in creation order, so they can be written straight into monthly shard files)"""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(seed=seed)
+    cum_weights = list(accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))     # Zipf's law
+    now = datetime.now()
+    ids = []
+    per_month = -(-count // months)
+    for i in range(count):
+        months_ago = months - 1 - i // per_month
+        year, month = divmod(now.year * 12 + now.month - 1 - months_ago, 12)
+        id = f'{year:04}{month + 1:02}01{i:012}'       # the same 20 digits as a real creation time id
+        name = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(2, 8)))
+        content = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=int(rng.lognormvariate(4, 1)) + 1))
+        node = {'name': name, 'type': 'text', 'supe': [], 'side': [], 'sub': [], 'cont': content}
+        if ids and rng.random() < 0.7:
+            node['supe'].append(rng.choice(ids))
+        if ids and rng.random() < 0.2:
+            node['side'].extend(rng.sample(ids, min(len(ids), rng.randint(1, 3))))
+        ids.append(id)
+        yield id, node
+
+def write_corpus(storage_dir:str, count:int, months:int=12, seed:int=0, shard_format:str='json') -> list[str]:
+    """write a synthetic corpus of `count` nodes into monthly shard files in `storage_dir`, and return the node ids"""
+    shards = {}
+    for id, node in generate_corpus(count, months, seed):
+        shards.setdefault(id[:6], {})[id] = node
+    ids = []
+    for month, shard in shards.items():
+        with open(path.join(storage_dir, month + '_nodes' + SHARD_FORMAT_EXTENSIONS['json']), 'w', encoding='utf-8') as file:
+            json.dump(shard, file, indent=1)
+        ids.extend(shard)
+    if shard_format != 'json':
+        ReadWriteNodes(shard_format=shard_format, storage_dir=storage_dir).convert_shards(shard_format)
+    return ids
+
+#-------------------------------
+# timing
+
+def _percentile(sorted_times:list[float], percent:float) -> float:
+    return sorted_times[min(len(sorted_times) - 1, int(len(sorted_times) * percent / 100))]
+
+def _time_calls(func, args_list:list) -> dict:
+    """call `func` once for each args tuple, and return the throughput and latency stats (in milliseconds)"""
+    times = []
+    start = perf_counter()
+    for args in args_list:
+        call_start = perf_counter()
+        func(*args)
+        times.append(perf_counter() - call_start)
+    total = perf_counter() - start
+    times.sort()
+    return {
+        'calls': len(times),
+        'ops_per_sec': len(times) / total if total else 0.0,
+        'p50_ms': _percentile(times, 50) * 1000 if times else 0.0,
+        'p99_ms': _percentile(times, 99) * 1000 if times else 0.0,
+        'max_ms': times[-1] * 1000 if times else 0.0,
+    }
+
+def run_benchmark(size:int, ops:int=1000, backend:str='json', journal:bool=False, shard_format:str='json',
+                  months:int=12, seed:int=0, trace_memory:bool=False) -> dict:
+    """run every benchmark on a new synthetic corpus of `size` nodes, and return the results.
+    `backend` is `'json'` (`ReadWriteNodes`) or `'sqlite'` (`SQLiteNodes`).
+    `peak_rss_mb` is the peak of the whole process so far, so to only measure this run, run it in a new process"""
+    storage_dir = tempfile.mkdtemp(prefix='node_benchmark_')
+    rng = random.Random(seed + 1)
+    vocabulary = make_vocabulary(seed=seed)
+    results = {'size': size, 'ops': ops, 'backend': backend, 'journal': journal, 'shard_format': shard_format, 'months': months}
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        start = perf_counter()
+        if backend == 'sqlite':
+            ids = []
+            nodes = SQLiteNodes(path.join(storage_dir, 'nodes.db'))
+            nodes.import_nodes((ids.append(id) or (id, node)) for id, node in generate_corpus(size, months, seed))
+        else:
+            ids = write_corpus(storage_dir, size, months, seed, shard_format)
+        results['write_corpus_sec'] = perf_counter() - start
+
+        if backend != 'sqlite':
+            start = perf_counter()
+            # cold start, which indexes every shard
+            ReadWriteNodes(journal=journal, shard_format=shard_format, storage_dir=storage_dir).save_index()
+            results['cold_open_sec'] = perf_counter() - start
+            start = perf_counter()
+            nodes = ReadWriteNodes(journal=journal, shard_format=shard_format, storage_dir=storage_dir)
+            results['warm_open_sec'] = perf_counter() - start
+
+        created = []
+        def create(text):
+            created.append(nodes.create_node(text[:40], content=text))
+        texts = [' '.join(rng.choices(vocabulary, k=rng.randint(5, 50))) for _ in range(ops)]
+        results['create'] = _time_calls(create, [(text,) for text in texts])
+        ids.extend(created)
+
+        sample = rng.sample(ids, min(ops, len(ids)))
+        results['get'] = _time_calls(nodes.get_node, [(id,) for id in sample])
+
+        def edit(id):
+            node = nodes.get_node(id)[id]
+            node['cont'] = node['cont'] + ' edited'
+            nodes.edit_node(id, node)
+        results['edit'] = _time_calls(edit, [(id,) for id in sample])
+
+        queries = [' '.join(rng.sample(vocabulary[:1000], rng.randint(1, 3))) for _ in range(min(ops, 200))]
+        results['search'] = _time_calls(nodes.search_nodes, [(query, 10) for query in queries])
+
+        results['delete'] = _time_calls(nodes.delete_node, [(id,) for id in sample])
+
+        if backend == 'sqlite':
+            nodes.close()
+        else:
+            start = perf_counter()
+            nodes.compact()
+            results['compact_sec'] = perf_counter() - start
+        if trace_memory:
+            results['peak_traced_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        if resource:
+            results['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10      # in KiB on linux
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        rmtree(storage_dir, ignore_errors=True)
+    return results
+
+
+def main(argv:list=None) -> list[dict]:
+    parser = argparse.ArgumentParser(description='benchmark the node store on synthetic corpora')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000], help='corpus sizes (number of nodes)')
+    parser.add_argument('--ops', type=int, default=1000, help='number of timed calls of each operation')
+    parser.add_argument('--backend', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--journal', action='store_true', help='use journal mode')
+    parser.add_argument('--shard-format', choices=tuple(SHARD_FORMAT_EXTENSIONS), default='json')
+    parser.add_argument('--months', type=int, default=12, help='number of monthly shard files to spread the corpus over')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true', help='also trace peak Python memory use (which slows down every operation)')
+    parser.add_argument('--output', help='save the results to this JSON file (instead of printing them)')
+    args = parser.parse_args(argv)
+    results = []
+    for size in args.sizes:
+        # a new (spawned, not forked) process for each size, so its peak memory doesn't include the runs before it
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+            results.append(executor.submit(
+                run_benchmark, size, args.ops, args.backend, args.journal, args.shard_format, args.months, args.seed, args.trace_memory,
+            ).result())
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=1)
+    else:
+        print(json.dumps(results, indent=1))
+    return results
+
+
+if __name__ == "__main__":
+    main()
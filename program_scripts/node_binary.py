@@ -0,0 +1,174 @@
+"""
+compact binary shard format for nodes (`YYYYMM_nodes.bin`), an alternative to the JSON shard files.
+
+Layout (all integers are little-endian):
+* header: `b'SNNB'`, format version (u16), flags (u16, unused for now)
+* node records, each one: record length (u32), then the record:
+    * `_STD_NODE`: a node with exactly the standard fields (see `nodes.ReadWriteNodes.create_node()`),
+    where the id, type and link ids are stored once in the string table and referenced by their index (u32)
+    * `_RAW_NODE`: the id (string table index), and then the node as JSON (for anything that isn't a standard node)
+* string table: number of strings (u32), then for each string: length (u32) + utf-8 bytes
+* footer: byte offset of the string table (u64), number of nodes (u32)
+
+Converting between this and the JSON format is lossless (nodes keep their fields, field order and node order).
+"""
+import json
+import struct
+from mmap import mmap, ACCESS_READ
+from os import fsync, stat
+
+MAGIC = b'SNNB'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sHH')
+_FOOTER = struct.Struct('<QI')
+_U32 = struct.Struct('<I')
+_STD_NODE_HEAD = struct.Struct('<BII')          # record type, id index, type index
+
+_STD_NODE = 0
+_RAW_NODE = 1
+
+_STD_NODE_KEYS = ('name', 'type', 'supe', 'side', 'sub', 'cont')
+_LINK_TYPES = ('supe', 'side', 'sub')
+_CONT_STR = 0
+_CONT_JSON = 1
+
+#-------------------------------
+
+def is_std_node(node) -> bool:
+    """check if a node is a standard node (exactly the fields of `nodes.ReadWriteNodes.create_node()`, in that order,
+    with string name, type and link ids), which is stored as a `_STD_NODE` record"""
+    return (
+        isinstance(node, dict) and tuple(node) == _STD_NODE_KEYS
+        and isinstance(node['name'], str) and isinstance(node['type'], str)
+        and all(isinstance(node[kind], list) and all(isinstance(link, str) for link in node[kind]) for kind in _LINK_TYPES)
+    )
+
+#-------------------------------
+# helper functions
+
+def _pack_bytes(data:bytes) -> bytes:
+    return _U32.pack(len(data)) + data
+
+def _unpack_bytes(data, offset:int) -> tuple[bytes, int]:
+    length = _U32.unpack_from(data, offset)[0]
+    offset += _U32.size
+    return bytes(data[offset:offset + length]), offset + length
+
+def _check_header(data, filepath):
+    magic, version, _ = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(f'{filepath} is not a binary node shard')
+    if version > FORMAT_VERSION:
+        raise ValueError(f'{filepath} has binary shard format version {version}, but only up to {FORMAT_VERSION} is supported')
+
+#-------------------------------
+# writing
+
+def write_binary_shard(filepath, nodes, sync:bool=False) -> dict:
+    """write a stream of `(id, node)` pairs to a binary shard file,
+    and return `{id: [byte offset, byte length]}` of every node record in it"""
+    strings = {}                    # {string: index in the string table}
+
+    def intern(string:str) -> int:
+        index = strings.get(string)
+        if index is None:
+            index = strings[string] = len(strings)
+        return index
+
+    entries = {}
+    with open(filepath, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+        offset = _HEADER.size
+        for id, node in nodes:
+            if is_std_node(node):
+                cont = node['cont']
+                cont_tag, cont_data = (_CONT_STR, cont.encode('utf-8')) if isinstance(cont, str) else (_CONT_JSON, json.dumps(cont).encode('utf-8'))
+                parts = [_STD_NODE_HEAD.pack(_STD_NODE, intern(id), intern(node['type'])), _pack_bytes(node['name'].encode('utf-8'))]
+                for kind in _LINK_TYPES:
+                    links = node[kind]
+                    parts.append(struct.pack(f'<I{len(links)}I', len(links), *(intern(link) for link in links)))
+                parts.append(bytes((cont_tag,)) + _pack_bytes(cont_data))
+                record = b''.join(parts)
+            else:
+                record = struct.pack('<BI', _RAW_NODE, intern(id)) + json.dumps(node).encode('utf-8')
+            file.write(_U32.pack(len(record)) + record)
+            offset += _U32.size
+            entries[id] = [offset, len(record)]
+            offset += len(record)
+        # the string table and footer go at the end, so the nodes can be written as they're streamed in
+        file.write(_U32.pack(len(strings)))
+        for string in strings:
+            file.write(_pack_bytes(string.encode('utf-8')))
+        file.write(_FOOTER.pack(offset, len(entries)))
+        if sync:
+            file.flush()
+            fsync(file.fileno())
+    return entries
+
+#-------------------------------
+# reading
+
+def read_string_table(filepath) -> list[str]:
+    """read the string table of a binary shard file (needed to decode any of its node records)"""
+    with open(filepath, 'rb') as file:
+        _check_header(file.read(_HEADER.size), filepath)
+        file.seek(-_FOOTER.size, 2)
+        table_offset = _FOOTER.unpack(file.read(_FOOTER.size))[0]
+        file.seek(table_offset)
+        data = file.read()
+    return _decode_string_table(data, 0)
+
+def _decode_string_table(data, offset:int) -> list[str]:
+    count = _U32.unpack_from(data, offset)[0]
+    offset += _U32.size
+    strings = []
+    for _ in range(count):
+        string, offset = _unpack_bytes(data, offset)
+        strings.append(string.decode('utf-8'))
+    return strings
+
+def decode_node(record, strings:list[str]) -> tuple[str, dict]:
+    """decode a single node record into `(id, node)`"""
+    if record[0] == _RAW_NODE:
+        id_index = _U32.unpack_from(record, 1)[0]
+        return strings[id_index], json.loads(bytes(record[1 + _U32.size:]))
+    _, id_index, type_index = _STD_NODE_HEAD.unpack_from(record, 0)
+    name, offset = _unpack_bytes(record, _STD_NODE_HEAD.size)
+    node = {'name': name.decode('utf-8'), 'type': strings[type_index]}
+    for kind in _LINK_TYPES:
+        count = _U32.unpack_from(record, offset)[0]
+        offset += _U32.size
+        node[kind] = [strings[i] for i in struct.unpack_from(f'<{count}I', record, offset)]
+        offset += count * _U32.size
+    cont_tag = record[offset]
+    cont, _ = _unpack_bytes(record, offset + 1)
+    node['cont'] = cont.decode('utf-8') if cont_tag == _CONT_STR else json.loads(cont)
+    return strings[id_index], node
+
+def read_binary_node(filepath, offset:int, length:int, strings:list[str]) -> dict:
+    """read a single node record, at the byte offset and length from `write_binary_shard()` or `iter_binary_shard()`"""
+    with open(filepath, 'rb') as file:
+        file.seek(offset)
+        return decode_node(file.read(length), strings)[1]
+
+def iter_binary_shard(filepath, read_nodes:bool=False):
+    """generator which yields `(id, byte offset, byte length, node)` for every node in a binary shard file
+    (`node` is only decoded if `read_nodes` is `True`, otherwise it's `None`).
+    The file is memory-mapped, so only the string table and one node are in memory at a time"""
+    if not stat(filepath).st_size:
+        return
+    with open(filepath, 'rb') as file, mmap(file.fileno(), 0, access=ACCESS_READ) as data:
+        _check_header(data, filepath)
+        table_offset = _FOOTER.unpack_from(data, len(data) - _FOOTER.size)[0]
+        strings = _decode_string_table(data, table_offset)
+        offset = _HEADER.size
+        while offset < table_offset:
+            length = _U32.unpack_from(data, offset)[0]
+            offset += _U32.size
+            if read_nodes:
+                id, node = decode_node(data[offset:offset + length], strings)
+            else:
+                id, node = strings[_U32.unpack_from(data, offset + 1)[0]], None
+            yield id, offset, length, node
+            offset += length
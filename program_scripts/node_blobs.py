@@ -0,0 +1,72 @@
+"""
+content-addressed blob store, for keeping large node content out of the shard files.
+
+Each blob is stored in `blobs/<first 2 hex digits>/<sha256 hex digest>`, named by the hash of its content,
+so the same content is only ever stored once, and a blob file never changes once it's written.
+A node refers to a blob with `{'blob': digest, 'size': byte length}` as its `cont`.
+"""
+import hashlib
+from mmap import mmap, ACCESS_READ
+from os import path, listdir, makedirs, remove, replace, fsync
+from .node_locks import get_temp_path
+
+#-------------------------------
+
+def is_blob_ref(cont) -> bool:
+    """check if a node's `cont` is a reference to a blob"""
+    return isinstance(cont, dict) and len(cont) == 2 and isinstance(cont.get('blob'), str) and 'size' in cont
+
+
+class BlobStore:
+    """
+    Stores blobs of bytes by their hash in `directory`. Reads are memory-mapped, so only the parts of a blob that are used get read.
+    """
+    def __init__(self, directory:str):
+        self.directory = directory
+
+    def get_path(self, digest:str) -> str:
+        return path.join(self.directory, digest[:2], digest)
+
+    def put(self, data:bytes) -> str:
+        """store a blob (unless the same content is already stored), and return its digest.
+        The blob is synced to disk before this returns, so a node never refers to a blob that was lost"""
+        digest = hashlib.sha256(data).hexdigest()
+        filepath = self.get_path(digest)
+        if not path.isfile(filepath):
+            makedirs(path.dirname(filepath), exist_ok=True)
+            temp_path = get_temp_path(filepath)     # per thread, in case two threads (or processes) store the same content
+            with open(temp_path, 'wb') as file:
+                file.write(data)
+                file.flush()
+                fsync(file.fileno())
+            replace(temp_path, filepath)
+        return digest
+
+    def put_text(self, text:str) -> dict:
+        """store text as a blob, and return the reference to it for a node's `cont`"""
+        data = text.encode('utf-8')
+        return {'blob': self.put(data), 'size': len(data)}
+
+    def open(self, digest:str) -> mmap:
+        """memory-map a blob (read only). Use it as a context manager, or close it when done"""
+        with open(self.get_path(digest), 'rb') as file:
+            return mmap(file.fileno(), 0, access=ACCESS_READ)
+
+    def read_text(self, ref:dict) -> str:
+        """read the text of a blob reference"""
+        if not ref['size']:
+            return ''
+        with self.open(ref['blob']) as data:
+            return data[:].decode('utf-8')
+
+    def iter_digests(self):
+        """generator which yields the digest of every stored blob"""
+        if not path.isdir(self.directory):
+            return
+        for prefix in listdir(self.directory):
+            prefix_dir = path.join(self.directory, prefix)
+            if path.isdir(prefix_dir):
+                yield from (name for name in listdir(prefix_dir) if not name.endswith('.tmp'))
+
+    def remove(self, digest:str):
+        remove(self.get_path(digest))
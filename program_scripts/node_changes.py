@@ -0,0 +1,202 @@
+"""
+change feed for the node store: every create/edit/delete/restore gets an event with a sequence number which only ever increases.
+
+Events are appended to a JSON lines file, one line per event:
+`{"seq": 42, "op": "edit", "id": "20240105123456789012", "shard": "202401_nodes.json", "time": 1704455696.7}`
+so a reader which saved the `seq` of the last event it handled can pick up from there later (even after a restart),
+instead of re-reading every shard. A partly written last line (from an interrupted append) is skipped, and cut off by the next append. In the same process, `subscribe()` calls back on every event as it's written.
+
+```
+seq = load_saved_seq()
+for event in nodes.changes.iter_changes(seq):
+    update_view(event['id'])
+    seq = event['seq']
+```
+"""
+import json
+import logging
+from os import path, replace, truncate, fsync
+from threading import Lock, Condition
+from time import time
+from .node_locks import RWLock, get_temp_path
+
+_logger = logging.getLogger(__name__)
+
+#-------------------------------
+
+class ChangeFeed:
+    """
+    An append-only feed of node change events, which keeps the newest `max_events` (or all of them if `None`).
+    A reader asking for changes from before the oldest kept event gets a `ValueError`, and needs to re-read everything.
+    With a `lock_path`, other processes using the same feed file wait for each other to append or trim it (see `node_locks.py`).
+    """
+    def __init__(self, filepath:str, max_events:int=100_000, lock_path:str=None):
+        self.filepath = filepath
+        self.max_events = max_events
+        self._lock = Lock()
+        self._file_lock = RWLock(lock_path)     # held exclusively to append to or trim the file, and shared to read it
+        self._new_events = Condition(self._lock)
+        self._subscribers = []
+        self._first_seq = 1             # seq of the oldest kept event
+        self._last_seq = 0              # seq of the newest event (0 if there are none)
+        self._file_size = None          # size of the file as of the last read or append, to tell if another process appended to it
+        self._size = 0                  # size of its whole lines (all of it, unless its last line is only partly written)
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+
+    @property
+    def last_seq(self) -> int:
+        """the sequence number of the newest event, which is where a new reader can start from to only get new changes"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            return self._last_seq
+
+    #---------
+    # helper methods
+
+    def _read_line_at(self, file, offset:int) -> tuple[int, bytes]:
+        """get the first whole line starting at or after the byte `offset`, and the offset it starts at"""
+        if offset:
+            file.seek(offset - 1)
+            file.readline()                 # skip the rest of the line the offset is in (unless it's right at its start)
+        else:
+            file.seek(0)
+        start = file.tell()
+        return start, file.readline()
+
+    @staticmethod
+    def _find_end(file, size:int) -> int:
+        """get the byte offset after the last newline in the file"""
+        end = size
+        while end > 0:
+            start = max(0, end - 4096)
+            file.seek(start)
+            newline = file.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            end = start
+        return 0
+
+    def _refresh(self):
+        """re-read the first and last sequence numbers if the file changed since it was last read or appended to"""
+        file_size = path.getsize(self.filepath) if path.isfile(self.filepath) else 0
+        if file_size == self._file_size:
+            return
+        self._file_size = file_size
+        self._size = 0
+        if file_size:
+            with open(self.filepath, 'rb') as file:
+                self._size = self._find_end(file, file_size)
+                if self._size:
+                    file.seek(0)
+                    self._first_seq = json.loads(file.readline())['seq']
+                    # the last line is the last one before the end in the file's last few KB
+                    file.seek(max(0, self._size - 4096))
+                    self._last_seq = json.loads(file.read(self._size - file.tell()).splitlines()[-1])['seq']
+        if not self._size:
+            self._first_seq = self._last_seq + 1
+
+    def _find_offset(self, seq:int) -> int:
+        """get the byte offset of the first event after `seq`, with a binary search over the file's lines"""
+        with open(self.filepath, 'rb') as file:
+            low, high = 0, self._size
+            while low < high:
+                middle = (low + high) // 2
+                start, line = self._read_line_at(file, middle)
+                if start < self._size and json.loads(line)['seq'] <= seq:
+                    low = start + len(line)
+                else:
+                    high = middle
+            return self._read_line_at(file, low)[0]
+
+    def _trim(self):
+        """keep only the newest `max_events` events"""
+        offset = self._find_offset(self._last_seq - self.max_events)
+        temp_path = get_temp_path(self.filepath)
+        with open(self.filepath, 'rb') as file, open(temp_path, 'wb') as temp_file:
+            file.seek(offset)
+            while chunk := file.read(2**20):
+                temp_file.write(chunk)
+        replace(temp_path, self.filepath)
+        self._file_size = None
+        self._refresh()
+
+    #---------
+    # writing
+
+    def append(self, changes:list, sync:bool=False) -> list[dict]:
+        """add events for `(op, id, shard)` changes (in the order they were written), call the subscribers, and return the events"""
+        if not changes:
+            return []
+        with self._lock, self._file_lock.exclusive():
+            self._refresh()
+            now = time()
+            events = [
+                {'seq': self._last_seq + i, 'op': op, 'id': id, 'shard': shard, 'time': now}
+                for i, (op, id, shard) in enumerate(changes, 1)
+            ]
+            data = ''.join(json.dumps(event) + '\n' for event in events).encode('utf-8')
+            if self._file_size != self._size:
+                truncate(self.filepath, self._size)     # cut off a partly written last line, so the events start on a new line
+            with open(self.filepath, 'ab') as file:
+                file.write(data)
+                if sync:
+                    file.flush()
+                    fsync(file.fileno())
+            self._size += len(data)
+            self._file_size = self._size
+            self._last_seq = events[-1]['seq']
+            # trimmed once half again as many events as are kept, so it's only rewritten every `max_events / 2` events
+            if self.max_events is not None and self._last_seq - self._first_seq + 1 > self.max_events * 3 // 2:
+                self._trim()
+            self._new_events.notify_all()
+            subscribers = list(self._subscribers)
+        # the events are already written, so a failing subscriber is logged rather than failing the write
+        for callback in subscribers:
+            for event in events:
+                try:
+                    callback(event)
+                except Exception:
+                    _logger.exception('change feed subscriber %r failed on event %s', callback, event['seq'])
+        return events
+
+    #---------
+    # reading
+
+    def subscribe(self, callback):
+        """call `callback(event)` for every new event, in the thread which wrote it, right after it's written.
+        Callbacks should be quick (they hold up the write), and exceptions they raise are logged (the write has already happened)"""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def iter_changes(self, since:int=0, limit:int=None):
+        """generator which yields every event after the sequence number `since` (up to `limit` of them), from oldest to newest.
+        Raises `ValueError` if events after `since` were already trimmed from the feed"""
+        with self._lock, self._file_lock.shared():
+            self._refresh()
+            if since < self._first_seq - 1 and self._size:
+                raise ValueError(f'changes after {since} are no longer kept (the oldest kept change is {self._first_seq})')
+            if since >= self._last_seq or not self._size:
+                return
+            offset = self._find_offset(since)
+            end = self._size                # only the events written so far, even if more are appended while reading
+            file = open(self.filepath, 'rb')    # opened before any trim can replace the file
+        with file:
+            file.seek(offset)
+            count = 0
+            while file.tell() < end and (limit is None or count < limit):
+                yield json.loads(file.readline())
+                count += 1
+
+    def get_changes(self, since:int=0, limit:int=None) -> list[dict]:
+        return list(self.iter_changes(since, limit))
+
+    def wait_for_changes(self, since:int, timeout:float=None) -> bool:
+        """wait until there are events after the sequence number `since` (written in this process), or `timeout` seconds pass.
+        Returns `True` if there are"""
+        with self._lock:
+            return self._new_events.wait_for(lambda: self._last_seq > since, timeout)
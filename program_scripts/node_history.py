@@ -0,0 +1,315 @@
+"""
+version history of edited nodes, stored as compressed deltas.
+
+Every revision of a node is appended to one history journal as a record:
+* record head: header length (u32), payload length (u32) (little-endian)
+* header: JSON `{"id": node id, "rev": revision number, "time": unix time, "full": bool, "blobs": [blob digests]}`
+* payload: zlib-compressed JSON of either the whole node (`"full"`), or its delta from the revision before it
+
+A delta only has the fields which changed, and a changed text field of more than a few words is stored as
+a list of the ranges of words kept from the previous text (`[start, end]`) and the new text between them,
+so a small edit to a long text takes about as much space as the edit itself.
+Every `checkpoint_interval` revisions (and the first one) are stored whole, so reading a revision never needs
+more than `checkpoint_interval - 1` deltas to be applied.
+
+Records are appended (with the journal's lock held, by any process), so revisions appended by another process
+are found by reading the record headers after the end of the journal as it was last read.
+Only the newest `max_revisions` revisions of each node are kept: once the older ones make up half of the journal,
+it's rewritten without them (the oldest kept revision of a node is stored whole), and the rest are renumbered from 1.
+A journal rewritten by another process is read again from the start.
+"""
+import json
+import re
+import struct
+import zlib
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from mmap import mmap, ACCESS_READ
+from os import path, replace, stat, fsync
+from threading import Lock
+from time import time
+from .node_locks import RWLock, get_temp_path
+
+_RECORD_HEAD = struct.Struct('<II')
+_TOKEN_PATTERN = re.compile(r'\s+|\S+')         # words and the whitespace between them (so joining them gives back the text)
+_MIN_DIFF_LENGTH = 64                           # shorter text is always stored whole
+_MIN_PRUNE_REVISIONS = 256                      # number of revisions beyond the limit, below which the journal is never rewritten
+
+#-------------------------------
+
+def diff_text(old:str, new:str) -> list:
+    """get the ops which turn `old` into `new`: `[start, end]` to keep a range of the old words, or a string of new text"""
+    old_tokens, new_tokens = _TOKEN_PATTERN.findall(old), _TOKEN_PATTERN.findall(new)
+    # most edits only change one part of a text, so the common start and end are found before the (slower) diff of the rest
+    start = 0
+    for old_token, new_token in zip(old_tokens, new_tokens):
+        if old_token != new_token:
+            break
+        start += 1
+    end = 0
+    while end < min(len(old_tokens), len(new_tokens)) - start and old_tokens[-1 - end] == new_tokens[-1 - end]:
+        end += 1
+    ops = [[0, start]] if start else []
+    matcher = SequenceMatcher(None, old_tokens[start:len(old_tokens) - end], new_tokens[start:len(new_tokens) - end], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([start + i1, start + i2])
+        elif j1 < j2:
+            ops.append(''.join(new_tokens[start + j1:start + j2]))
+    if end:
+        ops.append([len(old_tokens) - end, len(old_tokens)])
+    return ops
+
+def patch_text(old:str, ops:list) -> str:
+    old_tokens = _TOKEN_PATTERN.findall(old)
+    return ''.join(op if isinstance(op, str) else ''.join(old_tokens[op[0]:op[1]]) for op in ops)
+
+def diff_node(old:dict, new:dict) -> dict:
+    """get the delta which turns the node `old` into `new`:
+    `{'set': {field: value}, 'diff': {field: text ops}, 'del': [field], 'order': [field]}` (only the parts that are needed)"""
+    delta = {}
+    for key, value in new.items():
+        old_value = old.get(key)
+        if key in old and old_value == value:
+            continue
+        if isinstance(value, str) and isinstance(old_value, str) and len(value) >= _MIN_DIFF_LENGTH:
+            ops = diff_text(old_value, value)
+            if len(json.dumps(ops)) < len(json.dumps(value)):
+                delta.setdefault('diff', {})[key] = ops
+                continue
+        delta.setdefault('set', {})[key] = value
+    removed = [key for key in old if key not in new]
+    if removed:
+        delta['del'] = removed
+    if [key for key in old if key in new] + [key for key in new if key not in old] != list(new):
+        delta['order'] = list(new)
+    return delta
+
+def patch_node(old:dict, delta:dict) -> dict:
+    node = {key: value for key, value in old.items() if key not in delta.get('del', ())}
+    for key, ops in delta.get('diff', {}).items():
+        node[key] = patch_text(old[key], ops)
+    node.update(delta.get('set', {}))
+    if 'order' in delta:
+        node = {key: node[key] for key in delta['order']}
+    return node
+
+
+class NodeHistory:
+    """
+    The revisions of every edited node, in a journal file (see above), keeping the newest `max_revisions` of each node (all if `None`).
+    Revisions are numbered from 1 for each node, and the newest one is the node as it's currently stored.
+    """
+    def __init__(self, filepath:str, checkpoint_interval:int=16, lock_path:str=None, cache_size:int=256, max_revisions:int=None):
+        self.filepath = filepath
+        self.checkpoint_interval = checkpoint_interval
+        self.max_revisions = max_revisions
+        self._lock = Lock()
+        self._file_lock = RWLock(lock_path)     # held exclusively to append or rewrite, so two processes never write at the same time
+        self._revisions = None          # {node id: [[byte offset, byte length, time, full], ...] by revision}, read on first use
+        self._version = None            # inode of the journal when it was read, which changes when it's rewritten
+        self._end = 0                   # byte offset the journal has been read up to
+        self._records = 0               # number of records in the journal
+        self._excess = 0                # number of those which are beyond the newest `max_revisions` of their node
+        self._latest = OrderedDict()    # {node id: newest revision of the node}, for the nodes edited most recently
+        self._cache_size = cache_size
+
+    #---------
+    # helper methods
+
+    def _load(self) -> dict:
+        """get the revision index, reading the header of every record in the journal which hasn't been read yet
+        (all of them on first use or once it was rewritten, and then only ones appended since, ex: by another process)"""
+        try:
+            st = stat(self.filepath)
+            version, size = st.st_ino, st.st_size
+        except FileNotFoundError:
+            version, size = None, 0
+        if self._revisions is None or version != self._version:
+            self._revisions, self._version, self._end, self._records, self._excess = {}, version, 0, 0, 0
+            self._latest.clear()
+        if size <= self._end:
+            return self._revisions
+        with open(self.filepath, 'rb') as file, mmap(file.fileno(), 0, access=ACCESS_READ) as data:
+            offset = self._end
+            while offset + _RECORD_HEAD.size <= len(data):
+                header_length, payload_length = _RECORD_HEAD.unpack_from(data, offset)
+                length = _RECORD_HEAD.size + header_length + payload_length
+                if offset + length > len(data):
+                    break                       # a record which is still being written
+                header = json.loads(data[offset + _RECORD_HEAD.size:offset + _RECORD_HEAD.size + header_length])
+                self._add_entry(header['id'], [offset, length, header['time'], header['full']])
+                self._latest.pop(header['id'], None)
+                offset += length
+            self._end = offset
+        return self._revisions
+
+    def _add_entry(self, id:str, entry:list):
+        entries = self._revisions.setdefault(id, [])
+        entries.append(entry)
+        self._records += 1
+        if self.max_revisions is not None and len(entries) > self.max_revisions:
+            self._excess += 1
+
+    def _read_raw_record(self, file, offset:int, length:int) -> tuple[dict, bytes]:
+        """read a record's header, and its payload still compressed"""
+        file.seek(offset)
+        data = file.read(length)
+        header_length, _ = _RECORD_HEAD.unpack_from(data)
+        header_end = _RECORD_HEAD.size + header_length
+        return json.loads(data[_RECORD_HEAD.size:header_end]), data[header_end:]
+
+    def _read_record(self, file, offset:int, length:int) -> tuple[dict, object]:
+        header, payload = self._read_raw_record(file, offset, length)
+        return header, json.loads(zlib.decompress(payload))
+
+    @staticmethod
+    def _pack_record(header:dict, payload:bytes) -> bytes:
+        header_data = json.dumps(header).encode('utf-8')
+        return _RECORD_HEAD.pack(len(header_data), len(payload)) + header_data + payload
+
+    def _materialize(self, id:str, rev:int) -> dict:
+        """read a revision, from the newest full revision before it and the deltas after that"""
+        revisions = self._revisions[id]
+        start = rev - 1
+        while not revisions[start][3]:
+            start -= 1
+        with open(self.filepath, 'rb') as file:
+            node = self._read_record(file, *revisions[start][:2])[1]
+            for offset, length, _, _ in revisions[start + 1:rev]:
+                node = patch_node(node, self._read_record(file, offset, length)[1])
+        return node
+
+    def _get_latest(self, id:str) -> dict:
+        node = self._latest.get(id)
+        if node is None and self._revisions.get(id):
+            node = self._materialize(id, len(self._revisions[id]))
+        return node
+
+    def _set_latest(self, id:str, node:dict):
+        self._latest[id] = node
+        self._latest.move_to_end(id)
+        if len(self._latest) > self._cache_size:
+            self._latest.popitem(last=False)
+
+    #---------
+    # writing
+
+    def add_revisions(self, edits:list, get_stored_node, sync:bool=False):
+        """add a revision for each `(id, node)` edit, with one write for all of them.
+        For a node without any revisions yet, `get_stored_node(id)` is called to get the node from before the edit
+        (if there is one), which becomes its first revision"""
+        records = []
+        with self._lock, self._file_lock.exclusive():
+            revisions = self._load()
+            offset = path.getsize(self.filepath) if path.isfile(self.filepath) else 0
+            now = time()
+            for id, node in edits:
+                if not isinstance(node, dict):
+                    continue
+                new_revisions = []
+                if not revisions.get(id):
+                    previous = get_stored_node(id)
+                    if isinstance(previous, dict) and previous != node:
+                        new_revisions.append(previous)
+                new_revisions.append(node)
+                for revision in new_revisions:
+                    rev = len(revisions.get(id, ())) + 1
+                    previous = self._get_latest(id)
+                    if previous == revision:
+                        continue
+                    full = previous is None or (rev - 1) % self.checkpoint_interval == 0
+                    cont = revision.get('cont')
+                    header = {'id': id, 'rev': rev, 'time': now, 'full': full,
+                              'blobs': [cont['blob']] if isinstance(cont, dict) and isinstance(cont.get('blob'), str) else []}
+                    payload = zlib.compress(json.dumps(revision if full else diff_node(previous, revision)).encode('utf-8'))
+                    record = self._pack_record(header, payload)
+                    records.append(record)
+                    self._add_entry(id, [offset, len(record), now, full])
+                    offset += len(record)
+                    self._set_latest(id, revision)
+            if records:
+                with open(self.filepath, 'ab') as file:
+                    file.write(b''.join(records))
+                    if sync:
+                        file.flush()
+                        fsync(file.fileno())
+                self._end = offset
+                self._version = stat(self.filepath).st_ino      # in case this created the journal
+                # rewritten once the revisions beyond the limit make up half of it, so it's only rewritten every so often
+                if self._excess >= max(_MIN_PRUNE_REVISIONS, self._records // 2):
+                    self._prune(self.max_revisions)
+
+    def _prune(self, max_revisions:int=None, keep_ids:set=None) -> int:
+        """rewrite the journal with only the newest `max_revisions` revisions of each node (all if `None`),
+        and only of the nodes in `keep_ids` (all if `None`), and return the number of revisions removed.
+        Must be called with both locks held"""
+        revisions = self._load()
+        kept_revisions = {}
+        temp_path = get_temp_path(self.filepath)
+        with open(temp_path, 'wb') as temp_file:
+            if revisions:
+                with open(self.filepath, 'rb') as file:
+                    for id, entries in revisions.items():
+                        if keep_ids is not None and id not in keep_ids:
+                            continue
+                        first = max(len(entries) - max_revisions, 0) if max_revisions is not None else 0
+                        kept = kept_revisions[id] = []
+                        for rev, (offset, length, revision_time, full) in enumerate(entries[first:], 1):
+                            header, payload = self._read_raw_record(file, offset, length)
+                            if rev == 1 and not full:
+                                # the revision before it is dropped, so it's stored whole
+                                full, payload = True, zlib.compress(json.dumps(self._materialize(id, first + 1)).encode('utf-8'))
+                            header.update(rev=rev, full=full)
+                            record = self._pack_record(header, payload)
+                            kept.append([temp_file.tell(), len(record), revision_time, full])
+                            temp_file.write(record)
+            temp_file.flush()
+            fsync(temp_file.fileno())
+        replace(temp_path, self.filepath)
+        removed = self._records - sum(len(entries) for entries in kept_revisions.values())
+        st = stat(self.filepath)
+        self._revisions, self._version, self._end = kept_revisions, st.st_ino, st.st_size
+        self._records, self._excess = self._records - removed, 0
+        for id in [id for id in self._latest if id not in kept_revisions]:
+            del self._latest[id]
+        return removed
+
+    def prune(self, max_revisions:int=None, keep_ids:set=None) -> int:
+        """remove every revision beyond the newest `max_revisions` of each node (`self.max_revisions` if not given),
+        and every revision of nodes not in `keep_ids` (if it's given). Returns the number of revisions removed"""
+        with self._lock, self._file_lock.exclusive():
+            return self._prune(self.max_revisions if max_revisions is None else max_revisions, keep_ids)
+
+    #---------
+    # reading
+
+    def get_revisions(self, id:str) -> list[dict]:
+        """get `{'rev', 'time', 'full'}` of every revision of a node, from oldest to newest (empty if it was never edited)"""
+        with self._lock:
+            revisions = self._load().get(id, ())
+            return [{'rev': rev, 'time': time, 'full': full} for rev, (_, _, time, full) in enumerate(revisions, 1)]
+
+    def get_revision(self, id:str, rev:int) -> dict:
+        """get a node as it was at a revision (`-1` for the newest, `-2` for the one before it, and so on)"""
+        with self._lock:
+            count = len(self._load().get(id, ()))
+            if rev < 0:
+                rev += count + 1
+            if not 1 <= rev <= count:
+                raise KeyError(f'{id} has no revision {rev}')
+            return self._materialize(id, rev)
+
+    def get_blob_digests(self) -> set[str]:
+        """get the digest of every blob used by a revision (to keep them from being collected)"""
+        digests = set()
+        with self._lock:
+            revisions = [entry for entries in self._load().values() for entry in entries]
+            if not revisions:
+                return digests
+            with open(self.filepath, 'rb') as file:
+                for offset, _, _, _ in revisions:
+                    file.seek(offset)
+                    header_length, _ = _RECORD_HEAD.unpack(file.read(_RECORD_HEAD.size))
+                    digests.update(json.loads(file.read(header_length))['blobs'])
+        return digests
@@ -0,0 +1,162 @@
+"""
+adjacency index for the `supe`/`side`/`sub` links between nodes.
+
+`LinkIndex` keeps every node's links, along with the reverse of every link, so the graph can be traversed
+in both directions without reading any node content:
+* a `sub` link from A to B is the same as a `supe` link from B to A (and the other way around)
+* `side` links go both ways
+"""
+import json
+from collections import deque
+from os import path, replace
+from threading import Lock
+from .node_locks import get_temp_path
+
+LINK_TYPES = ('supe', 'side', 'sub')
+_INVERSE_LINK_TYPES = {'supe': 'sub', 'side': 'side', 'sub': 'supe'}
+
+#-------------------------------
+
+class LinkIndex:
+    """
+    An index of node links, which is updated one node at a time with `add_node()` and `remove_node()`
+    (it has the same update, load and save methods as `node_search.SearchIndex`).
+    """
+    def __init__(self, filepath:str):
+        self.filepath = filepath
+        self._lock = Lock()
+        self._nodes = {}                # {node id: [shard name, {link type: [linked node ids]}]}
+        self._reverse = {}              # {node id: {link type: {ids of nodes which link to it with this type}}}
+
+    #---------
+    # loading and saving
+
+    def load(self) -> dict:
+        """load the saved index, and return the shard stats it was saved with (empty if nothing could be loaded)"""
+        if not path.isfile(self.filepath):
+            return {}
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except ValueError:
+            return {}
+        with self._lock:
+            self._nodes = data['nodes']
+            self._reverse = {}
+            for id, (_, links) in self._nodes.items():
+                self._add_reverse(id, links)
+        return data['shards']
+
+    def save(self, shard_stats:dict):
+        """save the index along with the stats of the shard files it matches"""
+        with self._lock:
+            temp_path = get_temp_path(self.filepath)
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                file.write(json.dumps({'shards': shard_stats, 'nodes': self._nodes}))
+            replace(temp_path, self.filepath)
+
+    #---------
+    # updating
+
+    def add_node(self, id:str, node:dict, shard:str):
+        """add a node's links to the index (replacing them if the node is already in the index)"""
+        node = node if isinstance(node, dict) else {}
+        links = {kind: list(node.get(kind, ())) for kind in LINK_TYPES}
+        with self._lock:
+            self._remove(id)
+            self._nodes[id] = [shard, links]
+            self._add_reverse(id, links)
+
+    def remove_node(self, id:str):
+        with self._lock:
+            self._remove(id)
+
+    def remove_shard(self, shard:str):
+        """remove every node from a shard file (before re-indexing it)"""
+        with self._lock:
+            for id in [id for id, (node_shard, _) in self._nodes.items() if node_shard == shard]:
+                self._remove(id)
+
+    def _add_reverse(self, id:str, links:dict):
+        for kind, targets in links.items():
+            for target in targets:
+                self._reverse.setdefault(target, {}).setdefault(kind, set()).add(id)
+
+    def _remove(self, id:str):
+        node = self._nodes.pop(id, None)
+        if not node:
+            return
+        for kind, targets in node[1].items():
+            for target in targets:
+                reverse = self._reverse.get(target)
+                sources = reverse.get(kind) if reverse else None
+                if sources:
+                    sources.discard(id)
+                    # drop emptied sets, so the reverse links don't keep an entry for every id ever linked to
+                    if not sources:
+                        del reverse[kind]
+                        if not reverse:
+                            del self._reverse[target]
+
+    #---------
+    # queries
+
+    def __contains__(self, id:str) -> bool:
+        return id in self._nodes
+
+    def get_linking_nodes(self, id:str) -> list[tuple[str, str]]:
+        """return `(node id, link type)` for every node which has a link to this node in its own links"""
+        with self._lock:
+            return [(source, kind) for kind, sources in self._reverse.get(id, {}).items() for source in sources]
+
+    def neighbors(self, id:str, kind:str=None) -> set[str]:
+        """return the ids of all nodes linked to this node (by either node), only of link type `kind` if given.
+        `kind` is from this node's point of view: a node's `supe` neighbors include every node which has it as a `sub` link"""
+        kinds = (kind,) if kind else LINK_TYPES
+        with self._lock:
+            return self._neighbors(id, kinds)
+
+    def _neighbors(self, id:str, kinds:tuple) -> set[str]:
+        node = self._nodes.get(id)
+        reverse = self._reverse.get(id, {})
+        found = set()
+        for kind in kinds:
+            if node:
+                found.update(node[1][kind])
+            found.update(reverse.get(_INVERSE_LINK_TYPES[kind], ()))
+        found.discard(id)
+        return found
+
+    def traverse(self, id:str, depth:int=None, kind:str=None, depth_first:bool=False) -> list[tuple[str, int]]:
+        """return `(node id, depth)` for every node reachable from this node (not including itself),
+        following links of type `kind` (all types if `None`), up to `depth` links away (no limit if `None`).
+        Nodes are in breadth first order, or depth first order if `depth_first` is `True`"""
+        kinds = (kind,) if kind else LINK_TYPES
+        found = []
+        seen = {id}
+        with self._lock:
+            pending = deque([(id, 0)])
+            while pending:
+                current, current_depth = pending.pop() if depth_first else pending.popleft()
+                if current != id:
+                    found.append((current, current_depth))
+                if depth is not None and current_depth >= depth:
+                    continue
+                # sorted, so the order is the same every time
+                next_ids = sorted(self._neighbors(current, kinds) - seen, reverse=depth_first)
+                seen.update(next_ids)
+                pending.extend((next_id, current_depth + 1) for next_id in next_ids)
+        return found
+
+    def ancestors(self, id:str, depth:int=None) -> list[tuple[str, int]]:
+        """return `(node id, depth)` for every node reachable by following `supe` links"""
+        return self.traverse(id, depth, 'supe')
+
+    def descendants(self, id:str, depth:int=None) -> list[tuple[str, int]]:
+        """return `(node id, depth)` for every node reachable by following `sub` links"""
+        return self.traverse(id, depth, 'sub')
+
+    def orphans(self) -> list[str]:
+        """return the ids of all nodes which have no links to or from any other node"""
+        with self._lock:
+            return [id for id in self._nodes if not self._neighbors(id, LINK_TYPES)]
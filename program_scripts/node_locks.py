@@ -0,0 +1,107 @@
+"""
+locks for sharing the node store between threads, and between processes using the same storage folder.
+
+`RWLock` is a readers-writer lock for threads, and if it's given a lock file, it also holds an advisory lock on it
+(`flock()`, on unix), so every process using the same lock file waits for it too. The lock file is never written to,
+it only exists to be locked, since the files it guards are replaced by renaming new ones over them.
+
+Files which are rewritten are written to a temp file first, which is then renamed over the file,
+so a reader (in any process) only ever sees the whole old file or the whole new one.
+"""
+from contextlib import contextmanager
+from os import getpid
+from threading import Condition, Lock, get_ident
+try:
+    import fcntl                    # only on unix (elsewhere locks only work within one process)
+except ImportError:
+    fcntl = None
+
+#-------------------------------
+
+def get_temp_path(filepath:str) -> str:
+    """get the temp file path to write a file to before renaming it over `filepath`,
+    which is unique to this process and thread, so two writers of the same file never write to the same temp file"""
+    return f'{filepath}.{getpid()}-{get_ident()}.tmp'
+
+
+class RWLock:
+    """
+    A readers-writer lock: any number of threads can hold it shared at the same time, or one thread can hold it exclusively.
+    Threads waiting to hold it exclusively go first, so a steady stream of shared holders can't keep them waiting forever.
+    A thread holding it can take it again (the exclusive holder either way, a shared holder only shared),
+    but a thread holding it shared can't take it exclusively.
+
+    With a `lock_path`, the lock file is also locked (shared or exclusive) while any thread holds the lock.
+    """
+    def __init__(self, lock_path:str=None):
+        self.lock_path = lock_path
+        self._condition = Condition(Lock())
+        self._shared = {}               # {thread ident: number of times the thread holds it shared}
+        self._owner = None              # thread ident of the exclusive holder
+        self._depth = 0                 # number of times the exclusive holder has taken it
+        self._waiting = 0               # number of threads waiting to take it exclusively
+        self._file = None
+
+    def _lock_file(self, operation:int):
+        if self.lock_path and fcntl:
+            if self._file is None:
+                self._file = open(self.lock_path, 'ab')
+            fcntl.flock(self._file.fileno(), operation)
+
+    def _unlock_file(self):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def shared(self):
+        ident = get_ident()
+        with self._condition:
+            if self._owner == ident:
+                # already held exclusively by this thread, which covers reading too
+                self._depth += 1
+            elif ident in self._shared:
+                # already held by this thread (which mustn't wait for exclusive holders that are waiting for it)
+                self._shared[ident] += 1
+            else:
+                self._condition.wait_for(lambda: self._owner is None and not self._waiting)
+                if not self._shared and fcntl:
+                    self._lock_file(fcntl.LOCK_SH)
+                self._shared[ident] = 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                if self._owner == ident:
+                    self._depth -= 1
+                else:
+                    self._shared[ident] -= 1
+                    if not self._shared[ident]:
+                        del self._shared[ident]
+                    if not self._shared:
+                        self._unlock_file()
+                        self._condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._condition:
+            if self._owner == get_ident():
+                self._depth += 1
+                taken = False
+            else:
+                self._waiting += 1
+                self._condition.wait_for(lambda: self._owner is None and not self._shared)
+                self._waiting -= 1
+                self._owner, self._depth = get_ident(), 1
+                taken = True
+        try:
+            if taken and fcntl:
+                # outside of the condition, so other threads can still check the lock while another process holds the file
+                self._lock_file(fcntl.LOCK_EX)
+            yield
+        finally:
+            with self._condition:
+                self._depth -= 1
+                if not self._depth:
+                    self._unlock_file()
+                    self._owner = None
+                    self._condition.notify_all()
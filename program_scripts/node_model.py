@@ -0,0 +1,222 @@
+"""
+compact in-memory representation of nodes, for keeping many of them in memory (ex: in the node cache, or a working set of every node).
+
+A node read from JSON is a dict with a string key per field, a list per link type, and its own copy of every linked id string,
+which is a few hundred bytes of overhead per node. A `CompactNode` instead has:
+* `__slots__` fields (no per-node dict or keys)
+* all three link lists in one `array('I')` of interned id numbers (4 bytes per link), from a `NodeIds` table shared by all of the nodes
+* interned `type` strings, so every node of a type shares one string
+
+Only standard nodes (with exactly the fields of `nodes.ReadWriteNodes.create_node()`, in that order, the same as the standard
+node records of `node_binary.py`) are made compact, anything else is kept as a dict, so converting is always lossless:
+
+```
+ids = NodeIds()
+node = compact_node(node_dict, ids)
+assert expand_node(node, ids) == node_dict
+release_node(node, ids)         # once the node is no longer kept, so its link ids can be dropped
+```
+"""
+from array import array
+from sys import getsizeof, intern
+from threading import Lock
+from .node_links import LINK_TYPES
+from .node_binary import is_std_node
+
+#-------------------------------
+
+class NodeIds:
+    """
+    A table of interned node ids, which numbers every id it's given (the numbers are only valid for this table).
+    Ids are reference counted: every `intern()` adds a reference and every `release()` drops one,
+    and an id with no references left is dropped and its number reused, so the table only holds the ids of the nodes kept in memory.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._ids = []                  # [node id (or None for a free number)] by number
+        self._counts = []               # [number of references] by number
+        self._numbers = {}              # {node id: number}
+        self._free = []                 # numbers of dropped ids, to reuse
+
+    def __len__(self) -> int:
+        return len(self._numbers)
+
+    def intern(self, id:str) -> int:
+        """get an id's number (numbering it if it's new), and add a reference to it"""
+        with self._lock:
+            number = self._numbers.get(id)
+            if number is None:
+                if self._free:
+                    number = self._free.pop()
+                    self._ids[number] = id
+                else:
+                    number = len(self._ids)
+                    self._ids.append(id)
+                    self._counts.append(0)
+                self._numbers[id] = number
+            self._counts[number] += 1
+            return number
+
+    def release(self, number:int):
+        """drop a reference to an id number, and drop the id once nothing references it"""
+        with self._lock:
+            self._counts[number] -= 1
+            if not self._counts[number]:
+                del self._numbers[self._ids[number]]
+                self._ids[number] = None
+                self._free.append(number)
+
+    def get_number(self, id:str) -> int:
+        """get an id's number, or `None` if it isn't in the table (doesn't add a reference)"""
+        return self._numbers.get(id)
+
+    def get_id(self, number:int) -> str:
+        return self._ids[number]
+
+
+class CompactNode:
+    """
+    A standard node, with its links stored as id numbers from a `NodeIds` table, all in one array:
+    `[number of supe links, number of side links, supe links..., side links..., sub links...]`
+    """
+    __slots__ = ('name', 'type', 'links', 'cont')
+
+    def __init__(self, name:str, type:str, links:array, cont):
+        self.name = name
+        self.type = type
+        self.links = links
+        self.cont = cont
+
+    @staticmethod
+    def is_compactable(node) -> bool:
+        """check if a node dict is a standard node (which can be made compact without losing anything),
+        the same check as for the standard node records of `node_binary.py`"""
+        return is_std_node(node)
+
+    @classmethod
+    def from_dict(cls, node:dict, ids:NodeIds) -> 'CompactNode':
+        """make a compact node from a standard node dict (see `is_compactable()`).
+        The content is shared with the dict rather than copied, so it's only safe to change it by replacing it"""
+        links = array('I', (len(node['supe']), len(node['side'])))
+        for kind in LINK_TYPES:
+            links.extend(ids.intern(link) for link in node[kind])
+        return cls(node['name'], intern(node['type']), links, node['cont'])
+
+    def _get_range(self, kind:str) -> tuple[int, int]:
+        """get the start and end of a link type's links in `links`"""
+        supe_end = 2 + self.links[0]
+        if kind == 'supe':
+            return 2, supe_end
+        side_end = supe_end + self.links[1]
+        return (supe_end, side_end) if kind == 'side' else (side_end, len(self.links))
+
+    def get_links(self, kind:str, ids:NodeIds) -> list[str]:
+        """get the ids of a link type's linked nodes"""
+        start, end = self._get_range(kind)
+        return [ids.get_id(number) for number in self.links[start:end]]
+
+    def to_dict(self, ids:NodeIds) -> dict:
+        """get the node as a new dict (with new link lists, so changing it doesn't change this node)"""
+        return {
+            'name': self.name,
+            'type': self.type,
+            'supe': self.get_links('supe', ids),
+            'side': self.get_links('side', ids),
+            'sub':  self.get_links('sub', ids),
+            'cont': self.cont,
+        }
+
+    def get_size(self) -> int:
+        """get the number of bytes the node takes up in memory (not counting the shared `type` string and id table)"""
+        size = getsizeof(self) + getsizeof(self.name) + getsizeof(self.links)
+        return size + (getsizeof(self.cont) if isinstance(self.cont, str) else 0)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompactNode):
+            return NotImplemented
+        return (self.name, self.type, self.links, self.cont) == (other.name, other.type, other.links, other.cont)
+
+    def __repr__(self) -> str:
+        return f'CompactNode(name={self.name!r}, type={self.type!r}, links={len(self.links) - 2})'
+
+
+def compact_node(node, ids:NodeIds):
+    """get a node in its compact form: a `CompactNode` if it's a standard node, otherwise a copy of its dict and lists"""
+    if CompactNode.is_compactable(node):
+        return CompactNode.from_dict(node, ids)
+    if isinstance(node, dict):
+        return {key: value.copy() if isinstance(value, list) else value for key, value in node.items()}
+    return node
+
+def release_node(node, ids:NodeIds):
+    """drop the references a compact node holds to its link ids (once the node is no longer kept)"""
+    if isinstance(node, CompactNode):
+        for number in node.links[2:]:
+            ids.release(number)
+
+def expand_node(node, ids:NodeIds):
+    """get a node back in its dict form (a new dict, which can be changed without changing the compact node)"""
+    if isinstance(node, CompactNode):
+        return node.to_dict(ids)
+    if isinstance(node, dict):
+        return {key: value.copy() if isinstance(value, list) else value for key, value in node.items()}
+    return node
+
+
+class CompactNodeTable:
+    """
+    A `{node id: node}` working set of nodes kept in their compact form, which gives and takes nodes as dicts.
+    `get_compact()` gives the stored form instead, for reading many nodes without making a dict for each.
+    """
+    def __init__(self, ids:NodeIds=None):
+        self.ids = ids or NodeIds()
+        self._nodes = {}                # {id number: CompactNode (or dict for a non-standard node)}
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, id:str) -> bool:
+        number = self.ids.get_number(id)
+        return number is not None and number in self._nodes
+
+    def __iter__(self):
+        return (self.ids.get_id(number) for number in self._nodes)
+
+    def __getitem__(self, id:str) -> dict:
+        return expand_node(self.get_compact(id), self.ids)
+
+    def __setitem__(self, id:str, node:dict):
+        number = self.ids.intern(id)
+        old_node = self._nodes.get(number)
+        self._nodes[number] = compact_node(node, self.ids)
+        if old_node is not None:
+            # the id was already referenced by its old node's entry
+            release_node(old_node, self.ids)
+            self.ids.release(number)
+
+    def __delitem__(self, id:str):
+        number = self.ids.get_number(id)
+        if number is None or number not in self._nodes:
+            raise KeyError(id)
+        release_node(self._nodes.pop(number), self.ids)
+        self.ids.release(number)
+
+    def get(self, id:str, default=None) -> dict:
+        return self[id] if id in self else default
+
+    def get_compact(self, id:str):
+        """get a node in its stored form (a `CompactNode`, or a dict for a non-standard node), which shouldn't be changed"""
+        number = self.ids.get_number(id)
+        if number is None or number not in self._nodes:
+            raise KeyError(id)
+        return self._nodes[number]
+
+    def items(self):
+        """generator which yields `(id, node dict)` for every node"""
+        for number, node in self._nodes.items():
+            yield self.ids.get_id(number), expand_node(node, self.ids)
+
+    def update(self, nodes):
+        """add `(id, node)` pairs (or a `{id: node}` dict)"""
+        for id, node in (nodes.items() if isinstance(nodes, dict) else nodes):
+            self[id] = node
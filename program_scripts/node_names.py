@@ -0,0 +1,203 @@
+"""
+name index for finding nodes by their descriptive `name`, made for imprecise (voice transcribed) and incomplete input.
+
+`NameIndex` keeps every distinct word of every node name:
+* in a sorted list, so all words starting with a prefix are found with a binary search (for a name that's still being spoken)
+* by every variant of the word with one letter deleted, so words within a small edit distance of a misheard word
+are found by looking up the misheard word's own one-letter deletions, without comparing it to every word
+(two words have a common one-letter deletion if they differ by one edit, or by a swap or replacement of one letter)
+"""
+import json
+import heapq
+from bisect import bisect_left, insort
+from os import path, replace
+from threading import Lock
+from .node_search import get_terms
+from .node_locks import get_temp_path
+
+# score of a search word matching a name word, by how it matched
+_EXACT_SCORE = 1.0
+_PREFIX_SCORE = 0.8
+_FUZZY_SCORE = 0.7              # for 1 edit, and less for each edit after that
+
+#-------------------------------
+
+def get_deletions(word:str) -> set[str]:
+    """get the word, and every variant of it with one letter deleted"""
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+def max_edits(word:str) -> int:
+    """number of typos allowed in a word (none for very short words, which would match too many other words)"""
+    return 0 if len(word) <= 2 else 1 if len(word) <= 5 else 2
+
+def edit_distance(a:str, b:str, limit:int) -> int:
+    """Levenshtein distance between two words, or `limit + 1` as soon as it's known to be more than `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class NameIndex:
+    """
+    An index of node names, which is updated one node at a time with `add_node()` and `remove_node()`
+    (it has the same update, load and save methods as `node_search.SearchIndex`).
+    """
+    def __init__(self, filepath:str):
+        self.filepath = filepath
+        self._lock = Lock()
+        self._names = {}                # {node id: [shard name, node name]}
+        self._word_ids = {}             # {name word: {ids of nodes with the word in their name}}
+        self._sorted_words = []         # every key of `_word_ids`, sorted (for prefix search)
+        self._deletion_words = {}       # {name word with up to one letter deleted: {name words it came from}}
+
+    #---------
+    # loading and saving
+
+    def load(self) -> dict:
+        """load the saved index, and return the shard stats it was saved with (empty if nothing could be loaded)"""
+        if not path.isfile(self.filepath):
+            return {}
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except ValueError:
+            return {}
+        with self._lock:
+            self._names = {}
+            self._word_ids = {}
+            self._deletion_words = {}
+            for id, (shard, name) in data['names'].items():
+                self._names[id] = [shard, name]
+                for word in set(get_terms(name)):
+                    self._add_word(id, word, sort=False)
+            self._sorted_words = sorted(self._word_ids)
+        return data['shards']
+
+    def save(self, shard_stats:dict):
+        """save the index along with the stats of the shard files it matches (only the names are saved)"""
+        with self._lock:
+            temp_path = get_temp_path(self.filepath)
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                file.write(json.dumps({'shards': shard_stats, 'names': self._names}))
+            replace(temp_path, self.filepath)
+
+    #---------
+    # updating
+
+    def add_node(self, id:str, node:dict, shard:str):
+        """add a node's name to the index (replacing it if the node is already in the index)"""
+        name = node.get('name') if isinstance(node, dict) else None
+        name = name if isinstance(name, str) else ''
+        with self._lock:
+            self._remove(id)
+            self._names[id] = [shard, name]
+            for word in set(get_terms(name)):
+                self._add_word(id, word)
+
+    def remove_node(self, id:str):
+        with self._lock:
+            self._remove(id)
+
+    def remove_shard(self, shard:str):
+        """remove every node from a shard file (before re-indexing it)"""
+        with self._lock:
+            for id in [id for id, (node_shard, _) in self._names.items() if node_shard == shard]:
+                self._remove(id)
+
+    def _add_word(self, id:str, word:str, sort:bool=True):
+        ids = self._word_ids.get(word)
+        if ids is None:
+            ids = self._word_ids[word] = set()
+            if sort:
+                insort(self._sorted_words, word)
+            for deletion in get_deletions(word):
+                self._deletion_words.setdefault(deletion, set()).add(word)
+        ids.add(id)
+
+    def _remove(self, id:str):
+        entry = self._names.pop(id, None)
+        if not entry:
+            return
+        for word in set(get_terms(entry[1])):
+            ids = self._word_ids[word]
+            ids.discard(id)
+            if ids:
+                continue
+            # no more names have this word
+            del self._word_ids[word]
+            del self._sorted_words[bisect_left(self._sorted_words, word)]
+            for deletion in get_deletions(word):
+                words = self._deletion_words[deletion]
+                words.discard(word)
+                if not words:
+                    del self._deletion_words[deletion]
+
+    #---------
+    # lookup
+
+    def _prefix_words(self, prefix:str) -> list[str]:
+        start = bisect_left(self._sorted_words, prefix)
+        end = bisect_left(self._sorted_words, prefix + '\U0010ffff')
+        return self._sorted_words[start:end]
+
+    def _fuzzy_words(self, word:str) -> dict:
+        """get `{name word: edit distance}` of the name words within `max_edits()` of a word"""
+        limit = max_edits(word)
+        if not limit:
+            return {}
+        candidates = set()
+        for deletion in get_deletions(word):
+            candidates.update(self._deletion_words.get(deletion, ()))
+        candidates.discard(word)
+        found = {}
+        for name_word in candidates:
+            distance = edit_distance(word, name_word, limit)
+            if distance <= limit:
+                found[name_word] = distance
+        return found
+
+    def _match_word(self, word:str, prefix:bool, fuzzy:bool) -> dict:
+        """get `{name word: score}` of every name word which matches a search word"""
+        matches = {}
+        if fuzzy:
+            for name_word, distance in self._fuzzy_words(word).items():
+                matches[name_word] = _FUZZY_SCORE / distance
+        if prefix:
+            for name_word in self._prefix_words(word):
+                matches[name_word] = max(matches.get(name_word, 0), _PREFIX_SCORE)
+        if word in self._word_ids:
+            matches[word] = _EXACT_SCORE
+        return matches
+
+    def lookup(self, text:str, limit:int=10, prefix:bool=True, fuzzy:bool=True) -> list[tuple[float, str]]:
+        """return `(score, node id)` tuples of the top `limit` nodes (all if `None`) whose names best match the text, from best to worst.
+        Each word of the text can match a name word exactly, or with a few typos if `fuzzy` is `True`,
+        and the last word can also be the start of a name word if `prefix` is `True` (for text which is still being entered).
+        A node's score is the total of its best match for each word, so names with more of the words come first,
+        and for the same score, shorter names come first (they have less of what wasn't asked for)"""
+        words = get_terms(text)
+        scores = {}
+        with self._lock:
+            for i, word in enumerate(words):
+                best = {}                   # {node id: best score for this word}
+                matches = self._match_word(word, prefix and i == len(words) - 1, fuzzy)
+                # from worst to best match, so each node ends up with its best score
+                for name_word in sorted(matches, key=matches.get):
+                    best.update(dict.fromkeys(self._word_ids[name_word], matches[name_word]))
+                for id, score in best.items():
+                    scores[id] = scores.get(id, 0) + score
+            candidates = scores
+            if limit is not None and len(scores) > limit:
+                # only nodes with at least the `limit`th best score can be in the results, so only those need to be ranked
+                cutoff = heapq.nlargest(limit, scores.values())[-1]
+                candidates = [id for id, score in scores.items() if score >= cutoff]
+            ranked = sorted(candidates, key=lambda id: (-scores[id], len(self._names[id][1]), id))[:limit]
+        return [(scores[id], id) for id in ranked]
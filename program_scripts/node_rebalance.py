@@ -0,0 +1,47 @@
+"""
+offline tool for rewriting the shard files of a node storage folder to fit a sharding policy (see `node_sharding.py`).
+Nothing else should be using the storage folder while it runs.
+
+`python -m program_scripts.node_rebalance --policy size --max-bytes 4000000`
+"""
+import argparse
+from os import path, listdir
+from .nodes import ReadWriteNodes, STORAGE_DIR, SHARD_FORMAT_EXTENSIONS
+from .node_sharding import SHARD_POLICIES, MonthShardPolicy, SizeShardPolicy, CountShardPolicy, parse_shard_stem
+
+#-------------------------------
+
+def get_shard_format(storage_dir:str) -> str:
+    """get the format of the newest shard file in a storage folder (`'json'` if it has none)"""
+    if not path.isdir(storage_dir):
+        return 'json'
+    formats = {extension: shard_format for shard_format, extension in SHARD_FORMAT_EXTENSIONS.items()}
+    shards = sorted(
+        (parse_shard_stem(stem), formats[extension]) for stem, extension in map(path.splitext, listdir(storage_dir))
+        if extension in formats and parse_shard_stem(stem)
+    )
+    return shards[-1][1] if shards else 'json'
+
+def main(argv:list=None) -> int:
+    parser = argparse.ArgumentParser(description='rewrite the node shard files to fit a sharding policy')
+    parser.add_argument('--policy', choices=tuple(SHARD_POLICIES), help='sharding policy (the saved one if not given)')
+    parser.add_argument('--max-bytes', type=int, default=8 * 2**20, help="shard size cap for the 'size' policy")
+    parser.add_argument('--max-nodes', type=int, default=10_000, help="nodes per shard cap for the 'count' policy")
+    parser.add_argument('--shard-format', choices=tuple(SHARD_FORMAT_EXTENSIONS), help='format of the new shard files (the current one if not given)')
+    parser.add_argument('--storage-dir', help='node storage folder (the default one if not given)')
+    args = parser.parse_args(argv)
+    policy = {
+        None: None,
+        'month': MonthShardPolicy(),
+        'size': SizeShardPolicy(args.max_bytes),
+        'count': CountShardPolicy(args.max_nodes),
+    }[args.policy]
+    shard_format = args.shard_format or get_shard_format(args.storage_dir or STORAGE_DIR)
+    nodes = ReadWriteNodes(shard_format=shard_format, storage_dir=args.storage_dir)
+    shards = nodes.rebalance_shards(policy)
+    print(f'wrote {shards} shard files with {nodes.shard_policy}')
+    return shards
+
+
+if __name__ == "__main__":
+    main()
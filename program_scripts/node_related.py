@@ -0,0 +1,302 @@
+"""
+TF-IDF vectors of node text, for finding related notes (needs NumPy).
+
+`RelatedIndex` stores every node's term counts as one sparse matrix, in flat NumPy arrays (like the CSR format).
+New nodes are appended to the arrays (an edited node is removed and added again), and removed nodes are only marked as removed
+until they make up more than `_COMPACT_FRACTION` of the arrays, when they're dropped (so the arrays don't grow with every edit).
+* term weights are `(1 + log(term count)) * idf`, and node vectors are normalized, so scores are cosine similarities
+* the term positions are also kept sorted by term (like the CSC format), so a query only reads the nodes with its terms.
+Nodes added since the sorted order was built are few, so they're just scanned
+* the idf weights (and so each node's norm) are only re-calculated when the sorted order is rebuilt,
+once the number of changed nodes is more than `_REBUILD_FRACTION` of all nodes (idf weights change slowly,
+and a small store's weights are rebuilt after only a few changes, so its scores match those of a reloaded index)
+* queries only use their `query_terms` highest weighted terms, which skips the common terms found in most nodes
+* memory is bounded by only keeping each node's `max_terms` most frequent terms
+"""
+import json
+from math import log
+from os import path, replace
+from threading import Lock
+import numpy as np
+from .node_search import get_terms, get_node_text
+from .node_locks import get_temp_path
+
+_INITIAL_CAPACITY = 1024
+_REBUILD_FRACTION = 0.1
+_COMPACT_FRACTION = 0.5
+_MIN_COMPACT_SIZE = 16 * 1024       # term array positions of removed rows, below which they're never compacted
+
+#-------------------------------
+
+def _grow(array:np.ndarray, size:int, fill=0) -> np.ndarray:
+    """return the array, or a copy of it with at least double the capacity if it's smaller than `size`"""
+    if size <= len(array):
+        return array
+    grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class RelatedIndex:
+    """
+    A TF-IDF index of node text, which is updated one node at a time with `add_node()` and `remove_node()`
+    (it has the same update, load and save methods as `node_search.SearchIndex`).
+    """
+    def __init__(self, filepath:str, max_terms:int=64, query_terms:int=16):
+        self.filepath = filepath
+        self.max_terms = max_terms
+        self.query_terms = query_terms
+        self._lock = Lock()
+        self._clear()
+
+    def _clear(self):
+        self._vocabulary = {}                                           # {term: column}
+        self._terms = []                                                # column: term
+        self._df = np.zeros(_INITIAL_CAPACITY, dtype=np.int32)          # column: number of nodes with the term
+        self._idf = np.zeros(_INITIAL_CAPACITY, dtype=np.float32)       # column: idf weight, from when the term was added or last rebuild
+        # nodes, by row
+        self._ids = []                                                  # row: node id (`None` once removed)
+        self._shards = []                                               # row: shard name
+        self._rows = {}                                                 # {node id: row}
+        self._starts = np.zeros(_INITIAL_CAPACITY, dtype=np.int64)      # row: position of its first term in the term arrays
+        self._lengths = np.zeros(_INITIAL_CAPACITY, dtype=np.int32)     # row: number of terms
+        self._norms = np.zeros(_INITIAL_CAPACITY, dtype=np.float32)     # row: vector length (`inf` once removed, so it never matches)
+        # terms of every row, one after the other
+        self._columns = np.zeros(_INITIAL_CAPACITY, dtype=np.int32)
+        self._tfs = np.zeros(_INITIAL_CAPACITY, dtype=np.float32)       # `1 + log(term count)`
+        self._term_rows = np.zeros(_INITIAL_CAPACITY, dtype=np.int32)
+        self._size = 0                                                  # number of used term array positions
+        self._removed_size = 0                                          # number of those which belong to removed rows
+        # term positions sorted by term, for the first `_sorted_size` positions (`None` if it needs to be rebuilt)
+        self._sorted_size = None
+        self._order = None
+        self._column_starts = None
+        self._changes = 0                                               # number of nodes added or removed since the rebuild
+
+    #---------
+    # loading and saving
+
+    def load(self) -> dict:
+        """load the saved index, and return the shard stats it was saved with (empty if nothing could be loaded)"""
+        if not path.isfile(self.filepath):
+            return {}
+        try:
+            with np.load(self.filepath, allow_pickle=False) as data:
+                info = json.loads(str(data['info']))
+                columns, tfs, lengths = data['columns'], data['tfs'], data['lengths']
+        except (ValueError, KeyError, OSError):
+            return {}
+        with self._lock:
+            self._clear()
+            self._terms = info['terms']
+            self._vocabulary = {term: column for column, term in enumerate(self._terms)}
+            self._ids = info['ids']
+            self._shards = info['node_shards']
+            self._rows = {id: row for row, id in enumerate(self._ids)}
+            self._columns, self._tfs, self._lengths = columns.astype(np.int32), tfs.astype(np.float32), lengths.astype(np.int32)
+            self._term_rows = np.repeat(np.arange(len(lengths), dtype=np.int32), lengths)
+            self._size = len(columns)
+            self._set_starts()
+            self._df = np.bincount(columns, minlength=len(self._terms)).astype(np.int32)
+            # the idf weights and norms aren't saved, so they're calculated for the loaded rows and terms
+            self._rebuild()
+        return info['shards']
+
+    def save(self, shard_stats:dict):
+        """save the index along with the stats of the shard files it matches"""
+        with self._lock:
+            self._compact()
+            info = {'shards': shard_stats, 'terms': self._terms, 'ids': self._ids, 'node_shards': self._shards}
+            temp_path = get_temp_path(self.filepath)
+            with open(temp_path, 'wb') as file:
+                np.savez(
+                    file, info=np.array(json.dumps(info)), columns=self._columns[:self._size],
+                    tfs=self._tfs[:self._size], lengths=self._lengths[:len(self._ids)],
+                )
+            replace(temp_path, self.filepath)
+
+    #---------
+    # updating
+
+    def add_node(self, id:str, node:dict, shard:str):
+        """add a node to the index (replacing it if it's already in the index)"""
+        counts = {}
+        for term in get_terms(get_node_text(node)):
+            counts[term] = counts.get(term, 0) + 1
+        if len(counts) > self.max_terms:
+            counts = dict(sorted(counts.items(), key=lambda item: item[1], reverse=True)[:self.max_terms])
+        with self._lock:
+            self._remove(id)
+            columns = []
+            for term in counts:
+                column = self._vocabulary.get(term)
+                if column is None:
+                    column = self._vocabulary[term] = len(self._terms)
+                    self._terms.append(term)
+                columns.append(column)
+            columns = np.array(columns, dtype=np.int32)
+            self._df, self._idf = _grow(self._df, len(self._terms)), _grow(self._idf, len(self._terms))
+            self._df[columns] += 1
+            new_columns = columns[self._idf[columns] == 0]
+            self._idf[new_columns] = np.log((2 + len(self._rows)) / (1 + self._df[new_columns])) + 1
+            tfs = np.array([1 + log(count) for count in counts.values()], dtype=np.float32)
+            # append the row
+            row, start, end = len(self._ids), self._size, self._size + len(columns)
+            self._ids.append(id)
+            self._shards.append(shard)
+            self._rows[id] = row
+            self._starts, self._lengths, self._norms = (_grow(array, row + 1) for array in (self._starts, self._lengths, self._norms))
+            self._starts[row], self._lengths[row] = start, len(columns)
+            self._norms[row] = np.linalg.norm(tfs * self._idf[columns]) or np.inf
+            self._columns, self._tfs, self._term_rows = (_grow(array, end) for array in (self._columns, self._tfs, self._term_rows))
+            self._columns[start:end] = columns
+            self._tfs[start:end] = tfs
+            self._term_rows[start:end] = row
+            self._size = end
+            self._changes += 1
+
+    def remove_node(self, id:str):
+        with self._lock:
+            self._remove(id)
+
+    def remove_shard(self, shard:str):
+        """remove every node from a shard file (before re-indexing it)"""
+        with self._lock:
+            for id in [id for id, row in self._rows.items() if self._shards[row] == shard]:
+                self._remove(id)
+
+    def _remove(self, id:str):
+        row = self._rows.pop(id, None)
+        if row is None:
+            return
+        start, length = self._starts[row], self._lengths[row]
+        self._df[self._columns[start:start + length]] -= 1
+        self._ids[row] = None
+        self._norms[row] = np.inf
+        self._removed_size += int(length)
+        self._changes += 1
+        if self._removed_size > max(_MIN_COMPACT_SIZE, _COMPACT_FRACTION * self._size):
+            self._compact()
+
+    def _set_starts(self):
+        self._starts = np.zeros(len(self._lengths), dtype=np.int64)
+        np.cumsum(self._lengths[:-1], out=self._starts[1:])
+
+    def _compact(self):
+        """drop removed rows and their terms from the arrays"""
+        if not self._removed_size:
+            return
+        rows = len(self._ids)
+        keep_rows = np.array([id is not None for id in self._ids], dtype=bool)
+        new_rows = np.cumsum(keep_rows) - 1
+        keep_terms = keep_rows[self._term_rows[:self._size]]
+        self._columns = self._columns[:self._size][keep_terms]
+        self._tfs = self._tfs[:self._size][keep_terms]
+        self._term_rows = new_rows[self._term_rows[:self._size][keep_terms]].astype(np.int32)
+        self._lengths = self._lengths[:rows][keep_rows]
+        self._norms = self._norms[:rows][keep_rows]
+        self._set_starts()
+        self._ids = [id for id in self._ids if id is not None]
+        self._shards = [shard for shard, keep in zip(self._shards, keep_rows) if keep]
+        self._rows = {id: row for row, id in enumerate(self._ids)}
+        self._size = len(self._columns)
+        self._removed_size = 0
+        self._sorted_size = None
+
+    def _rebuild(self):
+        """re-calculate the idf weights and node norms, and sort the term positions by term"""
+        self._compact()
+        n_terms, n_rows = len(self._terms), len(self._ids)
+        self._idf, self._norms = _grow(self._idf, n_terms), _grow(self._norms, n_rows)
+        columns = self._columns[:self._size]
+        self._idf[:n_terms] = np.log((1 + n_rows) / (1 + self._df[:n_terms])) + 1
+        weights = self._tfs[:self._size] * self._idf[columns]
+        self._norms[:n_rows] = np.sqrt(np.bincount(self._term_rows[:self._size], weights * weights, minlength=n_rows))
+        self._norms[:n_rows][self._norms[:n_rows] == 0] = np.inf
+        self._order = np.argsort(columns, kind='stable').astype(np.int32)
+        self._column_starts = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(columns, minlength=n_terms), out=self._column_starts[1:])
+        self._sorted_size = self._size
+        self._changes = 0
+
+    #---------
+    # queries
+
+    def _text_vector(self, text:str) -> dict:
+        """get `{column: tf}` of the indexed terms in some text"""
+        counts = {}
+        for term in get_terms(text):
+            column = self._vocabulary.get(term)
+            if column is not None:
+                counts[column] = counts.get(column, 0) + 1
+        return {column: 1 + log(count) for column, count in counts.items()}
+
+    def _node_vector(self, id:str) -> dict:
+        row = self._rows.get(id)
+        if row is None:
+            return {}
+        start, length = self._starts[row], self._lengths[row]
+        return dict(zip(self._columns[start:start + length].tolist(), self._tfs[start:start + length].tolist()))
+
+    def _query_weights(self, vector:dict) -> tuple:
+        """get the columns and normalized weights of the highest weighted `query_terms` terms of a `{column: tf}` vector"""
+        columns = np.fromiter(vector, dtype=np.int32, count=len(vector))
+        weights = np.fromiter(vector.values(), dtype=np.float32, count=len(vector)) * self._idf[columns]
+        norm = np.linalg.norm(weights)
+        if len(columns) > self.query_terms:
+            top = np.argpartition(weights, -self.query_terms)[-self.query_terms:]
+            columns, weights = columns[top], weights[top]
+        return columns, weights / norm
+
+    def _score(self, vectors:list[dict], limit:int, exclude:list) -> list[list[tuple[float, str]]]:
+        """get the top `limit` `(cosine similarity, node id)` matches of each `{column: tf}` query vector,
+        not including the node id at the same position in `exclude`.
+        The idf weights and positions added since the sort are shared by the whole batch"""
+        if self._sorted_size is None or self._changes > _REBUILD_FRACTION * len(self._rows):
+            self._rebuild()
+        queries = [self._query_weights(vector) if vector else None for vector in vectors]
+        all_columns = np.unique(np.concatenate([query[0] for query in queries if query] or [np.zeros(0, dtype=np.int32)]))
+        # positions added since the sort with any of the queries' terms (found together, since they have to be scanned)
+        added_positions = self._sorted_size + np.flatnonzero(np.isin(self._columns[self._sorted_size:self._size], all_columns))
+        added_columns = self._columns[added_positions]
+        n_sorted_columns = len(self._column_starts) - 1
+        lookup = np.zeros(len(self._terms), dtype=np.float32)
+        results = []
+        for query, excluded in zip(queries, exclude):
+            if query is None:
+                results.append([])
+                continue
+            query_columns, query_weights = query
+            # the positions of the query's terms: from the sorted positions, and from the positions added since
+            positions = [
+                self._order[self._column_starts[column]:self._column_starts[column + 1]]
+                for column in query_columns.tolist() if column < n_sorted_columns
+            ]
+            positions.append(added_positions[np.isin(added_columns, query_columns)])
+            positions = np.concatenate(positions)
+            columns, rows = self._columns[positions], self._term_rows[positions]
+            lookup[query_columns] = query_weights
+            weights = self._tfs[positions] * self._idf[columns] * lookup[columns] / self._norms[rows]
+            scores = np.bincount(rows, weights, minlength=len(self._ids))
+            lookup[query_columns] = 0
+            excluded_row = self._rows.get(excluded)
+            if excluded_row is not None:
+                scores[excluded_row] = 0
+            top = np.flatnonzero(scores > 0)
+            if limit is not None and len(top) > limit:
+                top = top[np.argpartition(scores[top], -limit)[-limit:]]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            results.append([(float(scores[row]), self._ids[row]) for row in top])
+        return results
+
+    def similar_to_nodes(self, ids:list[str], limit:int=10) -> dict:
+        """return `{node id: [(cosine similarity, node id), ...]}` of the top `limit` most similar nodes to each node
+        (from most to least similar, not including the node itself), all scored in one batch"""
+        with self._lock:
+            results = self._score([self._node_vector(id) for id in ids], limit, ids)
+        return dict(zip(ids, results))
+
+    def similar_to_text(self, text:str, limit:int=10) -> list[tuple[float, str]]:
+        """return `(cosine similarity, node id)` tuples of the top `limit` nodes most similar to some text"""
+        with self._lock:
+            return self._score([self._text_vector(text)], limit, [None])[0]
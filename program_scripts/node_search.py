@@ -0,0 +1,148 @@
+"""
+inverted index for full-text node search.
+
+`SearchIndex` maps each term to the nodes containing it (with term frequencies),
+and ranks matches with BM25 relevance scoring, so a query only ever looks at the nodes which contain its terms.
+"""
+import json
+import re
+import heapq
+from math import log
+from os import path, replace
+from threading import Lock
+from .node_locks import get_temp_path
+
+_TERM_PATTERN = re.compile(r"[^\W_]+")
+
+# BM25 tuning values (these are the usual defaults)
+_K1 = 1.2
+_B = 0.75
+
+#-------------------------------
+
+def get_terms(text:str) -> list[str]:
+    """split text into lowercase search terms (words and numbers, without punctuation)"""
+    return _TERM_PATTERN.findall(text.lower())
+
+def get_node_text(node:dict) -> str:
+    """get all of the searchable text of a node (its name, and its content if the content is text)"""
+    if not isinstance(node, dict):
+        return ''
+    cont = node.get('cont')
+    return node.get('name', '') + ' ' + (cont if isinstance(cont, str) else '')
+
+
+class SearchIndex:
+    """
+    An inverted index of node terms, which is updated one node at a time with `add_node()` and `remove_node()`.
+
+    Every node is also tagged with the name of the shard file it's stored in,
+    so all of a shard's nodes can be re-indexed if the shard file was changed outside of the app.
+    """
+    def __init__(self, filepath:str):
+        self.filepath = filepath
+        self._lock = Lock()
+        self._postings = {}             # {term: {node id: term frequency}}
+        self._docs = {}                 # {node id: [shard name, number of terms, [distinct terms]]}
+        self._total_length = 0          # total number of terms across all nodes (for the average node length)
+
+    #---------
+    # loading and saving
+
+    def load(self) -> dict:
+        """load the saved index, and return the shard stats it was saved with (empty if nothing could be loaded)"""
+        if not path.isfile(self.filepath):
+            return {}
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except ValueError:
+            return {}
+        with self._lock:
+            self._postings = data['postings']
+            self._docs = data['docs']
+            self._total_length = sum(doc[1] for doc in self._docs.values())
+        return data['shards']
+
+    def save(self, shard_stats:dict):
+        """save the index along with the stats of the shard files it matches"""
+        with self._lock:
+            temp_path = get_temp_path(self.filepath)
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                file.write(json.dumps({'shards': shard_stats, 'docs': self._docs, 'postings': self._postings}))
+            replace(temp_path, self.filepath)
+
+    #---------
+    # updating
+
+    def add_node(self, id:str, node:dict, shard:str):
+        """add a node to the index (replacing it if it's already in the index)"""
+        terms = get_terms(get_node_text(node))
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        with self._lock:
+            self._remove(id)
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[id] = tf
+            self._docs[id] = [shard, len(terms), list(counts)]
+            self._total_length += len(terms)
+
+    def remove_node(self, id:str):
+        with self._lock:
+            self._remove(id)
+
+    def remove_shard(self, shard:str):
+        """remove every node from a shard file (before re-indexing it)"""
+        with self._lock:
+            for id in [id for id, doc in self._docs.items() if doc[0] == shard]:
+                self._remove(id)
+
+    def _remove(self, id:str):
+        doc = self._docs.pop(id, None)
+        if not doc:
+            return
+        self._total_length -= doc[1]
+        for term in doc[2]:
+            posting = self._postings[term]
+            del posting[id]
+            if not posting:
+                del self._postings[term]
+
+    #---------
+    # searching
+
+    def _score_matches(self, search:str) -> dict:
+        """get the BM25 score of every node which contains at least one search term"""
+        scores = {}
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs:
+                return scores
+            avg_length = self._total_length / n_docs
+            for term in set(get_terms(search)):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for id, tf in posting.items():
+                    norm = _K1 * (1 - _B + _B * self._docs[id][1] / avg_length)
+                    scores[id] = scores.get(id, 0) + idf * tf * (_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, search:str, limit:int=None) -> list[tuple[float, str]]:
+        """return `(score, node id)` tuples of the best matching nodes, ordered from most to least relevant.
+        Only the top `limit` matches are returned (all if `None`)"""
+        scores = self._score_matches(search)
+        if limit is None:
+            return sorted(((score, id) for id, score in scores.items()), reverse=True)
+        return heapq.nlargest(limit, ((score, id) for id, score in scores.items()))
+
+    def iter_search(self, search:str):
+        """generator which yields `(score, node id)` tuples from most to least relevant.
+        Matches are only ordered as they're taken, so stopping early skips sorting the rest of them"""
+        heap = [(-score, id) for id, score in self._score_matches(search).items()]
+        heapq.heapify(heap)
+        while heap:
+            score, id = heapq.heappop(heap)
+            yield -score, id
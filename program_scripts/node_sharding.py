@@ -0,0 +1,134 @@
+"""
+sharding policies for the node store, which decide when new nodes go into a new shard file.
+
+Shard files are named by the month their nodes were created in, and a month can be split into numbered parts:
+`YYYYMM_nodes.json`, then `YYYYMM_001_nodes.json`, `YYYYMM_002_nodes.json`, ... (or `.bin`).
+* `MonthShardPolicy`: one shard per month (the original layout)
+* `SizeShardPolicy`: a new part once the current one reaches `max_bytes`
+* `CountShardPolicy`: a new part once the current one holds `max_nodes` nodes
+
+`ShardManifest` keeps the policy and the list of shards in `shard_manifest.json`, so a store keeps its policy
+when reopened, and its shards are known without checking every file name in the storage folder.
+`ReadWriteNodes.rebalance_shards()` rewrites existing shards to fit a policy (see `node_rebalance.py`).
+"""
+import json
+import re
+from os import path, replace
+from .node_locks import get_temp_path
+
+_SHARD_STEM = re.compile(r'^(\d{4}(?:0[1-9]|1[0-2]))(?:_(\d+))?_nodes$')    # month, and part number (none for the first part)
+
+#-------------------------------
+
+def get_shard_stem(month:str, part:int=0) -> str:
+    """get the file name (without extension) of a month's shard part"""
+    return f'{month}_{part:03}_nodes' if part else f'{month}_nodes'
+
+def parse_shard_stem(stem:str) -> tuple[str, int]:
+    """get `(month, part)` from a shard file name (without extension), or `None` if it isn't a shard file name"""
+    match = _SHARD_STEM.match(stem)
+    if not match:
+        return None
+    return match[1], int(match[2] or 0)
+
+
+class ShardPolicy:
+    """
+    Base class of the sharding policies. Shards are always split by month, and a policy can also split a month into parts.
+    """
+    kind = None
+
+    def is_full(self, count:int, size:int) -> bool:
+        """check if a shard with `count` nodes taking up `size` bytes (including its journals) should get no more new nodes"""
+        return False
+
+    def get_config(self) -> dict:
+        return {'kind': self.kind}
+
+    def __eq__(self, other):
+        return isinstance(other, ShardPolicy) and self.get_config() == other.get_config()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{k}={v!r}" for k, v in self.get_config().items() if k != "kind")})'
+
+
+class MonthShardPolicy(ShardPolicy):
+    """
+    One shard per month.
+    """
+    kind = 'month'
+
+
+class SizeShardPolicy(ShardPolicy):
+    """
+    A new shard part once the current one reaches `max_bytes` (checked against what's been written,
+    so a single batch of writes can go over it).
+    """
+    kind = 'size'
+
+    def __init__(self, max_bytes:int=8 * 2**20):
+        self.max_bytes = max_bytes
+
+    def is_full(self, count:int, size:int) -> bool:
+        return size >= self.max_bytes
+
+    def get_config(self) -> dict:
+        return {'kind': self.kind, 'max_bytes': self.max_bytes}
+
+
+class CountShardPolicy(ShardPolicy):
+    """
+    A new shard part once the current one holds `max_nodes` nodes.
+    """
+    kind = 'count'
+
+    def __init__(self, max_nodes:int=10_000):
+        self.max_nodes = max_nodes
+
+    def is_full(self, count:int, size:int) -> bool:
+        return count >= self.max_nodes
+
+    def get_config(self) -> dict:
+        return {'kind': self.kind, 'max_nodes': self.max_nodes}
+
+
+SHARD_POLICIES = {policy.kind: policy for policy in (MonthShardPolicy, SizeShardPolicy, CountShardPolicy)}
+
+def get_policy(config:dict) -> ShardPolicy:
+    """make a policy from its `get_config()` dict"""
+    config = dict(config)
+    kind = config.pop('kind')
+    if kind not in SHARD_POLICIES:
+        raise ValueError(f"shard policy kind must be one of {tuple(SHARD_POLICIES)}, not '{kind}'")
+    return SHARD_POLICIES[kind](**config)
+
+
+class ShardManifest:
+    """
+    The sharding policy of a storage folder, and the file names of its shards (in order).
+    """
+    def __init__(self, filepath:str):
+        self.filepath = filepath
+        self.policy = None
+        self.shards = []
+
+    def load(self) -> bool:
+        """load the saved manifest, and return `False` if there isn't one (or it couldn't be read)"""
+        if not path.isfile(self.filepath):
+            return False
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            policy = get_policy(data['policy'])
+            shards = list(data['shards'])
+        except (ValueError, KeyError, TypeError):
+            return False
+        self.policy = policy
+        self.shards = shards
+        return True
+
+    def save(self):
+        temp_path = get_temp_path(self.filepath)
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'policy': self.policy.get_config(), 'shards': self.shards}, file, indent=1)
+        replace(temp_path, self.filepath)
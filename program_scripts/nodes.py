@@ -1,78 +1,1328 @@
 import json
-from datetime import datetime
-from os import path, listdir
+import logging
+import re
+import heapq
+from collections import OrderedDict
+from copy import deepcopy
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, ExitStack
+from datetime import datetime, timedelta
+from mmap import mmap, ACCESS_READ
+from os import path, listdir, remove, replace, stat, fsync
+from threading import Lock, Thread, Timer
+from time import perf_counter
+from .node_search import SearchIndex, get_terms, get_node_text
+from .node_links import LinkIndex, LINK_TYPES
+from .node_names import NameIndex
+try:
+    from .node_related import RelatedIndex
+except ImportError:         # NumPy isn't installed, so there's no related nodes index
+    RelatedIndex = None
+from .node_blobs import BlobStore, is_blob_ref
+from .node_changes import ChangeFeed
+from .node_history import NodeHistory
+from .node_locks import RWLock, get_temp_path
+from .node_model import NodeIds, CompactNodeTable, compact_node, expand_node, release_node
+from .node_sharding import ShardPolicy, MonthShardPolicy, ShardManifest, get_shard_stem, parse_shard_stem
+from . import node_binary
+
+_logger = logging.getLogger(__name__)
 
 # currently in the 'nodes' folder in same dir as this script
 STORAGE_DIR = path.join(path.dirname(__file__), 'nodes')
-DELETED_NODES_FILEPATH = path.join(STORAGE_DIR, 'deleted_nodes.json')
+DELETED_NODES_FILEPATH = path.join(STORAGE_DIR, 'deleted_nodes.json')      # old single file store, moved into the tombstone journal on startup
+TOMBSTONES_FILEPATH = path.join(STORAGE_DIR, 'deleted_nodes.journal')
+INDEX_FILEPATH = path.join(STORAGE_DIR, 'node_index.json')
+SEARCH_INDEX_FILEPATH = path.join(STORAGE_DIR, 'search_index.json')
+LINK_INDEX_FILEPATH = path.join(STORAGE_DIR, 'link_index.json')
+NAME_INDEX_FILEPATH = path.join(STORAGE_DIR, 'name_index.json')
+RELATED_INDEX_FILEPATH = path.join(STORAGE_DIR, 'related_index.npz')
+SHARD_MANIFEST_FILEPATH = path.join(STORAGE_DIR, 'shard_manifest.json')
+CHANGES_FILEPATH = path.join(STORAGE_DIR, 'node_changes.journal')
+HISTORY_FILEPATH = path.join(STORAGE_DIR, 'node_history.journal')
+
+SHARD_FORMAT_EXTENSIONS = {'json': '.json', 'binary': '.bin'}
+_STREAM_REWRITE_SIZE = 32 * 1024 * 1024         # JSON shard files at least this big are streamed when rewritten, rather than loaded whole
+_SHARD_FILE_LOCATIONS = ('json', 'bin')         # index entry locations for nodes in the shard file itself (not a journal)
+_TEMP_SUFFIX = re.compile(r'(\.\d+-\d+)?\.tmp$')     # of a temp file to write a shard file to (see `node_locks.get_temp_path()`)
+
+_JSON_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_JSON_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\],:]')      # a whole string (so brackets inside strings are skipped), or a structural character
+_JSON_SHARD_KEY = re.compile(r'\n ("(?:[^"\\]|\\.)*"): ')      # a node id key in `json.dump(content, file, indent=1)` output (only they're indented by 1)
+
+
+#-------------------------------
+# shard file reading functions (module level, so they can also be used in worker processes)
+
+def _journal_paths(filepath) -> tuple[str, str]:
+    """return the live journal path and the compacting (rotated) journal path for a shard file"""
+    journal_path = path.splitext(filepath)[0] + '.journal'
+    return journal_path, journal_path + '.compacting'
+
+def _iter_journal(journal_path, offset:int=0):
+    """generator which yields `(byte offset, byte length, record)` for every record in a journal file, starting at the byte `offset`"""
+    if not path.isfile(journal_path):
+        return
+    with open(journal_path, 'rb') as file:
+        file.seek(offset)
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:                  # skip a partly written last record (if a write was interrupted)
+                record = None
+            if record:
+                yield offset, len(line), record
+            offset += len(line)
+
+def _get_journal_changes(journal_path, changes:dict):
+    """add every record in a journal file to a `{id: node}` dict of changes (deleted nodes are `None`).
+    Records hold the full node state, so replaying the same records more than once gives the same result"""
+    for _, _, record in _iter_journal(journal_path):
+        changes[record['id']] = None if record['op'] == 'delete' else record['node']
+
+def _apply_changes(nodes, changes:dict):
+    """generator which applies a `{id: node}` dict of changes (deleted nodes are `None`) to a stream of `(id, node)` pairs.
+    Changed nodes keep their place, and new nodes are yielded at the end"""
+    for id, node in nodes:
+        if id in changes:
+            node = changes.pop(id)
+            if node is None:
+                continue
+        yield id, node
+    for id, node in changes.items():
+        if node is not None:
+            yield id, node
+
+def _is_binary(filepath) -> bool:
+    """check if a shard file (or its temp file) is in the binary format"""
+    return _TEMP_SUFFIX.sub('', filepath).endswith(SHARD_FORMAT_EXTENSIONS['binary'])
+
+def _iter_shard_file(filepath, read_nodes:bool=False):
+    """generator which yields `(id, byte offset, byte length, node)` for every node in a shard file of either format
+    (`node` is only parsed if `read_nodes` is `True`, otherwise it's `None`)"""
+    if _is_binary(filepath):
+        return node_binary.iter_binary_shard(filepath, read_nodes)
+    return _iter_json_shard_file(filepath, read_nodes)
+
+def _iter_json_shard_file(filepath, read_nodes:bool=False):
+    """generator which yields `(id, byte offset, byte length, node)` for every node in a JSON shard file
+    (`node` is only parsed if `read_nodes` is `True`, otherwise it's `None`).
+    The file is memory-mapped and scanned one token at a time, so memory use doesn't grow with the size of the file"""
+    if not stat(filepath).st_size:
+        return
+    with open(filepath, 'rb') as file, mmap(file.fileno(), 0, access=ACCESS_READ) as data:
+        state = 'start'
+        for token in _JSON_TOKEN.finditer(data):
+            char = data[token.start()]          # only look at the first byte, so long strings aren't copied
+            if state == 'start':                # the opening '{' of the whole shard
+                state = 'key'
+            elif state == 'key':
+                if char == ord('}'):            # empty shard
+                    return
+                id = json.loads(data[token.start():token.end()])
+                state = 'colon'
+            elif state == 'colon':
+                start = _JSON_WHITESPACE.match(data, token.end()).end()
+                first = data[start]
+                depth = 0
+                state = 'nested' if first in b'{[' else 'string' if first == ord('"') else 'scalar'
+            elif state == 'nested' or state == 'string':
+                if char in b'{[':
+                    depth += 1
+                elif char in b'}]':
+                    depth -= 1
+                if depth == 0 and char in b'}]"':
+                    yield id, start, token.end() - start, json.loads(data[start:token.end()]) if read_nodes else None
+                    state = 'comma'
+            elif state == 'scalar':             # a number, true/false or null ends at the next ',' or '}'
+                end = token.start()
+                while data[end - 1] in b' \t\n\r':
+                    end -= 1
+                yield id, start, end - start, json.loads(data[start:end]) if read_nodes else None
+                if char == ord('}'):
+                    return
+                state = 'key'
+            elif state == 'comma':
+                if char == ord('}'):
+                    return
+                state = 'key'
+
+def _get_json_shard_entries(text:str) -> dict:
+    """find the index entries (location, byte offset and length) of every node in the text of a shard written by `json.dumps(content, indent=1)`.
+    Only the top level keys start a line with a single space, so they can be found without parsing the nodes"""
+    entries = {}
+    keys = list(_JSON_SHARD_KEY.finditer(text))
+    for key, next_key in zip(keys, keys[1:] + [None]):
+        end = next_key.start() - 1 if next_key else len(text) - 2      # before the ',' between nodes, or the '\n}' at the end
+        entries[json.loads(key[1])] = ['json', key.end(), end - key.end()]
+    return entries
+
+def _iter_shard(filepath, live_journal:bool=True):
+    """generator which yields `(id, node)` for every node in a shard, with its journal records applied.
+    The shard file is streamed, so only one node (plus the journal records) is in memory at a time"""
+    journal_path, compacting_path = _journal_paths(filepath)
+    changes = {}
+    _get_journal_changes(compacting_path, changes)    # the compacting journal is older than the live one, so apply it first
+    if live_journal:
+        _get_journal_changes(journal_path, changes)
+    file_nodes = ((id, node) for id, _, _, node in _iter_shard_file(filepath, read_nodes=True))
+    yield from _apply_changes(file_nodes, changes)
+
+def _read_blob_content(node, blobs:BlobStore):
+    """get a node with the text of its content blob in place of the reference (if it has one)"""
+    if isinstance(node, dict) and is_blob_ref(node.get('cont')):
+        node = dict(node, cont=blobs.read_text(node['cont']))
+    return node
+
+def _scan_search_shard(filepath, terms:list[str], limit:int=None, blob_dir:str=None) -> list[tuple[float, str, dict]]:
+    """search every node in a shard (without using the search index), and return `(score, id, node)` tuples of the best matches.
+    The score is the number of distinct search terms in the node, plus how much of the node's text they make up (less than 1).
+    Content stored in the blob store in `blob_dir` is searched and returned as its text"""
+    terms = set(terms)
+    blobs = BlobStore(blob_dir) if blob_dir else None
+    matches = []
+    for id, node in _iter_shard(filepath):
+        if blobs:
+            node = _read_blob_content(node, blobs)
+        node_terms = get_terms(get_node_text(node))
+        found = [term for term in node_terms if term in terms]
+        if found:
+            matches.append((len(set(found)) + len(found) / (len(node_terms) + 1), id, node))
+    if limit is None:
+        return matches
+    return heapq.nlargest(limit, matches, key=lambda match: match[:2])
+
+
+class _NodeCache:
+    """
+    A bounded LRU cache of parsed nodes.
+
+    Each node is stored with the index entry and file version (from `stat`) it was read with,
+    and is only returned if both still match, so nodes changed by this app or by anything else are never stale.
+    Nodes are kept in their compact form (see `node_model.py`), and a new dict is made for every hit,
+    so changing a returned node can't change the cached one.
+    """
+    def __init__(self, max_size:int, ids:NodeIds):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._ids = ids
+        self._lock = Lock()
+        self._nodes = OrderedDict()     # {node id: (index entry, file version, compact node)}
+
+    def get(self, id:str, entry:list, version:tuple):
+        """return `(True, node)` if the node is cached with the same entry and version, otherwise `(False, None)`"""
+        with self._lock:
+            cached = self._nodes.get(id)
+            if cached and cached[0] == entry and cached[1] == version:
+                self._nodes.move_to_end(id)
+                self.hits += 1
+                return True, expand_node(cached[2], self._ids)
+            self.misses += 1
+            return False, None
+
+    def put(self, id:str, entry:list, version:tuple, node):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._release(self._nodes.get(id))
+            self._nodes[id] = (list(entry), version, compact_node(node, self._ids))
+            self._nodes.move_to_end(id)
+            while len(self._nodes) > self.max_size:
+                self._release(self._nodes.popitem(last=False)[1])
+                self.evictions += 1
+
+    def _release(self, cached):
+        # drop the link ids of a node which is no longer cached from the id table, so it only holds the ids of cached nodes
+        if cached:
+            release_node(cached[2], self._ids)
+
+    def remove(self, id:str):
+        with self._lock:
+            self._release(self._nodes.pop(id, None))
+
+    def clear(self):
+        with self._lock:
+            for cached in self._nodes.values():
+                self._release(cached)
+            self._nodes.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._nodes), 'max_size': self.max_size}
 
 
 class ReadWriteNodes:
-    def __init__(self):
+    """
+    Read, write, and search nodes stored in monthly `YYYYMM_nodes.json` shard files,
+    in `storage_dir` (the `nodes` folder next to this script by default).
+
+    - `shard_format`: the format for new shard files, either `'json'` or `'binary'` (the compact `YYYYMM_nodes.bin` format
+    from `node_binary.py`). Shard files of both formats can be read and written no matter which is set,
+    and `convert_shards()` converts all existing shard files to one format.
+
+    - `shard_policy`: when to start a new shard file (see `node_sharding.py`): every month (`MonthShardPolicy`, the default),
+    or also once the current month's shard reaches a size (`SizeShardPolicy`) or node count (`CountShardPolicy`), as `YYYYMM_001_nodes.json`, ...
+    The policy and the list of shard files are kept in `shard_manifest.json`, so a store keeps its policy when reopened without one.
+    `rebalance_shards()` rewrites the existing shard files to fit a new policy.
+
+    - `journal`: if `True`, every create/edit/delete is appended as a single record to the shard's
+    `YYYYMM_nodes.journal` file instead of rewriting the whole shard file.
+    Once a journal holds `compact_threshold` records, it gets merged back into the shard file in a background thread.
+    Shard reads always replay any journal records on top of the shard file, so both modes can be mixed freely.
+
+    A node index maps each node id to its shard file and the byte offset of the node within it (or within a journal),
+    so single node lookups only need to seek to and parse that one node.
+    The index is saved to `node_index.json` by `save_index()` and `compact()`, and on startup any shard files
+    that changed since it was saved are re-scanned (for a journal that was only appended to, just its new records are scanned).
+
+    `search_nodes()` uses an inverted index of node terms (see `node_search.py`), which is updated on every create/edit/delete
+    and saved to `search_index.json` along with the node index.
+    In the same way, `links` is an index of the `supe`/`side`/`sub` links between nodes (see `node_links.py`),
+    which can traverse the node graph without reading any nodes. Deleting a node also removes the links to it from other nodes.
+    And `search_node_names()` uses `names`, an index of node names (see `node_names.py`) for typo tolerant and prefix lookups.
+    If NumPy is installed, `related` is a TF-IDF index of node text (see `node_related.py`),
+    which `related_nodes()` and `suggest_side_links()` use to find similar nodes.
+
+    Writes can be batched, so that many creates/edits/deletes only need one write (and one fsync) per shard file:
+    * inside a `with nodes.batch():` block, writes are held until the block ends
+    * `group_commit`: if more than `0`, every write is held for up to this many seconds, and then all held writes are written together
+    Held writes can be read with `get_node()` right away, but are only found by `search_nodes()` once they're written.
+    Held writes which fail to be written stay held for the next flush, and `close()` writes any that are left before the app exits.
+
+    `get_node()` keeps up to `cache_size` recently read nodes in an LRU cache (`0` turns it off).
+    A cached node is only used if the file it was read from hasn't changed since (by size and modified time),
+    or for a node in a journal, if the journal is the same file (records are only ever appended to it).
+    `cache_stats()` returns hit/miss/eviction counts for sizing the cache.
+    Cached nodes are kept in a compact form (see `node_model.py`), with link ids interned in `node_ids` (only while a cached node links to them),
+    and `get_compact_nodes()` reads every node into a compact working set.
+
+    Deleted nodes are appended as tombstone records to `deleted_nodes.journal`, so a delete never rewrites the deleted nodes,
+    and `restore_node()` puts a deleted node back with only one more appended record.
+    A tombstone also records the links to the node which were removed from other nodes, and restoring the node puts them back.
+    Every `compact_threshold` tombstone records, the journal is purged of restored nodes and of tombstones older than
+    `deleted_max_age` days or beyond the newest `deleted_max_count` (`None` keeps them all). `purge_deleted_nodes()` purges it right away.
+
+    Text content of at least `blob_threshold` characters (`None` to turn this off) is stored once in a content-addressed
+    blob store (see `node_blobs.py`) instead of in the shard file, and the node's `cont` is a `{'blob': digest, 'size': int}`
+    reference to it, so shard rewrites and edits of the node's other fields don't copy the content again.
+    `get_node()` reads the content in place of the reference (unless `blob_refs` is `True`, for the reference itself, which `read_content()` reads),
+    and editing a node with the reference keeps the same content. `collect_blobs()` deletes blobs which no node (or deleted node, or node version) uses anymore.
+
+    Every write is also published to `changes`, a feed of change events with increasing sequence numbers (see `node_changes.py`),
+    kept in `node_changes.journal` (the newest `max_changes` of them). Views and indexes can subscribe to new changes,
+    or read the changes since the last one they handled, instead of re-reading the shard files.
+
+    If `history` is `True`, every edit also saves a version of the node to `node_history.journal` (see `node_history.py`),
+    as a compressed delta from the version before it, and every `history_checkpoint_interval` versions as a whole node,
+    so any version is read from at most that many records. `get_node_versions()` lists a node's versions, and `get_node_version()` reads one.
+    Only the newest `history_max_revisions` versions of each node are kept (`None` keeps them all), and `purge_node_history()`
+    also removes the versions of nodes which are gone for good (so `collect_blobs()` can delete the blobs only they used).
+
+    Every shard has its own readers-writer lock (see `node_locks.py`), so reads of a shard happen at the same time,
+    and writes to different shards do too (only writes to the same shard wait for each other).
+    If `process_locks` is `True`, the locks are also held on lock files, so other processes using the same storage folder
+    wait for them too, and a write first reads in any changes another process made to the shard it writes to.
+    Reads only see other processes' changes after `refresh()`. `update_node()` reads and edits a node with its shard locked,
+    so updates from different threads or processes can't overwrite each other's changes.
+    New node ids are reserved when they're made, so nodes created by different threads in the same microsecond get different ids,
+    and a created node whose id another process stored first gets the next free id when it's written (which `create_node()` returns).
+
+    `scan_search_nodes()` searches the shard files themselves instead of the search index (ex: for a cold or out of date index),
+    with each shard scanned in its own process, using up to `search_workers` processes (`None` for one per CPU).
+    """
+    def __init__(self, journal:bool=False, compact_threshold:int=1000, group_commit:float=0, cache_size:int=1024, shard_format:str='json', search_workers:int=None,
+                 deleted_max_age:float=None, deleted_max_count:int=None, storage_dir:str=None, blob_threshold:int=64 * 1024,
+                 shard_policy:ShardPolicy=None, max_changes:int=100_000, history:bool=True, history_checkpoint_interval:int=16,
+                 history_max_revisions:int=100, process_locks:bool=True):
+        if shard_format not in SHARD_FORMAT_EXTENSIONS:
+            raise ValueError(f"shard_format must be one of {tuple(SHARD_FORMAT_EXTENSIONS)}, not '{shard_format}'")
+        self.shard_format = shard_format
+        self.storage_dir = storage_dir or STORAGE_DIR
+        # the same storage files, but in `storage_dir` if it was given
+        (
+            self.__index_filepath, self.__deleted_nodes_filepath, self.__tombstones_filepath, shard_manifest_filepath, changes_filepath, history_filepath,
+            search_index_filepath, link_index_filepath, name_index_filepath, related_index_filepath,
+        ) = (
+            path.join(storage_dir, path.basename(filepath)) if storage_dir else filepath
+            for filepath in (
+                INDEX_FILEPATH, DELETED_NODES_FILEPATH, TOMBSTONES_FILEPATH, SHARD_MANIFEST_FILEPATH, CHANGES_FILEPATH, HISTORY_FILEPATH,
+                SEARCH_INDEX_FILEPATH, LINK_INDEX_FILEPATH, NAME_INDEX_FILEPATH, RELATED_INDEX_FILEPATH,
+            )
+        )
         self.current_nodes_filepath = None
+        self.shard_policy = shard_policy           # the one in the shard manifest (or by month) if not given
+        self.__manifest = ShardManifest(shard_manifest_filepath)
+        self.__shard_lock = Lock()                  # for starting new shard files
         self.time_str_format_1 = '%Y%m%d%H%M%S%f'
         self.time_str_format_2 = '%Y-%m-%d_%H:%M:%S:%f'
         self.year_month_str_format = '%Y%m'
 
+        self.journal = journal
+        self.compact_threshold = compact_threshold
+        self.process_locks = process_locks
+        self.__index_lock = Lock()                  # for changes to the node index (only held briefly, never while writing a file)
+        self.__shard_locks = {}                     # {lock file path: RWLock} (see `__get_shard_lock()`)
+        self.__shard_locks_lock = Lock()
+        self.__seen_stats = {}                      # {shard filepath: stats of the shard files as of when its index entries were last updated}
+        self.__journal_counts = {}                  # number of records in each shard's journal file, counted on first append
+        self.__compacting = set()                   # shard filepaths with a compaction scheduled or running
+
+        self.__shard_index = {}                     # {shard filepath: {node id: [location, byte offset, byte length]}}
+        self.__node_shards = {}                     # {node id: shard filepath}
+        self.__shard_versions = {}                  # {shard filepath: version of the shard file the index entries were found in}
+        self.search_index = SearchIndex(search_index_filepath)
+        self.links = LinkIndex(link_index_filepath)
+        self.names = NameIndex(name_index_filepath)
+        self.related = RelatedIndex(related_index_filepath) if RelatedIndex else None
+        self.changes = ChangeFeed(changes_filepath, max_changes, changes_filepath + '.lock' if process_locks else None)
+        self.history = NodeHistory(
+            history_filepath, history_checkpoint_interval, history_filepath + '.lock' if process_locks else None, max_revisions=history_max_revisions,
+        ) if history else None
+        # indexes which are updated with the content of every written node
+        self.__content_indexes = tuple(index for index in (self.search_index, self.links, self.names, self.related) if index)
+
+        self.group_commit = group_commit
+        self.last_batch_stats = None
+        self.__batch_lock = Lock()
+        # held shared while writing a record right away, and exclusively by `flush()`, so held records are never written after newer ones
+        self.__flush_lock = RWLock()
+        self.__batch_depth = 0                      # number of `batch()` blocks currently open
+        self.__commit_timer = None
+        self.__pending = []                         # held write records: (shard filepath, op, node id, node)
+        self.__pending_nodes = {}                   # {node id: (shard filepath, node or None if deleted)} for reading held writes
+        self.__held_creates = {}                    # {shard filepath: number of held creates}, for the shard policy
+        self.__reserved_ids = set()                 # ids from `__new_id()` of nodes which aren't written or held yet
+
+        self.node_ids = NodeIds()                   # interned link ids of the cached nodes (see `node_model.py`)
+        self.__cache = _NodeCache(cache_size, self.node_ids)
+        self.__string_tables = {}                   # {binary shard filepath: (file version, string table)}
+        self.search_workers = search_workers
+
+        self.blob_threshold = blob_threshold
+        self.blobs = BlobStore(path.join(self.storage_dir, 'blobs'))
+        self.__blob_lock = RWLock()                 # held shared by writes, and exclusively by `collect_blobs()`
+
+        self.deleted_max_age = deleted_max_age
+        self.deleted_max_count = deleted_max_count
+        self.__tombstone_lock = RWLock(self.__tombstones_filepath + '.lock' if process_locks else None)
+        self.__tombstones_version = None            # version of the tombstone journal when it was last read or written by this process
+        self.__tombstones = None                    # {deleted node id: [byte offset, byte length, deletion time]}, read on first use
+        self.__tombstone_records = 0                # number of records in the tombstone journal (including restored and purgeable ones)
+        self.__tombstones_appended = 0              # number of records appended since the tombstone journal was last purged
+        self.__removed_links = {}                   # {deleted node id: [[linking node id, link type, position], ...]} until its tombstone is written
+
         self.__setup_files()
+        self.__load_index()
 
     def __read_file(self, filepath) -> dict:
         with open(filepath, 'r', encoding='utf-8') as file:
             return json.load(file)
-    
-    def __write_file(self, filepath, content:dict):
+
+    def __write_file(self, filepath, content:dict, sync:bool=False):
         with open(filepath, 'w', encoding='utf-8') as file:
             json.dump(content, file, indent=1)
+            if sync:
+                file.flush()
+                fsync(file.fileno())
 
     def __setup_files(self):
-        # create current node storage file name by combining current year+month with '_nodes.json'
-        f_name = datetime.now().strftime(self.year_month_str_format) + '_nodes.json'
-        self.current_nodes_filepath = path.join(STORAGE_DIR, f_name)
-        # if this file name does not exist in the storage folder, then create it with empty dict
-        if not path.isfile(self.current_nodes_filepath):
-            self.__write_file(self.current_nodes_filepath, {})
-        # also create deleted nodes file if it doesn't exist yet
-        if not path.isfile(DELETED_NODES_FILEPATH):
-            self.__write_file(DELETED_NODES_FILEPATH, {})
+        # the shard policy in the manifest is used unless a different one was given (which is then saved in its place)
+        self.__manifest.load()
+        if self.shard_policy is None:
+            self.shard_policy = self.__manifest.policy or MonthShardPolicy()
+        self.__manifest.policy = self.shard_policy
+        self.__find_shards()
+        # new nodes go into this month's last shard file (of any format), which is created if there isn't one yet
+        with self.__shard_lock:
+            self.current_nodes_filepath = self.__get_month_shard(datetime.now().strftime(self.year_month_str_format))
+        # deleted nodes used to all be kept in one file, so move them into the tombstone journal
+        if path.isfile(self.__deleted_nodes_filepath):
+            deleted_nodes = self.__read_file(self.__deleted_nodes_filepath)
+            self.__append_tombstones([('delete', id, node) for id, node in deleted_nodes.items()], sync=True)
+            remove(self.__deleted_nodes_filepath)
+
+    @staticmethod
+    def __get_shard_key(shard:str) -> tuple:
+        """sort key of a shard file name: `(month, part)`, or `None` if it isn't the name of a shard file (of either format)"""
+        stem, extension = path.splitext(shard)
+        return parse_shard_stem(stem) if extension in SHARD_FORMAT_EXTENSIONS.values() else None
+
+    def __find_shards(self):
+        """update the manifest with the shard files in the storage folder (ex: from before there was a manifest, or copied in)"""
+        shards = sorted((file for file in listdir(self.storage_dir) if self.__get_shard_key(file)), key=self.__get_shard_key)
+        if shards != self.__manifest.shards or not path.isfile(self.__manifest.filepath):
+            self.__manifest.shards = shards
+            self.__manifest.save()
 
     def __get_all_node_file_paths(self):
-        node_files = []
-        for file in listdir(STORAGE_DIR):
-            # first check if the file is a json file
-            is_json = file.endswith('.json')
-            # then check that the file has a proper time name format
-            time = file[0:6]
-            try:
-                time_valid = datetime.strptime(time, self.year_month_str_format)
-            except:
-                time_valid = False
-            # if both are True, append to node_files
-            if is_json and time_valid:
-                filepath = path.join(STORAGE_DIR, file)
-                node_files.append(filepath)
-        return node_files
+        return [path.join(self.storage_dir, shard) for shard in self.__manifest.shards]
+
+    def __get_month_shard(self, month:str, new:bool=False) -> str:
+        """get the path of a month's last shard file, or start a new shard file for it if there isn't one or `new` is `True`
+        (called with the shard lock held)"""
+        # another process may have started a new shard file since the manifest was read
+        self.__find_shards()
+        shards = [shard for shard in self.__manifest.shards if self.__get_shard_key(shard)[0] == month]
+        if shards and (not new or path.join(self.storage_dir, shards[-1]) != self.current_nodes_filepath):
+            return path.join(self.storage_dir, shards[-1])
+        part = self.__get_shard_key(shards[-1])[1] + 1 if shards else 0
+        filepath = path.join(self.storage_dir, get_shard_stem(month, part) + SHARD_FORMAT_EXTENSIONS[self.shard_format])
+        with self.__get_shard_lock(filepath).exclusive():
+            self.__write_shard_file(filepath, ())
+            with self.__index_lock:
+                self.__set_shard_entries(filepath, {})
+            self.__seen_stats[filepath] = self.__stat_shard(filepath)
+        self.__manifest.shards = sorted(self.__manifest.shards + [path.basename(filepath)], key=self.__get_shard_key)
+        self.__manifest.save()
+        return filepath
+
+    def __get_create_filepath(self) -> str:
+        """get the shard file to create a new node in: the current one, or a new one for a new month,
+        or when the shard policy says the current one is full"""
+        with self.__shard_lock:
+            filepath = self.current_nodes_filepath
+            month = datetime.now().strftime(self.year_month_str_format)
+            if self.__get_shard_key(path.basename(filepath))[0] != month:
+                filepath = self.current_nodes_filepath = self.__get_month_shard(month)
+            count = len(self.__shard_index.get(filepath, ())) + self.__held_creates.get(filepath, 0)
+            size = sum(st[0] for st in self.__stat_shard(filepath) if st)
+            if self.shard_policy.is_full(count, size):
+                filepath = self.current_nodes_filepath = self.__get_month_shard(month, new=True)
+            return filepath
 
     def __find_filepath_for_node(self, id:str):
-        # isolate year and month in timestamp from id
-        node_time = datetime.strptime(id, self.time_str_format_1).strftime(self.year_month_str_format)
-        # then match node_time to file_time
+        pending = self.__pending_nodes.get(id)
+        if pending:
+            return pending[0] if pending[1] is not None else None
+        return self.__node_shards.get(id)
+
+    #---
+    # locking methods
+
+    def __get_shard_lock(self, filepath) -> RWLock:
+        """get the lock of a shard file (and its journals), which is held shared to read it and exclusively to write it.
+        Its lock file is `YYYYMM_nodes.lock`, which is the same for both shard formats"""
+        lock_path = path.splitext(filepath)[0] + '.lock'
+        with self.__shard_locks_lock:
+            lock = self.__shard_locks.get(lock_path)
+            if lock is None:
+                lock = self.__shard_locks[lock_path] = RWLock(lock_path if self.process_locks else None)
+            return lock
+
+    @contextmanager
+    def __lock_shards(self, filepaths):
+        """hold the locks of several shards exclusively (always taken in the same order, so two writers can't each wait for the other)"""
+        with ExitStack() as stack:
+            for filepath in sorted(set(filepaths)):
+                stack.enter_context(self.__get_shard_lock(filepath).exclusive())
+            yield
+
+    def __refresh_shard(self, filepath):
+        """update the index entries (and content indexes) of a shard which another process wrote to since they were last updated.
+        Called with the shard's lock held"""
+        stats = self.__stat_shard(filepath)
+        seen = self.__seen_stats.get(filepath)
+        if stats == seen:
+            return
+        if not (seen and self.__is_journal_append(seen, stats)):
+            self.__rescan_changed_shard(filepath)
+            return
+        # only records were appended to its live journal, so only they need to be read
+        records = list(_iter_journal(_journal_paths(filepath)[0], seen[2][0]))
+        with self.__index_lock:
+            for offset, length, record in records:
+                if record['op'] == 'delete':
+                    self.__remove_entry(record['id'])
+                else:
+                    self.__set_entry(filepath, record['id'], ['journal', offset, length])
+            self.__journal_counts.pop(filepath, None)
+        shard = path.basename(filepath)
+        for _, _, record in records:
+            indexed_node = None if record['op'] == 'delete' else self.__get_indexed_node(record['node'])
+            for content_index in self.__content_indexes:
+                if indexed_node is None:
+                    content_index.remove_node(record['id'])
+                else:
+                    content_index.add_node(record['id'], indexed_node, shard)
+        self.__seen_stats[filepath] = stats
+
+    def refresh(self):
+        """update the node index (and content indexes) with any changes other processes made to the storage folder.
+        Writes always do this for the shards they write to, but reads only see other processes' changes once it's done"""
+        with self.__shard_lock:
+            self.__find_shards()
+        filepaths = self.__get_all_node_file_paths()
+        for filepath in set(self.__shard_index) - set(filepaths):
+            # removed by another process (ex: when rebalancing)
+            with self.__index_lock:
+                for id in self.__shard_index.pop(filepath):
+                    self.__node_shards.pop(id, None)
+                self.__seen_stats.pop(filepath, None)
+            for content_index in self.__content_indexes:
+                content_index.remove_shard(path.basename(filepath))
+        for filepath in filepaths:
+            with self.__get_shard_lock(filepath).exclusive():
+                self.__refresh_shard(filepath)
+
+    #---
+    # journal methods
+
+    def __write_shard_file(self, filepath, nodes, sync:bool=False) -> dict:
+        """write a stream of `(id, node)` pairs to a shard file in the format of its extension,
+        and return the index entries (location, byte offset and length) of every node in it"""
+        if _is_binary(filepath):
+            entries = node_binary.write_binary_shard(filepath, nodes, sync)
+            return {id: ['bin'] + entry for id, entry in entries.items()}
+        return self.__write_json_shard_file(filepath, nodes, sync)
+
+    @staticmethod
+    def __write_json_shard_file(filepath, nodes, sync:bool=False) -> dict:
+        """write a stream of `(id, node)` pairs to a shard file with the same layout as `json.dump(content, file, indent=1)`,
+        and return the index entries (location, byte offset and length) of every node in it"""
+        entries = {}
+        offset = 1
+        with open(filepath, 'wb') as file:
+            file.write(b'{')
+            for id, node in nodes:
+                key = (',' if entries else '') + '\n ' + json.dumps(id) + ': '
+                value = json.dumps(node, indent=1).replace('\n', '\n ')   # nested one level deeper, like json.dump does
+                offset += len(key)
+                entries[id] = ['json', offset, len(value)]
+                offset += len(value)
+                file.write((key + value).encode('ascii'))      # json.dumps escapes all non-ascii characters, so every character is 1 byte
+            file.write(b'\n}' if entries else b'}')
+            if sync:
+                file.flush()
+                fsync(file.fileno())
+        return entries
+
+    @staticmethod
+    def __write_json_shard(filepath, content:dict, sync:bool=False) -> dict:
+        """write a `{id: node}` dict to a shard file in one `json.dumps(content, indent=1)`,
+        and return the index entries (location, byte offset and length) of every node in it"""
+        text = json.dumps(content, indent=1)
+        with open(filepath, 'wb') as file:
+            file.write(text.encode('ascii'))            # json.dumps escapes all non-ascii characters, so every character is 1 byte
+            if sync:
+                file.flush()
+                fsync(file.fileno())
+        return _get_json_shard_entries(text)
+
+    def __write_shard(self, filepath, changes:dict, sync:bool=False):
+        """rewrite a whole shard file with a `{id: node}` dict of changes applied (used when not in journal mode).
+        The new shard is written to a temp file which then replaces it, and any journal records are now part of it, so the journal is cleared.
+        A small JSON shard is loaded and written whole (which is much faster), while binary and large shards are streamed so memory use stays low.
+        Called with the shard's lock held"""
+        temp_path = get_temp_path(filepath)
+        if _is_binary(filepath) or stat(filepath).st_size >= _STREAM_REWRITE_SIZE:
+            entries = self.__write_shard_file(temp_path, _apply_changes(_iter_shard(filepath), changes), sync)
+        else:
+            content = self.__read_file(filepath) if stat(filepath).st_size else {}
+            journal_path, compacting_path = _journal_paths(filepath)
+            shard_changes = {}
+            _get_journal_changes(compacting_path, shard_changes)
+            _get_journal_changes(journal_path, shard_changes)
+            shard_changes.update(changes)
+            for id, node in shard_changes.items():     # changed nodes keep their place, and new nodes go at the end
+                if node is None:
+                    content.pop(id, None)
+                else:
+                    content[id] = node
+            entries = self.__write_json_shard(temp_path, content, sync)
+        replace(temp_path, filepath)
+        for journal_path in _journal_paths(filepath):
+            if path.isfile(journal_path):
+                remove(journal_path)
+        with self.__index_lock:
+            self.__journal_counts.pop(filepath, None)
+            self.__set_shard_entries(filepath, entries)
+
+    def __append_records(self, filepath, records:list, sync:bool=False):
+        """append create/edit/delete records `(op, id, node)` to the shard's journal in a single write,
+        and start compaction if the journal is full. Called with the shard's lock held"""
+        journal_path = _journal_paths(filepath)[0]
+        lines = [
+            (json.dumps({'op': op, 'id': id, 'node': None if op == 'delete' else node}) + '\n').encode('ascii')
+            for op, id, node in records
+        ]
+        count = self.__journal_counts.get(filepath)
+        if count is None:
+            count = 0
+            if path.isfile(journal_path):
+                with open(journal_path, 'rb') as file:
+                    count = sum(1 for _ in file)
+        with open(journal_path, 'ab') as file:
+            offset = file.tell()
+            file.write(b''.join(lines))
+            if sync:
+                file.flush()
+                fsync(file.fileno())
+        with self.__index_lock:
+            self.__journal_counts[filepath] = count
+            for (op, id, _), line in zip(records, lines):
+                if op == 'delete':
+                    self.__remove_entry(id)
+                else:
+                    self.__set_entry(filepath, id, ['journal', offset, len(line)])
+                offset += len(line)
+            self.__journal_counts[filepath] += len(records)
+            start_compaction = self.__journal_counts[filepath] >= self.compact_threshold and filepath not in self.__compacting
+            if start_compaction:
+                self.__compacting.add(filepath)
+        if start_compaction:
+            Thread(target=self.__compact_in_background, args=(filepath,), daemon=True).start()
+
+    def __compact_shard(self, filepath):
+        """merge a shard's journal into the shard file.
+        The live journal is first renamed, so new records can keep being appended while the shard file is rewritten
+        (which is done without holding the shard's lock)"""
+        journal_path, compacting_path = _journal_paths(filepath)
+        lock = self.__get_shard_lock(filepath)
+        temp_path = get_temp_path(filepath)
+        try:
+            with lock.exclusive():
+                self.__refresh_shard(filepath)
+                if path.isfile(journal_path) and not path.isfile(compacting_path):
+                    replace(journal_path, compacting_path)
+                    with self.__index_lock:
+                        self.__journal_counts[filepath] = 0
+                        for entry in self.__shard_index.get(filepath, {}).values():
+                            if entry[0] == 'journal':
+                                entry[0] = 'compacting'
+                    self.__seen_stats[filepath] = self.__stat_shard(filepath)
+                if not path.isfile(compacting_path):
+                    return
+                version = self.__get_file_version(filepath)
+            # stream to a temp file and then rename it, so the shard file is never left half written
+            try:
+                entries = self.__write_shard_file(temp_path, _iter_shard(filepath, live_journal=False))
+            except FileNotFoundError:
+                return                              # the shard was rewritten in the meantime (see below)
+            with lock.exclusive():
+                self.__refresh_shard(filepath)
+                if not path.isfile(compacting_path) or self.__get_file_version(filepath) != version:
+                    return                          # the shard was rewritten in the meantime, which merged the compacting journal into it
+                replace(temp_path, filepath)
+                remove(compacting_path)
+                with self.__index_lock:
+                    # nodes with a newer record in the live journal keep pointing to it
+                    shard_entries = self.__shard_index.get(filepath, {})
+                    for id, entry in entries.items():
+                        if id in shard_entries and shard_entries[id][0] != 'journal':
+                            shard_entries[id] = entry
+                    self.__shard_versions[filepath] = self.__get_file_version(filepath)
+                self.__seen_stats[filepath] = self.__stat_shard(filepath)
+        finally:
+            if path.isfile(temp_path):
+                remove(temp_path)
+            with self.__index_lock:
+                self.__compacting.discard(filepath)
+
+    def __compact_in_background(self, filepath):
+        self.__compact_shard(filepath)
+        self.save_index()
+
+    def compact(self):
+        """write any held records, and merge every shard journal into its shard file right away (ex: before shutting down)"""
+        self.flush()
         for filepath in self.__get_all_node_file_paths():
-            file_name = path.basename(filepath)
-            file_time = file_name[0:6]
-            if node_time == file_time:
-                return filepath
-    
-    def __get_node_and_outside_data(self, id):
-        filepath = self.__find_filepath_for_node(id)
-        nodes = self.__read_file(filepath)
-        content = nodes.get(id)
-        return ({id: content}, nodes, filepath)
+            self.__compact_shard(filepath)
+        self.save_index()
+
+    def convert_shards(self, shard_format:str) -> int:
+        """convert every shard file to `shard_format` (`'json'` or `'binary'`), which is also used for new shard files from now on.
+        Journals are merged into their shard files first. Returns the number of shard files converted"""
+        if shard_format not in SHARD_FORMAT_EXTENSIONS:
+            raise ValueError(f"shard_format must be one of {tuple(SHARD_FORMAT_EXTENSIONS)}, not '{shard_format}'")
+        self.shard_format = shard_format
+        extension = SHARD_FORMAT_EXTENSIONS[shard_format]
+        self.compact()
+        converted = 0
+        for filepath in self.__get_all_node_file_paths():
+            if filepath.endswith(extension):
+                continue
+            # both formats share the same journal file name, so any new journal records still apply to the new file
+            new_filepath = path.splitext(filepath)[0] + extension
+            with self.__get_shard_lock(filepath).exclusive():           # the same lock as the new file's
+                self.__refresh_shard(filepath)
+                temp_path = get_temp_path(new_filepath)
+                entries = self.__write_shard_file(temp_path, _iter_shard(filepath, live_journal=False))
+                with self.__index_lock:
+                    replace(temp_path, new_filepath)
+                    remove(filepath)
+                    # nodes with a newer record in the live journal keep pointing to it
+                    for id, entry in self.__shard_index.pop(filepath, {}).items():
+                        if entry[0] == 'journal':
+                            entries[id] = entry
+                    self.__shard_versions.pop(filepath, None)
+                    self.__set_shard_entries(new_filepath, entries)
+                    if filepath in self.__journal_counts:
+                        self.__journal_counts[new_filepath] = self.__journal_counts.pop(filepath)
+                    if self.current_nodes_filepath == filepath:
+                        self.current_nodes_filepath = new_filepath
+                    self.__seen_stats.pop(filepath, None)
+                    self.__seen_stats[new_filepath] = self.__stat_shard(new_filepath)
+            with self.__shard_lock:
+                shards = self.__manifest.shards
+                shards[shards.index(path.basename(filepath))] = path.basename(new_filepath)
+                self.__manifest.save()
+            # the shard file's name changed, so its nodes are re-indexed under the new name
+            for content_index in self.__content_indexes:
+                content_index.remove_shard(path.basename(filepath))
+                for id, node in _iter_shard(new_filepath):
+                    content_index.add_node(id, self.__get_indexed_node(node), path.basename(new_filepath))
+            converted += 1
+        self.save_index()
+        return converted
+
+    def rebalance_shards(self, shard_policy:ShardPolicy=None) -> int:
+        """rewrite every shard file to fit `shard_policy` (which is also used for new shards from now on), or the current one.
+        Nodes stay in the month they were created in, in id order, and a month is split into parts by the policy
+        (node sizes are measured as JSON, for either shard format). Every node is read into memory and every shard file is replaced,
+        so this is meant to be run offline (see `node_rebalance.py`), with nothing else using the storage folder.
+        Returns the number of shard files written"""
+        if shard_policy is not None:
+            self.shard_policy = self.__manifest.policy = shard_policy
+        self.compact()
+        old_filepaths = self.__get_all_node_file_paths()
+        groups = []                                 # [(shard file name, [(id, node)])]
+        month, part, count, size = None, 0, 0, 0
+        for id, node in sorted(self.iter_nodes(), key=lambda item: item[0]):
+            if id[:6] != month or self.shard_policy.is_full(count, size):
+                part = part + 1 if id[:6] == month else 0
+                month, count, size = id[:6], 0, 0
+                groups.append((get_shard_stem(month, part) + SHARD_FORMAT_EXTENSIONS[self.shard_format], []))
+            groups[-1][1].append((id, node))
+            count += 1
+            size += len(json.dumps({id: node}, indent=1))
+        # write all of the new shard files before removing any of the old ones, which may have the same names
+        temp_paths = {shard: get_temp_path(path.join(self.storage_dir, shard)) for shard, _ in groups}
+        for shard, nodes in groups:
+            self.__write_shard_file(temp_paths[shard], nodes, sync=True)
+        with self.__shard_lock, self.__lock_shards(old_filepaths), self.__index_lock:
+            for filepath in old_filepaths:
+                for p in (filepath,) + _journal_paths(filepath):
+                    if path.isfile(p):
+                        remove(p)
+            for shard, _ in groups:
+                replace(temp_paths[shard], path.join(self.storage_dir, shard))
+            self.__manifest.shards = [shard for shard, _ in groups]
+            self.__manifest.save()
+            self.__shard_index, self.__node_shards, self.__shard_versions, self.__seen_stats = {}, {}, {}, {}
+            self.__journal_counts = {}
+            self.__string_tables = {}
+            self.__cache.clear()
+        # the lock files of shards which are gone (once they're no longer held)
+        lock_paths = {path.splitext(filepath)[0] + '.lock' for filepath in old_filepaths}
+        lock_paths -= {path.splitext(path.join(self.storage_dir, shard))[0] + '.lock' for shard, _ in groups}
+        with self.__shard_locks_lock:
+            for lock_path in lock_paths:
+                self.__shard_locks.pop(lock_path, None)
+                if path.isfile(lock_path):
+                    remove(lock_path)
+        with self.__shard_lock:
+            self.current_nodes_filepath = self.__get_month_shard(datetime.now().strftime(self.year_month_str_format))
+        # every shard file changed, so the node index is re-scanned, and the content indexes re-index the shards
+        self.__load_index()
+        return len(groups)
+
+    #---
+    # node index methods
+
+    def __set_entry(self, filepath, id:str, entry:list):
+        self.__shard_index.setdefault(filepath, {})[id] = entry
+        self.__node_shards[id] = filepath
+
+    def __remove_entry(self, id:str):
+        filepath = self.__node_shards.pop(id, None)
+        if filepath:
+            self.__shard_index[filepath].pop(id, None)
+
+    def __set_shard_entries(self, filepath, entries:dict):
+        """replace all of a shard's index entries"""
+        for id in self.__shard_index.get(filepath, ()):
+            self.__node_shards.pop(id, None)
+        self.__shard_index[filepath] = entries
+        for id in entries:
+            self.__node_shards[id] = filepath
+        self.__shard_versions[filepath] = self.__get_file_version(filepath)
+
+    def __rescan_changed_shard(self, filepath):
+        """re-scan a shard file which was changed outside of the app, and re-index its content"""
+        stats = self.__stat_shard(filepath)
+        entries = self.__scan_shard(filepath)
+        with self.__index_lock:
+            self.__set_shard_entries(filepath, entries)
+            self.__seen_stats[filepath] = stats
+        for content_index in self.__content_indexes:
+            self.__reindex_shards(content_index, [filepath])
+
+    def __reindex_shards(self, content_index, filepaths):
+        """re-index the content of some shards in one content index. Called with the shards' locks held"""
+        for filepath in filepaths:
+            shard = path.basename(filepath)
+            content_index.remove_shard(shard)
+            for id, node in _iter_shard(filepath):
+                content_index.add_node(id, self.__get_indexed_node(node), shard)
+
+    def __stat_shard(self, filepath) -> list:
+        """the size and modified time of a shard file and each of its journals, used to tell if saved index entries are out of date"""
+        stats = []
+        for p in (filepath,) + tuple(reversed(_journal_paths(filepath))):   # shard file, compacting journal, live journal
+            try:
+                st = stat(p)
+            except FileNotFoundError:       # including a compacting journal merged in by another thread (ex: while sizing the current shard)
+                stats.append(None)
+            else:
+                stats.append([st.st_size, st.st_mtime_ns])
+        return stats
+
+    def __scan_journal(self, journal_path, location:str, entries:dict, offset:int=0):
+        """update index entries with the records in a journal file, starting at the byte `offset`"""
+        for record_offset, length, record in _iter_journal(journal_path, offset):
+            if record['op'] == 'delete':
+                entries.pop(record['id'], None)
+            else:
+                entries[record['id']] = [location, record_offset, length]
+
+    @staticmethod
+    def __is_journal_append(saved_stats:list, stats:list) -> bool:
+        """check if the only change to a shard since `saved_stats` is records being appended to its live journal"""
+        return saved_stats[:2] == stats[:2] and bool(saved_stats[2]) and bool(stats[2]) and stats[2][0] >= saved_stats[2][0]
+
+    def __scan_shard(self, filepath) -> dict:
+        # find the byte offset and length of every node, without parsing the nodes into python objects
+        location = 'bin' if _is_binary(filepath) else 'json'
+        entries = {id: [location, offset, length] for id, offset, length, _ in _iter_shard_file(filepath)}
+        journal_path, compacting_path = _journal_paths(filepath)
+        self.__scan_journal(compacting_path, 'compacting', entries)
+        self.__scan_journal(journal_path, 'journal', entries)
+        return entries
+
+    def __load_index(self):
+        """load the saved node index, and re-scan any shard files which changed since it was saved"""
+        saved_shards = {}
+        if path.isfile(self.__index_filepath):
+            try:
+                saved_shards = self.__read_file(self.__index_filepath).get('shards', {})
+            except ValueError:                      # a corrupt index is simply rebuilt
+                pass
+        changed = False
+        for filepath in self.__get_all_node_file_paths():
+            saved = saved_shards.get(path.basename(filepath))
+            stats = self.__stat_shard(filepath)
+            if saved and saved['stats'] == stats:
+                entries = saved['nodes']
+            elif saved and self.__is_journal_append(saved['stats'], stats):
+                # only the live journal changed, and it was only appended to, so just scan its new records
+                entries = saved['nodes']
+                self.__scan_journal(_journal_paths(filepath)[0], 'journal', entries, saved['stats'][2][0])
+                changed = True
+            else:
+                entries = self.__scan_shard(filepath)
+                changed = True
+            self.__set_shard_entries(filepath, entries)
+            self.__seen_stats[filepath] = stats
+        # then re-index the content of any shards which changed since each content index was saved
+        for content_index in self.__content_indexes:
+            if self.__load_content_index(content_index):
+                changed = True
+        if changed or len(saved_shards) != len(self.__shard_index):
+            self.save_index()
+
+    def __load_content_index(self, content_index) -> bool:
+        """load a content index (search or link index), and update it with any shards that changed since it was saved.
+        Returns `True` if anything needed to be updated"""
+        changed = False
+        saved_shards = content_index.load()
+        for shard in set(saved_shards) - {path.basename(f) for f in self.__shard_index}:
+            content_index.remove_shard(shard)
+            changed = True
+        for filepath in self.__shard_index:
+            shard = path.basename(filepath)
+            saved_stats, stats = saved_shards.get(shard), self.__seen_stats.get(filepath)
+            if saved_stats == stats:
+                continue
+            if saved_stats and self.__is_journal_append(saved_stats, stats):
+                for _, _, record in _iter_journal(_journal_paths(filepath)[0], saved_stats[2][0]):
+                    if record['op'] == 'delete':
+                        content_index.remove_node(record['id'])
+                    else:
+                        content_index.add_node(record['id'], self.__get_indexed_node(record['node']), shard)
+            else:
+                content_index.remove_shard(shard)
+                for id, node in _iter_shard(filepath):
+                    content_index.add_node(id, self.__get_indexed_node(node), shard)
+            changed = True
+        return changed
+
+    def __get_entry_path(self, filepath, entry:list) -> str:
+        """get the path of the file an index entry points to (the shard file or one of its journals)"""
+        location = entry[0]
+        if location in _SHARD_FILE_LOCATIONS:
+            return filepath
+        return _journal_paths(filepath)[0 if location == 'journal' else 1]
+
+    @staticmethod
+    def __get_file_version(filepath) -> tuple:
+        """get a value which changes whenever a file is changed or replaced"""
+        try:
+            st = stat(filepath)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def __get_entry_version(self, filepath, entry:list) -> tuple:
+        """get a value which changes whenever the node an index entry points to could have changed"""
+        if entry[0] in _SHARD_FILE_LOCATIONS:
+            return self.__get_file_version(filepath)
+        try:
+            st = stat(self.__get_entry_path(filepath, entry))
+        except FileNotFoundError:
+            return None
+        # journals are only appended to, so a record stays the same as long as the journal is the same file and still holds it
+        return (st.st_ino, st.st_size >= entry[1] + entry[2])
+
+    def __get_string_table(self, filepath) -> list[str]:
+        """get a binary shard's string table, which is only read again if the shard file changed"""
+        version = self.__get_file_version(filepath)
+        cached = self.__string_tables.get(filepath)
+        if not cached or cached[0] != version:
+            cached = self.__string_tables[filepath] = (version, node_binary.read_string_table(filepath))
+        return cached[1]
+
+    def __read_entry(self, filepath, entry:list) -> dict:
+        """read a single node from the location an index entry points to"""
+        location, offset, length = entry
+        if location == 'bin':
+            return node_binary.read_binary_node(filepath, offset, length, self.__get_string_table(filepath))
+        with open(self.__get_entry_path(filepath, entry), 'rb') as file:
+            file.seek(offset)
+            data = json.loads(file.read(length))
+        return data if location == 'json' else data['node']
+
+    def save_index(self):
+        """save the node index to `node_index.json` (and the search and link indexes to their own files),
+        so they can be reloaded instead of re-scanning every shard on startup"""
+        with self.__index_lock:
+            # saved with the stats of each shard as of when its entries were last updated (not its current stats),
+            # so anything another process wrote to it since then is found when the index is loaded
+            shards = {
+                path.basename(filepath): {'stats': self.__seen_stats.get(filepath), 'nodes': entries}
+                for filepath, entries in self.__shard_index.items()
+            }
+            data = json.dumps({'shards': shards})     # dumps() is much faster than dump(), which can't use the C encoder
+        temp_path = get_temp_path(self.__index_filepath)
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            file.write(data)
+        replace(temp_path, self.__index_filepath)
+        for content_index in self.__content_indexes:
+            content_index.save({shard: shard_data['stats'] for shard, shard_data in shards.items()})
 
     #---
+    # deleted node (tombstone) methods
+
+    def __load_tombstones(self) -> dict:
+        """get the tombstone index, `{id: [byte offset, byte length, deletion time]}` of every deleted node's record
+        in the tombstone journal (in the order they were deleted). Must be called with the tombstone lock.
+        It's read again if the journal was changed since this process last read or wrote it"""
+        version = self.__get_file_version(self.__tombstones_filepath)
+        if self.__tombstones is None or version != self.__tombstones_version:
+            tombstones = {}
+            records = 0
+            for offset, length, record in _iter_journal(self.__tombstones_filepath):
+                records += 1
+                tombstones.pop(record['id'], None)          # so a node deleted again moves to the end
+                if record['op'] == 'delete':
+                    tombstones[record['id']] = [offset, length, record['time']]
+            self.__tombstones, self.__tombstone_records = tombstones, records
+            self.__tombstones_version = version
+        return self.__tombstones
+
+    def __read_tombstone(self, offset:int, length:int) -> dict:
+        with open(self.__tombstones_filepath, 'rb') as file:
+            file.seek(offset)
+            return json.loads(file.read(length))
+
+    def __append_tombstones(self, records:list, sync:bool=False):
+        """append delete/restore records `(op, id, node)` to the tombstone journal in a single write,
+        and purge it if `compact_threshold` records were appended since it was last purged"""
+        time = datetime.now().strftime(self.time_str_format_1)
+        with self.__tombstone_lock.exclusive():
+            tombstones = self.__load_tombstones()
+            with open(self.__tombstones_filepath, 'ab') as file:
+                offset = file.tell()
+                lines = []
+                for op, id, node in records:
+                    if op == 'delete':
+                        with self.__batch_lock:
+                            links = self.__removed_links.pop(id, [])
+                        record = {'op': 'delete', 'id': id, 'time': time, 'node': node, 'links': links}
+                    else:
+                        record = {'op': op, 'id': id}
+                    line = (json.dumps(record) + '\n').encode('ascii')
+                    lines.append(line)
+                    tombstones.pop(id, None)
+                    if op == 'delete':
+                        tombstones[id] = [offset, len(line), time]
+                    offset += len(line)
+                file.write(b''.join(lines))
+                if sync:
+                    file.flush()
+                    fsync(file.fileno())
+            self.__tombstones_version = self.__get_file_version(self.__tombstones_filepath)
+            self.__tombstone_records += len(records)
+            self.__tombstones_appended += len(records)
+            if self.__tombstones_appended >= self.compact_threshold:
+                self.__purge_tombstones(self.deleted_max_age, self.deleted_max_count)
+
+    def __purge_tombstones(self, max_age:float=None, max_count:int=None) -> int:
+        """rewrite the tombstone journal with only the tombstones to keep, and return the number of deleted nodes purged.
+        Must be called with the tombstone lock"""
+        tombstones = self.__load_tombstones()
+        keep = list(tombstones)
+        if max_age is not None:
+            cutoff = (datetime.now() - timedelta(days=max_age)).strftime(self.time_str_format_1)
+            keep = [id for id in keep if tombstones[id][2] >= cutoff]
+        if max_count is not None:
+            keep = keep[max(len(keep) - max_count, 0):]
+        self.__tombstones_appended = 0
+        if len(keep) == len(tombstones) == self.__tombstone_records:
+            return 0                                        # nothing to purge, so don't rewrite the journal
+        keep = set(keep)
+        kept = {}
+        temp_path = get_temp_path(self.__tombstones_filepath)
+        with open(temp_path, 'wb') as temp_file:
+            for offset, length, record in _iter_journal(self.__tombstones_filepath):
+                id = record['id']
+                if id in keep and tombstones[id][0] == offset:     # only the current record of each kept tombstone
+                    kept[id] = [temp_file.tell(), length, record['time']]
+                    temp_file.write((json.dumps(record) + '\n').encode('ascii'))       # the same bytes it was written with
+            temp_file.flush()
+            fsync(temp_file.fileno())
+        replace(temp_path, self.__tombstones_filepath)
+        purged = len(tombstones) - len(kept)
+        self.__tombstones = kept                            # still in the order the nodes were deleted in
+        self.__tombstones_version = self.__get_file_version(self.__tombstones_filepath)
+        self.__tombstone_records = len(kept)
+        return purged
+
+    #---
+    # write methods
+
+    def __claim_ids(self, records:list) -> tuple[list, dict]:
+        """give any created node whose id is already stored (ex: by another process, in the same microsecond) the next free id
+        (in its later records too, ex: an edit in the same batch). Returns the records and `{old id: new id}` of the changed ids.
+        Called with the shards' locks held, after they're refreshed"""
+        new_ids = {}
+        claimed = set()
+        with self.__batch_lock:
+            for filepath, op, id, node in records:
+                if op != 'create':
+                    continue
+                new_id = id
+                while new_id in self.__node_shards or new_id in claimed or (new_id != id and self.__is_id_taken(new_id)):
+                    new_id = str(int(new_id) + 1)
+                claimed.add(new_id)
+                if new_id != id:
+                    new_ids[id] = new_id
+        if new_ids:
+            _logger.warning('node ids %s were already taken when written, so they were changed to %s', list(new_ids), list(new_ids.values()))
+            records = [(filepath, op, new_ids.get(id, id), node) for filepath, op, id, node in records]
+        return records, new_ids
 
-    def create_node(self, name:str, node_type:str='text', content:str=''):
+    def __commit(self, records:list, sync:bool=False) -> dict:
+        """write create/edit/delete records `(shard filepath, op, id, node)` to storage,
+        with only one write per shard file (and one for all deleted and restored nodes).
+        For deletes, `node` is the node being deleted (which gets added to the tombstone journal).
+        Only the locks of the shards being written to are held, so commits to other shards can be written at the same time.
+        Returns `{old id: new id}` of any created nodes whose id was taken by the time they were written (see `__claim_ids()`)"""
+        with self.__lock_shards(filepath for filepath, _, _, _ in records):
+            if self.process_locks:
+                for filepath in {filepath for filepath, _, _, _ in records}:
+                    self.__refresh_shard(filepath)
+            records, new_ids = self.__claim_ids(records)
+            shard_records = {}
+            for filepath, op, id, node in records:
+                shard_records.setdefault(filepath, []).append((op, id, node))
+            if self.history:
+                # before the shards are written, so a node's first revision can still be read from its shard
+                self.history.add_revisions([(id, node) for _, op, id, node in records if op == 'edit'], self.__get_stored_node, sync)
+            for filepath, op_records in shard_records.items():
+                if self.journal:
+                    self.__append_records(filepath, op_records, sync)
+                else:
+                    changes = {id: None if op == 'delete' else node for op, id, node in op_records}
+                    self.__write_shard(filepath, changes, sync)
+            for filepath in shard_records:
+                self.__seen_stats[filepath] = self.__stat_shard(filepath)
+            # add any deleted/restored nodes to the tombstone journal, before anything else can fail, so a deleted node is never lost
+            tombstone_records = [(op, id, node) for _, op, id, node in records if op in ('delete', 'restore')]
+            if tombstone_records:
+                self.__append_tombstones(tombstone_records, sync)
+            # then update the content indexes
+            indexed_nodes = [None if op == 'delete' else self.__get_indexed_node(node) for _, op, _, node in records]
+            for content_index in self.__content_indexes:
+                try:
+                    for (filepath, op, id, _), indexed_node in zip(records, indexed_nodes):
+                        if op == 'delete':
+                            content_index.remove_node(id)
+                        else:
+                            content_index.add_node(id, indexed_node, path.basename(filepath))
+                except Exception:
+                    # the shards are already written, so rather than failing the write, the index is rebuilt from them
+                    _logger.exception('updating %s failed, re-indexing the written shards', type(content_index).__name__)
+                    self.__reindex_shards(content_index, shard_records)
+            self.changes.append([(op, id, path.basename(filepath)) for filepath, op, id, _ in records], sync)
+        return new_ids
+
+    def __store_content(self, node):
+        """move a node's content into the blob store if it's large enough, and return the node as it gets stored"""
+        cont = node.get('cont') if isinstance(node, dict) else None
+        if self.blob_threshold and isinstance(cont, str) and len(cont) >= self.blob_threshold:
+            node = dict(node, cont=self.blobs.put_text(cont))
+        return node
+
+    def __get_indexed_node(self, node):
+        """get a node with the text of its content blob (if it has one), for the content indexes"""
+        return _read_blob_content(node, self.blobs)
+
+    def __write(self, filepath, op:str, id:str, node:dict) -> str:
+        """write a single record right away, or hold it if a batch is open or group commit is on,
+        and return the node's id (which a created node only keeps if no other process took it first, see `__claim_ids()`)"""
+        try:
+            # the blob lock is held until the record is written or held, so `collect_blobs()` always sees the blobs it uses
+            with self.__blob_lock.shared():
+                if op in ('create', 'edit'):
+                    node = self.__store_content(node)
+                with self.__batch_lock:
+                    if self.__batch_depth or self.group_commit:
+                        self.__pending.append((filepath, op, id, node))
+                        if op == 'create':
+                            self.__held_creates[filepath] = self.__held_creates.get(filepath, 0) + 1
+                        self.__pending_nodes[id] = (filepath, None if op == 'delete' else node)
+                        self.__start_commit_timer()
+                        return id
+                with self.__flush_lock.shared():
+                    return self.__commit([(filepath, op, id, node)]).get(id, id)
+        finally:
+            if op == 'create':
+                with self.__batch_lock:
+                    self.__reserved_ids.discard(id)     # now held or stored, so `__new_id()` sees it there
+
+    def __start_commit_timer(self):
+        """start the group commit timer, unless a batch is open or it's already started. Called with the batch lock held"""
+        if self.group_commit and not self.__batch_depth and not self.__commit_timer:
+            self.__commit_timer = Timer(self.group_commit, self.__flush_held)
+            self.__commit_timer.daemon = True
+            self.__commit_timer.start()
+
+    def __flush_held(self):
+        # on the timer's thread, where nothing else would see the error
+        try:
+            self.flush()
+        except Exception:
+            _logger.exception('writing held records failed, so they stay held until the next flush')
+
+    def flush(self) -> dict:
+        """write all held records now (one write and fsync per shard file), and return stats for the batch:
+        `{'records': int, 'shards': int, 'seconds': float, 'records_per_sec': float}`"""
+        with self.__flush_lock.exclusive():
+            with self.__batch_lock:
+                records, self.__pending = self.__pending, []
+                self.__held_creates = {}
+                if self.__commit_timer:
+                    self.__commit_timer.cancel()
+                    self.__commit_timer = None
+            start = perf_counter()
+            try:
+                if records:
+                    self.__commit(records, sync=True)
+            except BaseException:
+                self.__hold_again(records)
+                raise
+            seconds = perf_counter() - start
+            with self.__batch_lock:
+                # written records no longer need to be read from the held records (unless they were written to again)
+                for filepath, op, id, node in records:
+                    pending = self.__pending_nodes.get(id)
+                    if pending and pending[0] == filepath and pending[1] is (None if op == 'delete' else node):
+                        del self.__pending_nodes[id]
+        stats = {
+            'records': len(records),
+            'shards': len({record[0] for record in records}),
+            'seconds': seconds,
+            'records_per_sec': len(records) / seconds if seconds else 0.0,
+        }
+        self.last_batch_stats = stats
+        return stats
+
+    def __hold_again(self, records:list):
+        """put records which failed to be written back in front of the held records, so the next flush writes them.
+        A create which did get written is held as an edit (records hold the whole node, so writing one again changes nothing)"""
+        with self.__index_lock:
+            records = [
+                (filepath, 'edit' if op == 'create' and self.__node_shards.get(id) == filepath else op, id, node)
+                for filepath, op, id, node in records
+            ]
+        with self.__batch_lock:
+            self.__pending[:0] = records
+            for filepath, op, _, _ in records:
+                if op == 'create':
+                    self.__held_creates[filepath] = self.__held_creates.get(filepath, 0) + 1
+            self.__start_commit_timer()
+
+    def close(self):
+        """write all held records (ex: of the last group commit), so none are lost when the app exits"""
+        self.flush()
+
+    @contextmanager
+    def batch(self):
+        """context manager which holds all writes made inside of it, and writes them together when it ends.
+        It gives a dict which gets filled with the batch stats (see `flush()`):
+
+        ```
+        with nodes.batch() as stats:
+            for text in texts:
+                nodes.create_node('imported', content=text)
+        print(stats['records_per_sec'])
+        ```
+        """
+        stats = {}
+        with self.__batch_lock:
+            self.__batch_depth += 1
+        try:
+            yield stats
+        finally:
+            with self.__batch_lock:
+                self.__batch_depth -= 1
+                outermost = not self.__batch_depth
+            if outermost:
+                stats.update(self.flush())
+
+    #---
+
+    def __is_id_taken(self, id:str) -> bool:
+        """check if a node id is stored, held, or about to be created. Called with the batch lock held"""
+        return id in self.__node_shards or id in self.__pending_nodes or id in self.__reserved_ids
+
+    def __new_id(self) -> str:
+        """get a new node id, which is reserved until the node is written or held (see `__write()`)"""
+        id = datetime.now().strftime(self.time_str_format_1)    # creation time, also serves as id
+        # nodes created within the same microsecond (ex: in a batch, or by another thread) still need unique ids
+        with self.__batch_lock:
+            while self.__is_id_taken(id):
+                id = str(int(id) + 1)
+            self.__reserved_ids.add(id)
+        return id
+
+    def create_node(self, name:str, node_type:str='text', content:str='') -> str:
         # create node:
-        node_data = {       
+        node_data = {
             'name': name,       # should be a longer descriptive name, almost like a short description (makes it easier to find)
             'type': node_type,  # type of node - determines how content should be read
             'supe': [],         # super links
@@ -80,58 +1330,256 @@ class ReadWriteNodes:
             'sub':  [],         # sub links
             'cont': content     # the actual content of the node - can also be a file reference
         }
-        id = datetime.now().strftime(self.time_str_format_1)    # creation time, also serves as id
-        node = {id: node_data}
+        id = self.__new_id()
         # add node to storage file:
-        filepath = self.current_nodes_filepath
-        nodes = self.__read_file(filepath)
-        nodes.update(node)
-        self.__write_file(filepath, nodes)
-    
-    def get_node(self, id):
-        node_and_data = self.__get_node_and_outside_data(id)
-        node = node_and_data[0]
-        return node
+        return self.__write(self.__get_create_filepath(), 'create', id, node_data)
+
+    def get_node(self, id, blob_refs:bool=False):
+        """get `{id: node}`, with the text of content stored in the blob store as the node's `cont`,
+        or its `{'blob', 'size'}` reference if `blob_refs` is `True` (which skips reading the content)"""
+        pending = self.__pending_nodes.get(id)
+        # a held node is copied (as a cached one is), so changing the returned node can't change what gets written
+        node = deepcopy(pending[1]) if pending else self.__get_stored_node(id)
+        return {id: node if blob_refs else _read_blob_content(node, self.blobs)}
+
+    def __get_stored_node(self, id:str) -> dict:
+        """get a node as it's written in its shard (without any held writes), or `None` if it isn't"""
+        # look up the node's location in the index, and only read that node (unless it's cached)
+        filepath = self.__node_shards.get(id)
+        if not filepath:
+            return None
+        # held shared so the shard can't be compacted or replaced while the entry is read
+        with self.__get_shard_lock(filepath).shared():
+            entry = self.__shard_index[filepath].get(id)
+            if not entry:
+                return None
+            version = self.__get_entry_version(filepath, entry)
+            if entry[0] in _SHARD_FILE_LOCATIONS and version != self.__shard_versions.get(filepath):
+                # the shard file was changed outside of the app, so the node may have moved within it
+                self.__rescan_changed_shard(filepath)
+                return self.__get_stored_node(id)
+            cached, content = self.__cache.get(id, entry, version)
+            if not cached:
+                content = self.__read_entry(filepath, entry)
+                self.__cache.put(id, entry, version, content)
+            return content
+
+    def cache_stats(self) -> dict:
+        """return the node cache's `{'hits', 'misses', 'evictions', 'size', 'max_size'}`"""
+        return self.__cache.get_stats()
 
     def edit_node(self, id, content:list):
-        # get all needed data
-        node_and_data = self.__get_node_and_outside_data(id)
-        nodes_dict = node_and_data[1]
-        filepath = node_and_data[2]
-        # update file with the new node/content
-        new_node = {id: content}
-        nodes_dict.update(new_node)
-        self.__write_file(filepath, nodes_dict)
+        filepath = self.__find_filepath_for_node(id)
+        if not filepath:
+            raise KeyError(id)
+        self.__write(filepath, 'edit', id, content)
+
+    @contextmanager
+    def __lock_node(self, id:str):
+        """hold the lock of a node's shard exclusively (after the locks every write takes before it, in the same order),
+        with the shard brought up to date with other processes' writes, and give the shard's filepath"""
+        with self.__blob_lock.shared(), self.__flush_lock.shared():
+            filepath = self.__find_filepath_for_node(id)
+            if not filepath:
+                raise KeyError(id)
+            with self.__get_shard_lock(filepath).exclusive():
+                if self.process_locks:
+                    self.__refresh_shard(filepath)
+                if self.__find_filepath_for_node(id) != filepath:
+                    raise KeyError(id)              # deleted (or moved) by another process
+                yield filepath
+
+    def update_node(self, id:str, update) -> dict:
+        """edit a node with `update(node)`, which gets the current node and returns the new one, and return the new node.
+        No other write to the node's shard (from any thread or process) can happen between reading and writing it,
+        so unlike `get_node()` followed by `edit_node()`, two updates at the same time can't lose either one's changes.
+        Inside a batch, other processes are only kept out until the update is held (it's still seen by this process's reads)"""
+        with self.__lock_node(id) as filepath:
+            node = update(self.get_node(id)[id])
+            self.__write(filepath, 'edit', id, node)
+            return node
 
     def delete_node(self, id):
-        # get all needed data
-        node_and_data = self.__get_node_and_outside_data(id)
-        node = node_and_data[0]
-        nodes_dict = node_and_data[1]
-        filepath = node_and_data[2]
-        # remove deleted node from the nodes dict and update the file
-        nodes_dict.pop(id)
-        self.__write_file(filepath, nodes_dict)
-        # then add deleted node to delete_nodes.json
-        deleted_nodes_dict = self.__read_file(DELETED_NODES_FILEPATH)
-        deleted_nodes_dict.update(node)
-        self.__write_file(DELETED_NODES_FILEPATH, deleted_nodes_dict)
-
-    def search_nodes(self, search:str):
-        # search all node files for word matches, and order them by most to least
-        search_words = search.lower().split()
-        matches = []
+        removed_links = []
+        def remove_links(linking_id):
+            def update(linking_node):
+                for kind in LINK_TYPES:
+                    links = linking_node.get(kind, [])
+                    removed_links.extend([linking_id, kind, position] for position, link in enumerate(links) if link == id)
+                    linking_node[kind] = [link for link in links if link != id]
+                return linking_node
+            return update
+        if not self.__find_filepath_for_node(id):
+            raise KeyError(id)
+        with self.batch():
+            # remove any links to the deleted node from other nodes, first so they're kept in its tombstone
+            for linking_id in {linking_id for linking_id, _ in self.links.get_linking_nodes(id)} - {id}:
+                try:
+                    self.update_node(linking_id, remove_links(linking_id))
+                except KeyError:
+                    continue
+            with self.__lock_node(id) as filepath:
+                with self.__batch_lock:
+                    self.__removed_links[id] = removed_links
+                self.__write(filepath, 'delete', id, self.get_node(id, blob_refs=True)[id])
+
+    def restore_node(self, id:str) -> dict:
+        """put a deleted node back (with the same id, in the last shard for the month it was created in if there is one),
+        and return it. Links to it which were removed from other nodes when it was deleted are put back (in nodes which still exist)"""
+        def add_link(kind:str, position:int):
+            def update(linking_node):
+                links = linking_node.setdefault(kind, [])
+                if id not in links:
+                    links.insert(position, id)
+                return linking_node
+            return update
+        with self.__tombstone_lock.exclusive():
+            tombstone = self.__load_tombstones().get(id)
+            if not tombstone:
+                raise KeyError(id)
+            record = self.__read_tombstone(tombstone[0], tombstone[1])
+        node = record['node']
+        if self.__find_filepath_for_node(id):
+            raise ValueError(f'a node with id {id} already exists')
+        month_shards = [shard for shard in self.__manifest.shards if self.__get_shard_key(shard)[0] == id[:6]]
+        filepath = path.join(self.storage_dir, month_shards[-1]) if month_shards else self.__get_create_filepath()
+        with self.batch():
+            self.__write(filepath, 'restore', id, node)
+            for linking_id, kind, position in record.get('links', ()):     # tombstones from before links were recorded have none
+                try:
+                    self.update_node(linking_id, add_link(kind, position))
+                except KeyError:
+                    continue
+        return node
+
+    def get_node_versions(self, id:str) -> list[dict]:
+        """get `{'rev', 'time', 'full'}` of every saved version of a node, from oldest to newest (empty if it was never edited)"""
+        return self.history.get_revisions(id) if self.history else []
+
+    def get_node_version(self, id:str, rev:int) -> dict:
+        """get a node as it was at a version (`-1` for the newest, `-2` for the one before it, and so on)"""
+        if not self.history:
+            raise RuntimeError('node history is turned off')
+        return self.history.get_revision(id, rev)
+
+    def purge_node_history(self, max_revisions:int=None) -> int:
+        """permanently remove node versions beyond the newest `max_revisions` of each node (`history_max_revisions` if not given),
+        and every version of nodes which aren't stored or deleted anymore (ex: purged deleted nodes). Returns the number removed"""
+        if not self.history:
+            return 0
+        with self.__tombstone_lock.exclusive():
+            keep_ids = set(self.__load_tombstones())
+        with self.__index_lock:
+            keep_ids.update(self.__node_shards)
+        with self.__batch_lock:
+            keep_ids.update(self.__pending_nodes)
+        return self.history.prune(max_revisions, keep_ids)
+
+    def purge_deleted_nodes(self, max_age:float=None, max_count:int=None) -> int:
+        """permanently remove deleted nodes older than `max_age` days or beyond the newest `max_count`
+        (`deleted_max_age` and `deleted_max_count` if not given), and return the number removed"""
+        with self.__tombstone_lock.exclusive():
+            return self.__purge_tombstones(
+                self.deleted_max_age if max_age is None else max_age,
+                self.deleted_max_count if max_count is None else max_count,
+            )
+
+    def read_content(self, node:dict):
+        """get a node's content, reading it from the blob store if it's stored there"""
+        cont = node.get('cont')
+        return self.blobs.read_text(cont) if is_blob_ref(cont) else cont
+
+    def collect_blobs(self) -> int:
+        """delete every blob which isn't used by any node, held write, or deleted node, and return the number deleted"""
+        with self.__blob_lock.exclusive():
+            used = set()
+            with self.__batch_lock:
+                nodes = [node for _, node in self.__pending_nodes.values()]
+            for node in chain(nodes, (node for _, node in self.iter_nodes()), self.get_deleted_nodes().values()):
+                cont = node.get('cont') if isinstance(node, dict) else None
+                if is_blob_ref(cont):
+                    used.add(cont['blob'])
+            if self.history:
+                used |= self.history.get_blob_digests()
+            unused = [digest for digest in self.blobs.iter_digests() if digest not in used]
+            for digest in unused:
+                self.blobs.remove(digest)
+        return len(unused)
+
+    def search_nodes(self, search:str, limit:int=None) -> list[tuple[float, str, dict]]:
+        """search node names and text content for the search words, and return `(score, id, node)` tuples
+        ordered from most to least relevant. Only the top `limit` matches are returned (all if `None`)"""
+        return [(score, id, self.get_node(id)[id]) for score, id in self.search_index.search(search, limit)]
+
+    def search_node_names(self, name:str, limit:int=10, prefix:bool=True, fuzzy:bool=True) -> list[tuple[float, str, dict]]:
+        """find nodes by their name, and return `(score, id, node)` tuples ordered from best to worst match.
+        Words can have typos if `fuzzy` is `True`, and the last word can be incomplete if `prefix` is `True`
+        (see `node_names.NameIndex.lookup()`)"""
+        return [(score, id, self.get_node(id)[id]) for score, id in self.names.lookup(name, limit, prefix, fuzzy)]
+
+    def __get_related_index(self):
+        if self.related is None:
+            raise RuntimeError('finding related nodes needs NumPy to be installed')
+        return self.related
+
+    def related_nodes(self, id:str, limit:int=10) -> list[tuple[float, str, dict]]:
+        """return `(similarity, id, node)` tuples of the nodes with the most similar text to a node (by TF-IDF cosine similarity),
+        ordered from most to least similar"""
+        matches = self.__get_related_index().similar_to_nodes([id], limit)[id]
+        return [(score, match_id, self.get_node(match_id)[match_id]) for score, match_id in matches]
+
+    def suggest_side_links(self, id:str, limit:int=5, min_score:float=0.2) -> list[tuple[float, str]]:
+        """return `(similarity, id)` tuples of related nodes which aren't linked to or from the node yet,
+        and are at least `min_score` similar, as candidates for new `side` links"""
+        linked = self.links.neighbors(id)
+        matches = self.__get_related_index().similar_to_nodes([id], limit + len(linked))[id]
+        return [(score, match_id) for score, match_id in matches if match_id not in linked and score >= min_score][:limit]
+
+    def iter_search_nodes(self, search:str):
+        """generator version of `search_nodes()`, which yields `(score, id, node)` tuples from most to least relevant.
+        Each node is only read when it's reached"""
+        for score, id in self.search_index.iter_search(search):
+            yield score, id, self.get_node(id)[id]
+
+    def scan_search_nodes(self, search:str, limit:int=None, workers:int=None) -> list[tuple[float, str, dict]]:
+        """search node names and text content by reading every shard, without the search index.
+        Shards are scanned in parallel in a process pool of `workers` processes (default `search_workers`),
+        and each one's top `limit` matches are merged. Returns `(score, id, node)` tuples ordered from most to least relevant"""
+        terms = get_terms(search)
+        filepaths = list(self.__get_all_node_file_paths())
+        if not terms or not filepaths:
+            return []
+        workers = workers or self.search_workers
+        if len(filepaths) == 1 or workers == 1:      # not worth starting processes for
+            partials = [_scan_search_shard(filepath, terms, limit, self.blobs.directory) for filepath in filepaths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                partials = list(executor.map(
+                    _scan_search_shard, filepaths, [terms] * len(filepaths), [limit] * len(filepaths), [self.blobs.directory] * len(filepaths),
+                ))
+        matches = (match for partial in partials for match in partial)
+        if limit is None:
+            return sorted(matches, key=lambda match: match[:2], reverse=True)
+        return heapq.nlargest(limit, matches, key=lambda match: match[:2])
+
+    def iter_nodes(self):
+        """generator which yields `(id, node)` for every stored node.
+        Shard files are streamed, so this uses about the same memory no matter how big they are"""
         for filepath in self.__get_all_node_file_paths():
-            nodes = self.__read_file(filepath)
-            # search each node in each file:
-            for id, content in nodes.items():           # nodes is a dict, and nodes.items() is a tuple (key,value) of each node
-                match_count = 0
-                for line in content:                    # content is a list, each line should be a string
-                    for word in search_words:
-                        n = line.lower().count(word)    # count how many times the word appears in line
-                        match_count += n
-                # if more than 0 words were matched, then append the match count, id, and content to matches
-                if match_count:
-                    matches.append((match_count, id, content))
-        ordered_matches = sorted(matches, reverse=True) # sorted by default selects the first value of the tuples, which is convenient
-        return ordered_matches
+            yield from _iter_shard(filepath)
+
+    def get_compact_nodes(self) -> CompactNodeTable:
+        """read every stored node into a `CompactNodeTable` (see `node_model.py`), a working set of all of the nodes
+        which takes a fraction of the memory of a dict of them"""
+        table = CompactNodeTable()          # with its own id table, so the ids go away with it
+        table.update(self.iter_nodes())
+        return table
+
+    def get_deleted_nodes(self) -> dict:
+        """return `{id: node}` of every deleted node which hasn't been restored or purged"""
+        with self.__tombstone_lock.exclusive():
+            tombstones = self.__load_tombstones()
+            return {
+                record['id']: record['node'] for offset, _, record in _iter_journal(self.__tombstones_filepath)
+                if record['op'] == 'delete' and tombstones.get(record['id'], (None,))[0] == offset
+            }
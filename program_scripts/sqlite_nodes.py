@@ -0,0 +1,203 @@
+"""
+SQLite backend for nodes, with the same public methods as `nodes.ReadWriteNodes`.
+
+Nodes are stored in a single `nodes.db` database (with WAL journaling), with:
+* `supe`/`side`/`sub` links in their own indexed table, so links can be followed in either direction
+* node names and text content in an FTS5 full-text index, which `search_nodes()` queries
+* content which isn't text (ex: a list) stored as JSON, in a BLOB value so it's read back as JSON (its text is still searched)
+
+Run this script directly to migrate the existing `nodes/*.json` shard files into the database (a one time migration):
+`python -m program_scripts.sqlite_nodes`
+"""
+import json
+import sqlite3
+from datetime import datetime
+from os import path
+from threading import Lock
+from .nodes import STORAGE_DIR, ReadWriteNodes
+from .node_blobs import is_blob_ref
+from .node_search import get_terms
+from .node_links import LINK_TYPES
+
+DATABASE_FILEPATH = path.join(STORAGE_DIR, 'nodes.db')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id      TEXT PRIMARY KEY,
+    name    TEXT NOT NULL,
+    type    TEXT NOT NULL,
+    cont    TEXT
+);
+CREATE TABLE IF NOT EXISTS links (
+    id      TEXT NOT NULL REFERENCES nodes(id) ON DELETE CASCADE,
+    kind    TEXT NOT NULL,
+    pos     INTEGER NOT NULL,
+    target  TEXT NOT NULL,
+    PRIMARY KEY (id, kind, pos)
+);
+CREATE INDEX IF NOT EXISTS links_target ON links(target, kind);
+CREATE TABLE IF NOT EXISTS deleted_nodes (
+    id      TEXT PRIMARY KEY,
+    node    TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS nodes_fts USING fts5(name, cont, content='nodes', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS nodes_fts_insert AFTER INSERT ON nodes BEGIN
+    INSERT INTO nodes_fts(rowid, name, cont) VALUES (new.rowid, new.name, new.cont);
+END;
+CREATE TRIGGER IF NOT EXISTS nodes_fts_delete AFTER DELETE ON nodes BEGIN
+    INSERT INTO nodes_fts(nodes_fts, rowid, name, cont) VALUES ('delete', old.rowid, old.name, old.cont);
+END;
+CREATE TRIGGER IF NOT EXISTS nodes_fts_update AFTER UPDATE ON nodes BEGIN
+    INSERT INTO nodes_fts(nodes_fts, rowid, name, cont) VALUES ('delete', old.rowid, old.name, old.cont);
+    INSERT INTO nodes_fts(rowid, name, cont) VALUES (new.rowid, new.name, new.cont);
+END;
+"""
+
+
+class SQLiteNodes:
+    """
+    Read, write, and search nodes stored in an SQLite database.
+    Every write is a single transaction. The connection can be shared between threads (access to it is locked).
+    """
+    def __init__(self, db_filepath:str=DATABASE_FILEPATH):
+        self.time_str_format_1 = '%Y%m%d%H%M%S%f'
+        self._lock = Lock()
+        self._conn = sqlite3.connect(db_filepath, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    #---------
+    # helper methods
+
+    @staticmethod
+    def _encode_cont(cont):
+        return cont if cont is None or isinstance(cont, str) else json.dumps(cont).encode('utf-8')
+
+    @staticmethod
+    def _decode_cont(cont):
+        return json.loads(cont) if isinstance(cont, bytes) else cont
+
+    def _insert_node(self, id:str, node:dict):
+        """insert a node and its links (raises `sqlite3.IntegrityError` if the id is taken). Must be called inside a transaction"""
+        self._conn.execute(
+            'INSERT INTO nodes (id, name, type, cont) VALUES (?, ?, ?, ?)',
+            (id, node.get('name', ''), node.get('type', 'text'), self._encode_cont(node.get('cont')))
+        )
+        self._conn.executemany(
+            'INSERT INTO links (id, kind, pos, target) VALUES (?, ?, ?, ?)',
+            ((id, kind, pos, target) for kind in LINK_TYPES for pos, target in enumerate(node.get(kind, ())))
+        )
+
+    def _replace_node(self, id:str, node:dict):
+        """insert a node and its links, in place of any node with the same id. Must be called inside a transaction"""
+        self._conn.execute('DELETE FROM nodes WHERE id = ?', (id,))        # also deletes the node's links (cascade)
+        self._insert_node(id, node)
+
+    def _read_node(self, id:str) -> dict:
+        row = self._conn.execute('SELECT name, type, cont FROM nodes WHERE id = ?', (id,)).fetchone()
+        if not row:
+            return None
+        node = {'name': row[0], 'type': row[1], 'supe': [], 'side': [], 'sub': [], 'cont': self._decode_cont(row[2])}
+        for kind, target in self._conn.execute('SELECT kind, target FROM links WHERE id = ? ORDER BY kind, pos', (id,)):
+            node[kind].append(target)
+        return node
+
+    #---------
+    # node methods
+
+    def create_node(self, name:str, node_type:str='text', content:str='') -> str:
+        node_data = {'name': name, 'type': node_type, 'supe': [], 'side': [], 'sub': [], 'cont': content}
+        id = datetime.now().strftime(self.time_str_format_1)    # creation time, also serves as id
+        with self._lock:
+            # nodes created within the same microsecond (or by another process) still need unique ids
+            while True:
+                try:
+                    with self._conn:
+                        self._insert_node(id, node_data)
+                    return id
+                except sqlite3.IntegrityError:
+                    id = str(int(id) + 1)
+
+    def get_node(self, id):
+        with self._lock:
+            return {id: self._read_node(id)}
+
+    def edit_node(self, id, content:dict):
+        with self._lock, self._conn:
+            if not self._conn.execute('SELECT 1 FROM nodes WHERE id = ?', (id,)).fetchone():
+                raise KeyError(id)
+            self._replace_node(id, content)
+
+    def delete_node(self, id):
+        with self._lock, self._conn:
+            node = self._read_node(id)
+            if node is None:
+                raise KeyError(id)
+            self._conn.execute('DELETE FROM nodes WHERE id = ?', (id,))
+            self._conn.execute('INSERT OR REPLACE INTO deleted_nodes (id, node) VALUES (?, ?)', (id, json.dumps(node)))
+
+    def search_nodes(self, search:str, limit:int=None) -> list[tuple[float, str, dict]]:
+        """search node names and text content for the search words, and return `(score, id, node)` tuples
+        ordered from most to least relevant. Only the top `limit` matches are returned (all if `None`)"""
+        terms = get_terms(search)
+        if not terms:
+            return []
+        query = ' OR '.join(f'"{term}"' for term in terms)      # quoted, so terms are never read as FTS5 operators
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT nodes.id, -bm25(nodes_fts) FROM nodes_fts JOIN nodes ON nodes.rowid = nodes_fts.rowid '
+                'WHERE nodes_fts MATCH ? ORDER BY bm25(nodes_fts) LIMIT ?',
+                (query, -1 if limit is None else limit)
+            ).fetchall()
+            return [(score, id, self._read_node(id)) for id, score in rows]
+
+    def get_linking_nodes(self, id:str, kind:str=None) -> list[tuple[str, str]]:
+        """return `(node id, link type)` for every node which links to this node (using the links index)"""
+        with self._lock:
+            if kind:
+                rows = self._conn.execute('SELECT id, kind FROM links WHERE target = ? AND kind = ?', (id, kind))
+            else:
+                rows = self._conn.execute('SELECT id, kind FROM links WHERE target = ?', (id,))
+            return rows.fetchall()
+
+    #---------
+    # migration
+
+    def import_nodes(self, nodes, deleted_nodes:dict=None) -> int:
+        """insert `(id, node)` pairs (ex: from `ReadWriteNodes.iter_nodes()`) in a single transaction,
+        and return the number of nodes imported"""
+        count = 0
+        with self._lock, self._conn:
+            for id, node in nodes:
+                self._replace_node(id, node)
+                count += 1
+            for id, node in (deleted_nodes or {}).items():
+                self._conn.execute('INSERT OR REPLACE INTO deleted_nodes (id, node) VALUES (?, ?)', (id, json.dumps(node)))
+        return count
+
+
+def _read_blob_content(json_nodes:ReadWriteNodes, node):
+    """get a node with its content read from the blob store, if it's stored there (the database keeps all content inline)"""
+    if isinstance(node, dict) and is_blob_ref(node.get('cont')):
+        node = dict(node, cont=json_nodes.read_content(node))
+    return node
+
+def migrate_json_nodes(db_filepath:str=DATABASE_FILEPATH) -> int:
+    """copy every node (and deleted node) from the `nodes/*.json` shard files into the database"""
+    json_nodes = ReadWriteNodes()
+    db_nodes = SQLiteNodes(db_filepath)
+    try:
+        nodes = ((id, _read_blob_content(json_nodes, node)) for id, node in json_nodes.iter_nodes())
+        deleted_nodes = {id: _read_blob_content(json_nodes, node) for id, node in json_nodes.get_deleted_nodes().items()}
+        return db_nodes.import_nodes(nodes, deleted_nodes)
+    finally:
+        db_nodes.close()
+
+
+if __name__ == "__main__":
+    print(f'migrated {migrate_json_nodes()} nodes into {DATABASE_FILEPATH}')
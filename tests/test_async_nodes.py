@@ -0,0 +1,35 @@
+import asyncio
+from program_scripts.nodes import ReadWriteNodes
+from program_scripts.async_nodes import AsyncNodes
+
+#-------------------------------
+
+def test_coalesced_reads_get_their_own_copy(tmp_path):
+    async def main():
+        async with AsyncNodes(ReadWriteNodes(storage_dir=str(tmp_path), history=False)) as nodes:
+            id = await nodes.create_node('note', content='original')
+
+            async def change():
+                node = (await nodes.get_node(id))[id]
+                node['cont'] = 'changed'
+                return node
+
+            async def read():
+                await asyncio.sleep(0)
+                return (await nodes.get_node(id))[id]
+
+            async def cancel(task):
+                await asyncio.sleep(0)
+                await asyncio.sleep(0)
+                task.cancel()
+
+            # the first call starts the read, and the others join it (one of them is cancelled while it waits)
+            cancelled = asyncio.ensure_future(read())
+            changed, read_node, _ = await asyncio.gather(change(), read(), cancel(cancelled))
+            assert cancelled.cancelled()
+            return changed, read_node, (await nodes.get_node(id))[id]
+
+    changed, read_node, stored = asyncio.run(main())
+    assert changed['cont'] == 'changed'
+    assert read_node['cont'] == 'original'
+    assert stored['cont'] == 'original'
@@ -0,0 +1,133 @@
+import pytest
+from external_scripts import word_tools
+
+try:
+    from app_components import Command, CommandIndex
+except Exception as error:          # the audio and GUI packages `app_components` imports aren't all installed
+    pytest.skip(f"app_components can't be imported ({error!r})", allow_module_level=True)
+
+#-------------------------------
+# the recursive requirement walk which `Command` used before its requirements were compiled into matchers
+
+def _old_req_value(req_type:str, req_content, items:list):
+    if req_type == 'STR':
+        return req_content if req_content in items else None
+    elif req_type == 'NUMBER':
+        nums = tuple(x for x in items if isinstance(x, (int, float)))
+        return nums[0] if nums else None
+    elif req_type == 'OPEN':
+        return 'OPEN'
+    elif req_type == 'ANY':
+        for sub_req in req_content:
+            sub_val = _old_req_value(sub_req[0], sub_req[1], items)
+            if sub_val:
+                return sub_val
+    elif req_type == 'ALL':
+        sub_vals = tuple(_old_req_value(sub_req[0], sub_req[1], items) for sub_req in req_content)
+        return sub_vals if all(sub_vals) else None
+
+def _old_keyword_req_value(command:Command, user_input:str):
+    keyword_req = command.input[0]
+    return _old_req_value(keyword_req[0], keyword_req[1], word_tools.get_words_only(user_input))
+
+def _old_all_req_values(command:Command, user_input:str) -> list:
+    items = word_tools.get_words_only(user_input)
+    req_values = []
+    for req in command.input:
+        value = _old_req_value(req[0], req[1], items)
+        if value:
+            if req[0] in ('STR', 'NUMBER', 'TIME', 'ANY'):
+                items.remove(value)
+            elif req[0] == 'ALL':
+                for sub_val in value:
+                    items.remove(sub_val)
+            value = req[2] if req[2] else value
+        req_values.append(value)
+    return req_values
+
+#-------------------------------
+
+INPUTS = [
+    '', 'time', 'What time is it?', 'date please', 'shutdown the app', 'Shutdown, application!', 'app app shutdown',
+    'remind me in twenty six minutes', 'remind me in five minutes and two seconds', 'remind me', 'add 2 and three',
+    'add three and three', 'add one hundred and five to 7', 'open my shopping note', 'open the note about shopping',
+    'make a new note', 'new new note note', 'find the recent task', 'find task', 'set a timer for one point five minutes',
+    'timer timer', 'note: buy milk, eggs and bread',
+]
+
+COMMAND_INPUTS = [
+    ('time',),
+    ('date', 'please'),
+    ([('app', 'application', 'program'), 'shutdown'],),
+    ('remind', 'NUMBER', ('minutes', 'seconds', 'hours')),
+    ('add', 'NUMBER', 'NUMBER'),
+    (('open', 'show'), ['note', ('shopping', 'todo', {'list'})]),
+    ([('make', 'create', 'new'), 'note', {'create'}], 'new'),
+    ('find', ('recent', 'latest', 'task'), ('task', 'note')),
+    (('timer', 'alarm'), ('timer', 'NUMBER'), [('minutes', 'seconds'), {'unit'}]),
+    ('note', 'OPEN'),
+]
+
+@pytest.mark.parametrize('command_input', COMMAND_INPUTS, ids=str)
+def test_compiled_matchers_match_the_old_walk(command_input):
+    command = Command('test', command_input, lambda: None)
+    for user_input in INPUTS:
+        assert command.get_keyword_req_value(user_input) == _old_keyword_req_value(command, user_input), user_input
+        assert command.get_all_req_values(user_input) == _old_all_req_values(command, user_input), user_input
+        # tokenized input gives the same values as the text
+        tokens = word_tools.tokenize_input(user_input)
+        assert command.get_all_req_values(tokens) == _old_all_req_values(command, user_input), user_input
+
+
+def test_args_and_output():
+    command = Command('remind', ('remind', 'NUMBER', ('minutes', 'hours')), lambda *args: args,
+                      args=('[1]', '[-1]', '[9]', '[x]', 'text', 3), output='reminding in [1] [2] ([FUNC]), [5] [x] [FUNC]')
+    values = command.get_all_req_values('remind me in twenty minutes')
+    assert values == ['remind', 20, 'minutes']
+    assert command.get_args(values) == (20, 'minutes', '[9]', '[x]', 'text', 3)
+    result = command.func(*command.get_args(values))
+    assert command.get_output(values, 'ok') == 'reminding in 20 minutes (ok), [5] [x] ok'
+    assert command.get_output(values, result) == f'reminding in 20 minutes ({result}), [5] [x] {result}'
+    assert Command('time', ('time',), lambda: '12:00', output='the time is [FUNC]').get_output(['time'], '12:00') == 'the time is 12:00'
+
+
+def test_command_index_finds_the_same_commands_as_a_full_scan():
+    commands = [Command(f'command {i}', command_input, lambda: None) for i, command_input in enumerate(COMMAND_INPUTS)]
+    commands.append(Command('number first', ('NUMBER', 'times'), lambda: None))      # a keyword which isn't any particular word
+    index = CommandIndex(commands)
+    for user_input in INPUTS + ['3 times', 'three times the note']:
+        tokens = word_tools.tokenize_input(user_input)
+        candidates = index.get_candidates(tokens)
+        assert candidates == [command for command in commands if command in candidates]     # in the order they were given
+        assert commands[-1] in candidates
+        keyword_matches = [command for command in commands if command.get_keyword_req_value(tokens)]
+        assert [command for command in candidates if command.get_keyword_req_value(tokens)] == keyword_matches, user_input
+        full_matches = [command for command in commands if all(command.get_all_req_values(tokens))]
+        assert [command for command in candidates if all(command.get_all_req_values(tokens))] == full_matches, user_input
+
+
+def test_command_index_skips_commands_without_their_keywords():
+    time, date, shutdown = (Command(name, command_input, lambda: None) for name, command_input in (
+        ('time', ('time',)), ('date', ('date',)), ('shutdown', ([('app', 'application'), 'shutdown'],))))
+    index = CommandIndex([time, date, shutdown])
+    assert index.get_candidates(word_tools.tokenize_input('what time is it')) == [time]
+    assert index.get_candidates(word_tools.tokenize_input('the date and time')) == [time, date]
+    # every word of an ALL requirement is needed, so only one of them has to be indexed
+    assert index.get_candidates(word_tools.tokenize_input('shutdown the application')) == [shutdown]
+    assert index.get_candidates(word_tools.tokenize_input('open the app')) == []
+    assert index.get_candidates(word_tools.tokenize_input('')) == []
+
+
+def test_multi_word_requirements():
+    shutdown = Command('shutdown', (('shutdown', 'shut down', 'good bye'), ('app', 'application')), lambda: None)
+    assert shutdown.get_all_req_values('please shut down the app') == ['shut down', 'app']
+    assert shutdown.get_all_req_values('good bye application') == ['good bye', 'application']
+    assert shutdown.get_all_req_values('shut the app down') == [None, 'app']
+    # the words of a matched phrase can't meet another requirement
+    twice = Command('twice', ('shut down', ['shut', 'down']), lambda: None)
+    assert twice.get_all_req_values('shut down') == ['shut down', None]
+    assert twice.get_all_req_values('shut down shut down') == ['shut down', ('shut', 'down')]
+    # a phrase's first word indexes the command
+    index = CommandIndex([shutdown])
+    assert index.get_candidates(word_tools.tokenize_input('good bye')) == [shutdown]
+    assert index.get_candidates(word_tools.tokenize_input('bye')) == []
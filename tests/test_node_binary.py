@@ -0,0 +1,62 @@
+import json
+import os
+import pytest
+from program_scripts import node_binary
+from program_scripts.nodes import ReadWriteNodes
+
+#-------------------------------
+
+NODES = [
+    ('20240105120000000001', {'name': 'first', 'type': 'text', 'supe': [], 'side': ['20240105120000000002'], 'sub': [], 'cont': 'hello'}),
+    ('20240105120000000002', {'name': 'ünïcode', 'type': 'text', 'supe': [], 'side': ['20240105120000000001'], 'sub': [], 'cont': ['a', 'list']}),
+    # not a standard node (different fields, in a different order), so it's stored as JSON
+    ('20240105120000000003', {'type': 'task', 'name': 'other', 'done': True}),
+    ('20240105120000000004', None),
+]
+
+
+def test_binary_shard_round_trip(tmp_path):
+    filepath = str(tmp_path / '202401_nodes.bin')
+    entries = node_binary.write_binary_shard(filepath, iter(NODES))
+    read = [(id, node) for id, _, _, node in node_binary.iter_binary_shard(filepath, read_nodes=True)]
+    assert read == NODES
+    assert [list(node) for _, node in read[:3]] == [list(node) for _, node in NODES[:3]]     # field order is kept
+    strings = node_binary.read_string_table(filepath)
+    for id, node in NODES:
+        assert node_binary.read_binary_node(filepath, *entries[id], strings) == node
+    assert [id for id, _, _, node in node_binary.iter_binary_shard(filepath)] == [id for id, _ in NODES]
+
+
+def test_newer_format_version_is_refused(tmp_path):
+    filepath = str(tmp_path / '202401_nodes.bin')
+    node_binary.write_binary_shard(filepath, iter(NODES))
+    with open(filepath, 'r+b') as file:
+        file.seek(4)
+        file.write((node_binary.FORMAT_VERSION + 1).to_bytes(2, 'little'))
+    with pytest.raises(ValueError):
+        list(node_binary.iter_binary_shard(filepath))
+
+
+def test_convert_shards_is_lossless(tmp_path):
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    with nodes.batch():
+        ids = [nodes.create_node(f'note {i}', content=f'content {i}') for i in range(20)]
+    nodes.edit_node(ids[0], dict(nodes.get_node(ids[0])[ids[0]], sub=ids[1:3], extra={'kept': 1}))
+    nodes.delete_node(ids[5])
+    before = dict(nodes.iter_nodes())
+    json_files = sorted(file for file in os.listdir(tmp_path) if file.endswith('_nodes.json'))
+    with open(tmp_path / json_files[0], 'r', encoding='utf-8') as file:
+        json_before = json.load(file)
+
+    assert nodes.convert_shards('binary') == len(json_files)
+    assert not any(file.endswith('_nodes.json') for file in os.listdir(tmp_path))
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    assert dict(nodes.iter_nodes()) == before
+    assert [id for _, id, _ in nodes.search_nodes('content 7')][:1] == [ids[7]]
+    new_id = nodes.create_node('after converting')      # binary shard files can still be written to
+
+    assert nodes.convert_shards('json') == len(json_files)
+    with open(tmp_path / json_files[0], 'r', encoding='utf-8') as file:
+        json_after = json.load(file)
+    json_after.pop(new_id, None)
+    assert json_after == json_before and list(json_after) == list(json_before)
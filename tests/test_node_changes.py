@@ -0,0 +1,59 @@
+import pytest
+from program_scripts.node_changes import ChangeFeed
+from program_scripts.nodes import ReadWriteNodes
+
+#-------------------------------
+
+def test_partly_written_last_line_is_skipped(tmp_path):
+    filepath = str(tmp_path / 'changes.journal')
+    ChangeFeed(filepath).append([('create', 'a', 'shard')])
+    with open(filepath, 'ab') as file:
+        file.write(b'{"seq": 2, "op": "ed')         # an append which was interrupted
+    feed = ChangeFeed(filepath)
+    assert feed.last_seq == 1
+    assert [event['id'] for event in feed.iter_changes(0)] == ['a']
+    feed.append([('edit', 'a', 'shard'), ('create', 'b', 'shard')])
+    assert [(event['seq'], event['id']) for event in ChangeFeed(filepath).iter_changes(0)] == [(1, 'a'), (2, 'a'), (3, 'b')]
+    assert [event['seq'] for event in feed.iter_changes(2)] == [3]
+
+
+def test_resuming_from_a_saved_seq(tmp_path):
+    feed = ChangeFeed(str(tmp_path / 'changes.journal'), max_events=None)
+    feed.append([('create', str(i), 'shard') for i in range(10)])
+    assert [event['seq'] for event in feed.iter_changes()] == list(range(1, 11))
+    assert [event['seq'] for event in feed.iter_changes(4, limit=3)] == [5, 6, 7]
+    assert feed.get_changes(10) == []
+    # a reader which saved its seq picks up from there after a restart
+    feed = ChangeFeed(str(tmp_path / 'changes.journal'), max_events=None)
+    feed.append([('delete', '3', 'shard')])
+    assert [(event['seq'], event['op'], event['id']) for event in feed.iter_changes(9)] == [(10, 'create', '9'), (11, 'delete', '3')]
+
+
+def test_trimmed_changes_are_refused(tmp_path):
+    feed = ChangeFeed(str(tmp_path / 'changes.journal'), max_events=4)
+    for i in range(7):
+        feed.append([('edit', str(i), 'shard')])
+    # only trimmed once there are half again as many events as are kept
+    assert [event['seq'] for event in feed.iter_changes(3)] == [4, 5, 6, 7]
+    for since in (0, 2):
+        with pytest.raises(ValueError):
+            feed.get_changes(since)
+    assert ChangeFeed(str(tmp_path / 'changes.journal'), max_events=4).last_seq == 7
+
+
+def test_subscribers_get_every_write(tmp_path):
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    events = []
+    nodes.changes.subscribe(events.append)
+    nodes.changes.subscribe(lambda event: 1 / 0)        # a failing subscriber doesn't fail the write
+    id = nodes.create_node('note')
+    nodes.edit_node(id, dict(nodes.get_node(id)[id], cont='edited'))
+    nodes.delete_node(id)
+    nodes.restore_node(id)
+    assert [(event['op'], event['id']) for event in events] == [('create', id), ('edit', id), ('delete', id), ('restore', id)]
+    assert [event['seq'] for event in events] == [1, 2, 3, 4]
+    assert nodes.changes.get_changes(2) == events[2:]
+    nodes.changes.unsubscribe(events.append)
+    nodes.create_node('other note')
+    assert len(events) == 4
+    assert nodes.changes.wait_for_changes(4, timeout=0)
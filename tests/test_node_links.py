@@ -0,0 +1,70 @@
+from program_scripts.node_links import LinkIndex
+from program_scripts.nodes import ReadWriteNodes
+
+#-------------------------------
+
+def _node(supe=(), side=(), sub=()) -> dict:
+    return {'name': '', 'type': 'text', 'supe': list(supe), 'side': list(side), 'sub': list(sub), 'cont': ''}
+
+def _tree_index(filepath:str) -> LinkIndex:
+    """a - b - d, a - c (`sub` links), c ~ e (a `side` link), and f with no links"""
+    links = LinkIndex(filepath)
+    links.add_node('a', _node(sub=['b', 'c']), 'shard')
+    links.add_node('b', _node(supe=['a'], sub=['d']), 'shard')
+    links.add_node('c', _node(side=['e']), 'shard')     # only `a` has the link between them
+    links.add_node('d', _node(), 'shard')
+    links.add_node('e', _node(), 'shard')
+    links.add_node('f', _node(), 'shard')
+    return links
+
+
+def test_links_are_followed_both_ways(tmp_path):
+    links = _tree_index(str(tmp_path / 'links.json'))
+    assert links.neighbors('a') == {'b', 'c'}
+    assert links.neighbors('d', 'supe') == {'b'}
+    assert links.neighbors('e') == {'c'}
+    assert links.get_linking_nodes('c') == [('a', 'sub')]
+    assert links.ancestors('d') == [('b', 1), ('a', 2)]
+    assert links.descendants('a') == [('b', 1), ('c', 1), ('d', 2)]
+    assert links.descendants('a', depth=1) == [('b', 1), ('c', 1)]
+    assert links.orphans() == ['f']
+
+
+def test_traversal_order(tmp_path):
+    links = _tree_index(str(tmp_path / 'links.json'))
+    assert links.traverse('a') == [('b', 1), ('c', 1), ('d', 2), ('e', 2)]
+    assert links.traverse('a', depth_first=True) == [('b', 1), ('d', 2), ('c', 1), ('e', 2)]
+    assert links.traverse('a', kind='side') == []
+    assert links.traverse('e', kind='side') == [('c', 1)]
+
+
+def test_removed_links_and_saved_index(tmp_path):
+    filepath = str(tmp_path / 'links.json')
+    links = _tree_index(filepath)
+    links.add_node('a', _node(sub=['c']), 'shard')      # `b` is still linked to `a` by its own `supe` link
+    assert links.descendants('a') == [('b', 1), ('c', 1), ('d', 2)]
+    links.remove_node('b')
+    assert links.descendants('a') == [('c', 1)]
+    assert links.ancestors('d') == []
+    links.save({'shard': [1, 2]})
+    loaded = LinkIndex(filepath)
+    assert loaded.load() == {'shard': [1, 2]}
+    assert loaded.traverse('a') == links.traverse('a')
+    assert sorted(loaded.orphans()) == ['d', 'f']
+
+
+def test_node_store_keeps_links_up_to_date(tmp_path):
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    parent, child, other = (nodes.create_node(name) for name in ('parent', 'child', 'other'))
+    nodes.edit_node(parent, dict(nodes.get_node(parent)[parent], sub=[child]))
+    nodes.edit_node(child, dict(nodes.get_node(child)[child], side=[other]))
+    assert nodes.links.ancestors(child) == [(parent, 1)]
+    assert nodes.links.traverse(parent) == [(child, 1), (other, 2)]
+    nodes.delete_node(child)
+    assert nodes.links.traverse(parent) == []
+    assert sorted(nodes.links.orphans()) == sorted([parent, other])
+    nodes.restore_node(child)
+    nodes.save_index()
+    # reopened, so the links are loaded from the saved index
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    assert nodes.links.traverse(parent) == [(child, 1), (other, 2)]
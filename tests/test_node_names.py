@@ -0,0 +1,67 @@
+from program_scripts.node_names import NameIndex, edit_distance
+from program_scripts.nodes import ReadWriteNodes
+
+#-------------------------------
+
+NAMES = {
+    'a': 'shopping list',
+    'b': 'meeting notes about the budget',
+    'c': 'budget',
+    'd': 'birthday ideas',
+    'e': 'shop opening hours',
+}
+
+def _name_index(filepath:str) -> NameIndex:
+    names = NameIndex(filepath)
+    for id, name in NAMES.items():
+        names.add_node(id, {'name': name}, 'shard')
+    return names
+
+
+def test_edit_distance():
+    assert edit_distance('budget', 'budget', 2) == 0
+    assert edit_distance('budget', 'budgte', 2) == 2
+    assert edit_distance('budget', 'bugdet', 1) == 2       # stops once it's over the limit
+    assert edit_distance('note', 'notes', 1) == 1
+
+
+def test_exact_prefix_and_fuzzy_lookup(tmp_path):
+    names = _name_index(str(tmp_path / 'names.json'))
+    # exact matches come first, and shorter names first for the same score
+    assert [id for _, id in names.lookup('budget')] == ['c', 'b']
+    # the last word can be incomplete
+    assert [id for _, id in names.lookup('shop')] == ['e', 'a']
+    assert [id for _, id in names.lookup('birth')] == ['d']
+    assert names.lookup('birth', prefix=False) == []
+    # misheard words
+    assert [id for _, id in names.lookup('meating nots')] == ['b']
+    assert [id for _, id in names.lookup('birthdy')] == ['d']
+    assert names.lookup('birthdy', prefix=False, fuzzy=False) == []
+    # names with more of the words come first
+    assert [id for _, id in names.lookup('budget meeting')] == ['b', 'c']
+    assert [id for _, id in names.lookup('budget', limit=1)] == ['c']
+
+
+def test_updated_names_and_saved_index(tmp_path):
+    filepath = str(tmp_path / 'names.json')
+    names = _name_index(filepath)
+    names.add_node('c', {'name': 'holiday plans'}, 'shard')
+    names.remove_node('d')
+    assert [id for _, id in names.lookup('budget')] == ['b']
+    assert names.lookup('birthday') == []
+    names.save({'shard': [1, 2]})
+    loaded = NameIndex(filepath)
+    assert loaded.load() == {'shard': [1, 2]}
+    for text in ('budget', 'holi', 'shop', 'meating'):
+        assert loaded.lookup(text) == names.lookup(text)
+
+
+def test_search_node_names(tmp_path):
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    ids = {name: nodes.create_node(name) for name in NAMES.values()}
+    assert [(id, node['name']) for _, id, node in nodes.search_node_names('birthdey')] == [(ids['birthday ideas'], 'birthday ideas')]
+    nodes.edit_node(ids['budget'], dict(nodes.get_node(ids['budget'])[ids['budget']], name='yearly expenses'))
+    nodes.delete_node(ids['birthday ideas'])
+    assert [id for _, id, _ in nodes.search_node_names('budget')] == [ids['meeting notes about the budget']]
+    assert [id for _, id, _ in nodes.search_node_names('year')] == [ids['budget']]
+    assert nodes.search_node_names('birthday') == []
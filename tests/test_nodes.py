@@ -0,0 +1,178 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+import pytest
+from program_scripts.nodes import ReadWriteNodes
+from program_scripts.node_sharding import CountShardPolicy, MonthShardPolicy
+from program_scripts import node_history
+
+WORDS = 'alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu'.split()
+
+#-------------------------------
+
+def _text(i:int) -> str:
+    return ' '.join(WORDS[(i * 7 + j) % len(WORDS)] for j in range(8))
+
+def _increment(storage_dir:str, id:str, times:int):
+    nodes = ReadWriteNodes(journal=True, storage_dir=storage_dir, history=False)
+    for _ in range(times):
+        nodes.update_node(id, lambda node: dict(node, cont=str(int(node['cont']) + 1)))
+
+class _FixedDatetime(datetime):
+    """a `datetime` whose `now()` never changes, so every node is created in the same microsecond"""
+    @classmethod
+    def now(cls, tz=None):
+        return datetime(2024, 1, 5, 12, 0, 0, 0)
+
+def _create_nodes(storage_dir:str, name:str, count:int) -> list[str]:
+    from program_scripts import nodes as nodes_module
+    nodes_module.datetime = _FixedDatetime
+    nodes = ReadWriteNodes(journal=True, storage_dir=storage_dir, history=False)
+    return [nodes.create_node(f'{name} {i}') for i in range(count)]
+
+
+def test_held_writes(tmp_path, monkeypatch):
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    with nodes.batch():
+        id = nodes.create_node('note', content='held')
+        nodes.get_node(id)[id]['cont'] = 'changed without edit_node()'
+        assert nodes.get_node(id)[id]['cont'] == 'held'
+    assert nodes.get_node(id)[id]['cont'] == 'held'
+    # records which fail to be written stay held, and are written by the next flush
+    append = nodes.changes.append
+    def fail(changes, sync=False):
+        raise OSError('disk full')
+    monkeypatch.setattr(nodes.changes, 'append', fail)
+    with pytest.raises(OSError):
+        with nodes.batch():
+            other_id = nodes.create_node('other note', content='second')
+            nodes.edit_node(id, dict(nodes.get_node(id)[id], cont='edited'))
+    assert nodes.get_node(other_id)[other_id]['cont'] == 'second'
+    monkeypatch.setattr(nodes.changes, 'append', append)
+    assert nodes.flush()['records'] == 2
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    assert {id: node['cont'] for id, node in nodes.iter_nodes()} == {id: 'edited', other_id: 'second'}
+    # the last group commit is written by close()
+    nodes.group_commit = 60
+    last_id = nodes.create_node('last note')
+    nodes.close()
+    assert ReadWriteNodes(storage_dir=str(tmp_path), history=False).get_node(last_id)[last_id]['name'] == 'last note'
+
+
+
+@pytest.mark.parametrize('journal', [False, True])
+def test_reopen_after_save_index_with_many_nodes(tmp_path, journal):
+    nodes = ReadWriteNodes(journal=journal, storage_dir=str(tmp_path), history=False)
+    with nodes.batch():
+        ids = [nodes.create_node(f'note {i}', content=_text(i)) for i in range(1500)]
+    nodes.save_index()
+    # more nodes than the related index's initial capacity, so later rows are past it
+    nodes = ReadWriteNodes(journal=journal, storage_dir=str(tmp_path), history=False)
+    nodes.create_node('new note', content='alpha beta')
+    nodes.edit_node(ids[1400], dict(nodes.get_node(ids[1400])[ids[1400]], cont='gamma'))
+    nodes.delete_node(ids[1450])
+    nodes = ReadWriteNodes(journal=journal, storage_dir=str(tmp_path), history=False)
+    assert nodes.get_node(ids[1400])[ids[1400]]['cont'] == 'gamma'
+    assert nodes.get_node(ids[1450])[ids[1450]] is None
+    assert ids[1450] in nodes.get_deleted_nodes()
+    assert len(list(nodes.iter_nodes())) == 1500
+    if nodes.related is not None:
+        assert nodes.related_nodes(ids[3], 3)
+
+
+
+def test_delete_restore_round_trip(tmp_path):
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    a = nodes.create_node('a', content='first')
+    b = nodes.create_node('b', content='second')
+    nodes.edit_node(a, dict(nodes.get_node(a)[a], side=[b], sub=[b]))
+    node = nodes.get_node(b)[b]
+    nodes.delete_node(b)
+    assert nodes.get_node(b)[b] is None
+    assert nodes.get_node(a)[a]['side'] == [] and nodes.get_node(a)[a]['sub'] == []
+    assert nodes.get_deleted_nodes() == {b: node}
+    assert nodes.search_nodes('second') == []
+    # reopened, so the tombstone is read from the journal
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history=False)
+    assert nodes.restore_node(b) == node
+    assert nodes.get_node(b)[b] == node
+    assert nodes.get_node(a)[a]['side'] == [b] and nodes.get_node(a)[a]['sub'] == [b]
+    assert nodes.get_deleted_nodes() == {}
+    assert [id for _, id, _ in nodes.search_nodes('second')] == [b]
+    with pytest.raises(KeyError):
+        nodes.restore_node(b)
+
+
+
+def test_blob_content_is_searched_and_read(tmp_path):
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), blob_threshold=1024, history=False)
+    text = 'platypus ' + 'filler ' * 1000
+    id = nodes.create_node('large note', content=text)
+    assert nodes.get_node(id)[id]['cont'] == text
+    ref = nodes.get_node(id, blob_refs=True)[id]['cont']
+    assert ref['size'] == len(text) and nodes.read_content({'cont': ref}) == text
+    assert [match[1] for match in nodes.search_nodes('platypus')] == [id]
+    assert [(match[1], match[2]['cont']) for match in nodes.scan_search_nodes('platypus')] == [(id, text)]
+    # a deleted node keeps its blob until it's purged
+    nodes.delete_node(id)
+    assert nodes.collect_blobs() == 0
+    nodes.purge_deleted_nodes(max_count=0)
+    assert nodes.collect_blobs() == 1
+
+
+
+def test_rebalance_removes_dropped_shards(tmp_path):
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), shard_policy=CountShardPolicy(3), history=False)
+    ids = [nodes.create_node(f'note {i}', content=_text(i)) for i in range(10)]
+    assert nodes.rebalance_shards(MonthShardPolicy()) == 1
+    shard_files = [file for file in os.listdir(tmp_path) if file.endswith(('_nodes.json', '_nodes.lock'))]
+    assert len(shard_files) == 2
+    assert sorted(id for id, _ in nodes.iter_nodes()) == sorted(ids)
+
+
+
+def test_history_keeps_newest_revisions(tmp_path, monkeypatch):
+    monkeypatch.setattr(node_history, '_MIN_PRUNE_REVISIONS', 8)
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history_max_revisions=4, history_checkpoint_interval=3)
+    id = nodes.create_node('note', content='version 0')
+    for i in range(1, 30):
+        nodes.edit_node(id, dict(nodes.get_node(id)[id], cont=f'version {i}'))
+    assert nodes.purge_node_history() > 0
+    assert len(nodes.get_node_versions(id)) == 4
+    assert [nodes.get_node_version(id, rev)['cont'] for rev in range(1, 5)] == [f'version {i}' for i in range(26, 30)]
+    nodes = ReadWriteNodes(storage_dir=str(tmp_path), history_max_revisions=4)
+    assert nodes.get_node_version(id, 1)['cont'] == 'version 26'
+
+
+
+def test_concurrent_journal_writes_from_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr('program_scripts.nodes.datetime', _FixedDatetime)
+    nodes = ReadWriteNodes(journal=True, compact_threshold=50, storage_dir=str(tmp_path), history=False)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ids = list(executor.map(lambda i: nodes.create_node(f'note {i}', content=_text(i)), range(400)))
+    assert len(set(ids)) == 400
+    nodes.compact()
+    nodes = ReadWriteNodes(journal=True, storage_dir=str(tmp_path), history=False)
+    assert {id: node['name'] for id, node in nodes.iter_nodes()} == {id: f'note {i}' for i, id in enumerate(ids)}
+
+
+
+def test_concurrent_journal_updates_from_processes(tmp_path):
+    nodes = ReadWriteNodes(journal=True, storage_dir=str(tmp_path), history=False)
+    id = nodes.create_node('counter', content='0')
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(_increment, [str(tmp_path)] * 4, [id] * 4, [25] * 4))
+    nodes.refresh()
+    assert nodes.get_node(id)[id]['cont'] == '100'
+
+
+
+def test_concurrent_creates_from_processes(tmp_path):
+    ReadWriteNodes(journal=True, storage_dir=str(tmp_path), history=False)
+    names = [f'process {i}' for i in range(4)]
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        ids = list(executor.map(_create_nodes, [str(tmp_path)] * 4, names, [50] * 4))
+    nodes = ReadWriteNodes(journal=True, storage_dir=str(tmp_path), history=False)
+    stored = {id: node['name'] for id, node in nodes.iter_nodes()}
+    assert len(stored) == 200
+    assert stored == {id: f'{name} {i}' for name, process_ids in zip(names, ids) for i, id in enumerate(process_ids)}
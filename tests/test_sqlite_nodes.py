@@ -0,0 +1,28 @@
+from datetime import datetime
+from program_scripts.sqlite_nodes import SQLiteNodes
+
+#-------------------------------
+
+def test_create_node_never_overwrites(tmp_path, monkeypatch):
+    nodes = SQLiteNodes(str(tmp_path / 'nodes.db'))
+
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2024, 1, 5, 12, 0, 0, 0)
+
+    monkeypatch.setattr('program_scripts.sqlite_nodes.datetime', FixedDatetime)
+    ids = [nodes.create_node(f'note {i}') for i in range(3)]
+    assert len(set(ids)) == 3
+    assert [nodes.get_node(id)[id]['name'] for id in ids] == ['note 0', 'note 1', 'note 2']
+    nodes.close()
+
+
+def test_content_which_isnt_text(tmp_path):
+    nodes = SQLiteNodes(str(tmp_path / 'nodes.db'))
+    id = nodes.create_node('list', content=['hello', 'world'])
+    assert nodes.get_node(id)[id]['cont'] == ['hello', 'world']
+    assert [match[1] for match in nodes.search_nodes('hello')] == [id]
+    nodes.edit_node(id, dict(nodes.get_node(id)[id], cont={'count': 1}))
+    assert nodes.get_node(id)[id]['cont'] == {'count': 1}
+    nodes.close()
@@ -0,0 +1,86 @@
+import random
+from external_scripts import word_tools
+from external_scripts.word_tools import PhraseMatcher, TokenizedInput, tokenize_input
+
+#-------------------------------
+
+def _find_phrases_slowly(phrase_map:dict, words:list) -> list[tuple[int, int, str]]:
+    """every phrase found by comparing it at every position, in the order `PhraseMatcher.find()` gives them"""
+    matches = []
+    for key, phrases in phrase_map.items():
+        for phrase in set(phrases):
+            phrase_words = phrase.split()
+            for start in range(len(words) - len(phrase_words) + 1):
+                if words[start:start + len(phrase_words)] == phrase_words:
+                    matches.append((start, start + len(phrase_words), key))
+    return sorted(matches, key=lambda match: (match[1], -match[0]))
+
+
+def test_tokenized_input():
+    tokens = TokenizedInput.from_text('Remind me, in twenty six minutes and two seconds... me!')
+    assert tokens.items == ('remind', 'me', 'in', 26, 'minutes', 'and', 2, 'seconds', 'me')
+    assert tokens.items == tuple(word_tools.get_words_only('Remind me, in twenty six minutes and two seconds... me!'))
+    assert tokens.positions['me'] == [1, 8]
+    assert tokens.positions[2.0] == [6]                 # equal numbers share an entry
+    assert tokens.number_positions == [3, 6]
+    assert TokenizedInput.from_text('').items == ()
+
+
+def test_tokenize_input_is_shared():
+    tokenize_input.cache_clear()
+    tokens = tokenize_input('what time is it')
+    assert tokenize_input('what time is it') is tokens
+    assert tokenize_input('what date is it') is not tokens
+    assert tokenize_input.cache_info().hits == 1
+    # only the most recent messages are kept
+    for i in range(word_tools.TOKENIZE_CACHE_SIZE):
+        tokenize_input(f'message {i}')
+    assert tokenize_input('what time is it') is not tokens
+    assert tokenize_input.cache_info().currsize == word_tools.TOKENIZE_CACHE_SIZE
+
+
+
+def test_phrases_are_found_once_per_matcher():
+    matcher = PhraseMatcher({'greeting': ('good morning',)})
+    tokens = TokenizedInput.from_text('good morning computer')
+    matches = tokens.find_phrases(matcher)
+    assert matches == [(0, 2, 'greeting')]
+    assert tokens.find_phrases(matcher) is matches
+    assert tokens.find_phrases(PhraseMatcher({'greeting': ('morning',)})) == [(1, 2, 'greeting')]
+
+
+def test_phrase_matcher():
+    matcher = PhraseMatcher({'what': ('what', 'what is'), 'shutdown': ('shut down', 'good bye'), 'abc': ('a b c',), 'bcd': ('b c d',), 'c': ('c',)})
+    assert matcher.find('what is the time'.split()) == [(0, 1, 'what'), (0, 2, 'what')]
+    assert matcher.find('please shut down'.split()) == [(1, 3, 'shutdown')]
+    assert matcher.find('shut the door and go down'.split()) == []
+    # phrases which overlap, or end inside another phrase
+    assert matcher.find('a b c d'.split()) == [(0, 3, 'abc'), (2, 3, 'c'), (1, 4, 'bcd')]
+    assert matcher.find('a b b c d'.split()) == [(3, 4, 'c'), (2, 5, 'bcd')]
+    assert matcher.find_keys('good good bye'.split()) == {'shutdown'}
+    assert matcher.find([]) == []
+    assert PhraseMatcher({'empty': ('', ' ')}).find(['']) == []
+
+
+def test_phrase_matcher_finds_the_same_as_a_slow_search():
+    rng = random.Random(0)
+    vocab = 'a b c d e'.split()
+    for _ in range(300):
+        phrase_map = {
+            f'key {i}': tuple(' '.join(rng.choices(vocab, k=rng.randint(1, 4))) for _ in range(rng.randint(1, 3)))
+            for i in range(rng.randint(1, 6))
+        }
+        matcher = PhraseMatcher(phrase_map)
+        for _ in range(5):
+            words = rng.choices(vocab, k=rng.randint(0, 12))
+            assert sorted(matcher.find(words)) == sorted(_find_phrases_slowly(phrase_map, words)), (phrase_map, words)
+
+
+def test_match_keywords():
+    assert word_tools.match_keywords(('shutdown', 'app'), 'Please shut down the application!')
+    assert word_tools.match_keywords(('what', 'time'), "What's the time?")
+    assert word_tools.match_keywords(('shutdown',), 'good bye computer')
+    assert not word_tools.match_keywords(('shutdown', 'app'), 'shut down')
+    # only whole words match, so 'app' isn't in 'happy', and 'note' isn't in 'notebook'
+    assert not word_tools.match_keywords(('app',), 'a happy day')
+    assert not word_tools.match_keywords(('note',), 'my notebook')